@@ -0,0 +1,216 @@
+"""Stampede Resizer — headless command line entry point for cron jobs and build servers.
+
+Never imports PySide6, and only imports the handler the chosen command needs, so a run
+starts in a fraction of a second:
+
+    stampede circles --workers 8 --input DIR --output DIR
+    stampede rectangles --input DIR
+    stampede avatars --prompt "..."
+    stampede avatar-edit --prompt "..."
+    stampede avatar-edit --batch --prompt "..." --concurrency 20
+    stampede watch --workers 8 --input DIR
+
+Exits with 0 when every input was processed, 1 when some were left behind and 2 on a
+configuration or usage error. watch runs until interrupted with Ctrl+C.
+"""
+
+import argparse
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+
+from handling.exception.configuration_error import ConfigurationError
+from settings.logging_config import setup_logging
+from settings.static_dicts import IMAGE_DIR, VALID_FORMATS, WATCH_DEFAULT_ROUTE, WATCH_FILENAME_RULES, WATCH_ROUTES
+
+logger = logging.getLogger(__name__)
+
+# Command name to (module, class), imported on demand so e.g. circles never loads the OpenAI client
+HANDLERS = {
+    "circles": ("handling.imagehandler.circle_handler", "CircleHandler"),
+    "rectangles": ("handling.imagehandler.rectangle_handler", "RectangleHandler"),
+    "avatars": ("handling.avatar_handler", "AvatarHandler"),
+    "avatar-edit": ("handling.avatar_edit_handler", "AvatarEditHandler"),
+}
+
+EXECUTOR_BACKENDS = ("serial", "thread", "process", "pipeline")
+WATCHABLE = ("circles", "rectangles")  # handlers that process one file at a time
+
+
+def _size(value: str) -> tuple[int, int]:
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {value}") from None
+    return width, height
+
+
+def _directory(value: str) -> str:
+    if not os.path.isdir(value):
+        raise argparse.ArgumentTypeError(f"not a directory: {value}")
+    return value
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Argument parser for every command.
+
+    :returns: The parser.
+    :rtype: argparse.ArgumentParser
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--input", type=_directory, default=IMAGE_DIR, help="folder of images to process (default: img)"
+    )
+    common.add_argument("--output", help="folder to save outputs to (default: the handler's folder in img/Processed)")
+    common.add_argument("--quiet", action="store_true", help="only log warnings and errors")
+
+    batch = argparse.ArgumentParser(add_help=False)
+    batch.add_argument("--workers", type=int, help="worker count (default: one per core)")
+    batch.add_argument("--backend", choices=EXECUTOR_BACKENDS, help="executor backend (default: EXECUTOR_BACKEND)")
+    batch.add_argument(
+        "--shared", action="store_true", help="claim files with lease files so several machines can share the input"
+    )
+
+    parser = argparse.ArgumentParser(prog="stampede", description="Process a folder of stamp images without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    circles = commands.add_parser("circles", parents=[common, batch], help="circular stamps with transparent masks")
+    circles.add_argument("--size", type=_size, help="standard output size, e.g. 200x200")
+    commands.add_parser("rectangles", parents=[common, batch], help="rectangular stamps sorted into colour folders")
+    avatars = commands.add_parser("avatars", parents=[common], help="generate an avatar for every image")
+    avatars.add_argument("--prompt", help="generation prompt (default: the built-in avatar prompt)")
+    avatars.add_argument(
+        "--concurrency", type=int, help="generations kept in flight at once (default: AVATAR_MAX_CONCURRENCY)"
+    )
+    avatars.add_argument("--force-regenerate", action="store_true", help="ignore avatars in the avatar cache")
+    avatar_edit = commands.add_parser("avatar-edit", parents=[common], help="edit the image in the input folder")
+    avatar_edit.add_argument("--prompt", required=True, help="editing instruction")
+    avatar_edit.add_argument(
+        "--batch",
+        action="store_true",
+        help="edit every image concurrently, using <image>.txt as its prompt if present",
+    )
+    avatar_edit.add_argument(
+        "--concurrency", type=int, help="edits kept in flight at once with --batch (default: AVATAR_MAX_CONCURRENCY)"
+    )
+    avatar_edit.add_argument("--force-regenerate", action="store_true", help="ignore edits in the avatar cache")
+    watch = commands.add_parser(
+        "watch", parents=[common, batch], help="process stamps continuously as they're dropped into subfolders"
+    )
+    watch.add_argument("--polling", action="store_true", help="poll instead of using inotify, e.g. on network shares")
+    return parser
+
+
+def create_handler(args: argparse.Namespace, command: str | None = None, input_dir: str | None = None):
+    """Import and configure the handler for the parsed command.
+
+    :param args: Parsed command line arguments.
+    :type args: argparse.Namespace
+    :param command: Handler to create instead of the command's own, e.g. for a watch route.
+    :type command: str or None
+    :param input_dir: Folder to take images from instead of --input.
+    :type input_dir: str or None
+    :returns: The configured handler.
+    :raises ConfigurationError: If the handler can't be set up, e.g. no OpenAI key for avatars.
+    """
+    module_name, class_name = HANDLERS[command or args.command]
+    handler_class = getattr(importlib.import_module(module_name), class_name)
+    handler = handler_class(input_dir or args.input, args.output)
+    handler.open_destination = False
+
+    if getattr(args, "workers", None) is not None:
+        handler.max_workers = args.workers
+    if getattr(args, "backend", None) is not None:
+        handler.executor_backend = args.backend
+    if getattr(args, "shared", False):
+        handler.enable_leases()
+    if getattr(args, "size", None) is not None:
+        handler.standard_size = args.size
+    if getattr(args, "concurrency", None) is not None:
+        handler.max_concurrency = args.concurrency
+    return handler
+
+
+def watch(args: argparse.Namespace) -> None:
+    """Run the watch daemon over the input folder until interrupted.
+
+    :param args: Parsed command line arguments.
+    :type args: argparse.Namespace
+    :raises ConfigurationError: If a watch route names a handler that can't process single files.
+    """
+    # Imported here so the one-off commands don't pay for it
+    from handling.watch_daemon import WatchDaemon
+
+    routes = {*WATCH_ROUTES.values(), *(route for _, route in WATCH_FILENAME_RULES), WATCH_DEFAULT_ROUTE} - {None}
+    for route in routes:
+        if route not in WATCHABLE:
+            raise ConfigurationError(f"Can't watch for {route}, only for {', '.join(WATCHABLE)}")
+
+    # Stop cleanly, letting in-flight stamps finish, when a service manager asks
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    daemon = WatchDaemon(args.input, lambda route, folder: create_handler(args, route, folder), polling=args.polling)
+    daemon.run(stop)
+
+
+def run(handler, args: argparse.Namespace) -> bool:
+    """Run the command on its handler.
+
+    :param handler: Handler from create_handler.
+    :param args: Parsed command line arguments.
+    :type args: argparse.Namespace
+    :returns: Whether the handler reported success. Batch commands are checked by what's left in the input folder.
+    :rtype: bool
+    """
+    match args.command:
+        case "avatars":
+            handler.process_avatar(args.prompt or handler.prompt, args.force_regenerate)
+        case "avatar-edit" if args.batch:
+            handler.process_edit_avatars(args.prompt, args.force_regenerate)
+        case "avatar-edit":
+            image_file = handler.validate_single_image()
+            return handler.process_edit_avatar(args.prompt, image_file, args.force_regenerate) is not None
+        case _:
+            handler.execute()
+    return True
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Parse the command line, run the command and return the exit code."""
+    args = build_parser().parse_args(argv)
+    setup_logging()
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    try:
+        if args.command == "watch":
+            watch(args)
+            return 0
+        handler = create_handler(args)
+        succeeded = run(handler, args)
+    except (ConfigurationError, ValueError) as e:
+        logger.error("%s", e)
+        return 2
+    except Exception:
+        logger.exception("stampede %s failed", args.command)
+        return 1
+
+    # Processed inputs are archived, so anything still in the input folder didn't make it
+    remaining = [file for file in os.listdir(args.input) if file.lower().endswith(VALID_FORMATS)]
+    if getattr(handler, "leases", None) is not None:
+        # Files other nodes are still working on aren't failures
+        remaining = [file for file in remaining if not handler.leases.is_claimed(handler.working_name(file))]
+    if remaining:
+        logger.error("%d files in %s were not processed: %s", len(remaining), args.input, ", ".join(remaining))
+        return 1
+    return 0 if succeeded else 1
+
+
+if __name__ == "__main__":
+    # Lets process pool workers start without rerunning the command
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Developer tools for exercising the avatar pipeline without the OpenAI API. Not shipped with the app."""
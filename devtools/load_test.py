@@ -0,0 +1,125 @@
+"""Load test the avatar pipeline end to end against the mock images.edit server.
+
+Creates a batch of synthetic inputs in a temporary folder, starts a MockImageServer in
+process, points AvatarHandler at it and runs process_avatar as the GUI would. Then it
+reports throughput, request and retry counts, how the adaptive concurrency limit moved,
+the server's peak concurrency, its p50, p95, p99 and max request latency, and the process's
+peak memory:
+
+    python -m devtools.load_test --images 200 --latency 2 --quota 40 --error-rate 0.02
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+from devtools.mock_openai_server import MockBehaviour, MockImageServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def make_inputs(folder: str, count: int, size: int) -> None:
+    """Write count distinct PNG inputs of size x size pixels."""
+    for index in range(count):
+        colour = (index * 37 % 256, index * 91 % 256, index * 53 % 256)
+        Image.new("RGB", (size, size), colour).save(os.path.join(folder, f"stamp_{index:04d}.png"))
+
+
+def run(args: argparse.Namespace) -> dict:
+    """Run one load test.
+
+    :param args: Parsed command line arguments.
+    :type args: argparse.Namespace
+    :returns: The measurements by name.
+    :rtype: dict
+    """
+    behaviour = MockBehaviour(
+        latency_median=args.latency,
+        latency_sigma=args.sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        quota=args.quota,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    with tempfile.TemporaryDirectory(prefix="stampede-load-") as root, MockImageServer(behaviour) as server:
+        input_dir, output_dir = os.path.join(root, "img"), os.path.join(root, "out")
+        os.makedirs(input_dir)
+        make_inputs(input_dir, args.images, args.input_size)
+
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "mock")
+        # Imported after the environment is set, since the handler builds its clients on creation
+        from handling.avatar_handler import AvatarHandler
+
+        handler = AvatarHandler(input_dir, output_dir)
+        handler.open_destination = False
+        handler.avatar_cache = None  # measure generation, not cache hits
+        if args.max_concurrency is not None:
+            handler.max_concurrency = args.max_concurrency
+
+        start = time.perf_counter()
+        handler.process_avatar("load test")
+        elapsed = time.perf_counter() - start
+
+        saved = len(os.listdir(output_dir))
+        stats = handler.request_stats
+        return {
+            "images": args.images,
+            "saved": saved,
+            "seconds": round(elapsed, 2),
+            "avatars_per_second": round(saved / elapsed, 2),
+            **stats.as_dict(),
+            "final_limit": handler.limiter.limit,
+            "peak_limit": handler.limiter.peak,
+            "server_peak_in_flight": server.stats.peak_in_flight,
+            "server_responses": dict(sorted(server.stats.by_status.items())),
+            **{f"server_{name}": value for name, value in server.stats.latency_percentiles().items()},
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+
+def _peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_bytes = peak if sys.platform == "darwin" else peak * 1024  # kilobytes on Linux
+    return round(peak_bytes / 1024 / 1024, 1)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m devtools.load_test", description=__doc__.split("\n")[0])
+    parser.add_argument("--images", type=int, default=100, help="inputs in the batch")
+    parser.add_argument("--input-size", type=int, default=1024, help="side of the generated inputs in pixels")
+    parser.add_argument("--max-concurrency", type=int, help="ceiling for the in-flight limit")
+    parser.add_argument("--latency", type=float, default=0.5, help="median seconds per generation")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal spread of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--quota", type=int, help="requests in flight beyond which the server answers 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="seconds sent in Retry-After with 429s")
+    parser.add_argument("--seed", type=int, default=1, help="seed for latency and error draws")
+    parser.add_argument("--log-level", default="ERROR", help="handler logging level, e.g. WARNING to see retries")
+    return parser
+
+
+def main(argv=None) -> None:
+    """Run a load test and print its measurements."""
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s")
+    for name, value in run(args).items():
+        print(f"{name:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
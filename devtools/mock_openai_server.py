@@ -0,0 +1,325 @@
+"""Local stand-in for the OpenAI images.edit endpoint, for load testing without paying for generations.
+
+Answers POST /v1/images/edits like the real API: a JSON body with one base64 PNG. Each
+response is generated from a hash of the uploaded image and prompt, so the same request
+always gets the same picture. The server can be made to behave like a busy production
+endpoint:
+
+- latency is drawn from a lognormal distribution, long tailed like real generations;
+- a fraction of requests fail with a 500, and a fraction are rate limited with a 429
+  carrying Retry-After;
+- requests beyond a concurrency quota are rate limited too, which is what AdaptiveLimiter
+  has to discover.
+
+Requests sent with stream=true get server-sent events instead: partial_images partial
+frames, spread over the latency, then the completed image, as the live GUI previews expect.
+
+Point the handlers at it through the environment variables the OpenAI client reads:
+
+    python -m devtools.mock_openai_server --port 8089 --latency 5 --quota 40
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=test stampede avatars
+"""
+
+import argparse
+import base64
+import email.parser
+import hashlib
+import io
+import json
+import logging
+import math
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+from PIL import Image, ImageDraw
+
+logger = logging.getLogger(__name__)
+
+EDIT_PATH = "/v1/images/edits"
+MOCK_USAGE = {
+    "input_tokens": 0,
+    "input_tokens_details": {"image_tokens": 0, "text_tokens": 0},
+    "output_tokens": 0,
+    "total_tokens": 0,
+}
+
+
+@dataclass
+class MockBehaviour:
+    """How the mock endpoint behaves. Rates are probabilities per request."""
+
+    latency_median: float = 0.05  # seconds
+    latency_sigma: float = 0.5  # spread of the lognormal, 0 for a fixed latency
+    error_rate: float = 0.0  # 500 Internal Server Error
+    rate_limit_rate: float = 0.0  # 429 regardless of load
+    quota: int | None = None  # 429 for requests beyond this many in flight
+    retry_after: float = 1.0  # seconds, sent with every 429
+    image_size: int = 1024
+    seed: int | None = None
+
+
+@dataclass
+class MockStats:
+    requests: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    by_status: dict = field(default_factory=dict)
+    latencies: list = field(default_factory=list)  # seconds from receiving each request to its last byte
+
+    def latency_percentiles(self) -> dict:
+        """p50, p95, p99 and max of the recorded latencies in seconds, None when nothing was served yet."""
+        ordered = sorted(self.latencies)
+        percentiles = {}
+        for name, quantile in [("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("max", 1.0)]:
+            # Nearest rank, so each value is a latency that was actually seen
+            index = max(0, math.ceil(quantile * len(ordered)) - 1)
+            percentiles[f"latency_{name}"] = round(ordered[index], 3) if ordered else None
+        return percentiles
+
+    def as_dict(self) -> dict:
+        stats = asdict(self)
+        del stats["latencies"]
+        return {**stats, **self.latency_percentiles()}
+
+
+class MockImageServer:
+    """Threaded HTTP server serving the mock images.edit endpoint.
+
+    Use as a context manager, or call start() and stop().
+
+    :param behaviour: Latency and error injection settings.
+    :type behaviour: MockBehaviour
+    :param host: Interface to listen on.
+    :type host: str
+    :param port: Port to listen on, 0 for any free port.
+    :type port: int
+    """
+
+    def __init__(self, behaviour: MockBehaviour | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.behaviour = behaviour or MockBehaviour()
+        self.stats = MockStats()
+        self._random = random.Random(self.behaviour.seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """Value for OPENAI_BASE_URL."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockImageServer":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={"poll_interval": 0.05}, name="mock-openai", daemon=True
+        )
+        self._thread.start()
+        logger.info("Mock images.edit endpoint listening on %s", self.base_url)
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, content_type: str, body: bytes) -> tuple[int, dict, bytes | Iterator[bytes]]:
+        """Decide the outcome of one request, sleeping for its latency.
+
+        :returns: (status, extra headers, JSON body), or for a streamed request an iterator of
+            server-sent events that sleeps between frames
+        :rtype: tuple[int, dict, bytes or Iterator[bytes]]
+        """
+        behaviour = self.behaviour
+        received = time.perf_counter()
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.in_flight += 1
+            self.stats.peak_in_flight = max(self.stats.peak_in_flight, self.stats.in_flight)
+            over_quota = behaviour.quota is not None and self.stats.in_flight > behaviour.quota
+            draw = self._random.random()
+            latency = behaviour.latency_median * math.exp(self._random.gauss(0, behaviour.latency_sigma))
+
+        streamed = False
+        try:
+            if over_quota or draw < behaviour.rate_limit_rate:
+                # The real API rejects rate limited requests quickly, without generating anything
+                return self._error(429, "Rate limit reached for images", {"retry-after": str(behaviour.retry_after)})
+            fields = _parse_multipart(content_type, body)
+            failed = draw < behaviour.rate_limit_rate + behaviour.error_rate
+            if fields.get("stream") == b"true" and not failed and "image" in fields and "prompt" in fields:
+                partial_images = int(fields.get("partial_images", b"0"))
+                events = self._stream(fields["image"] + fields["prompt"], partial_images, latency, received)
+                streamed = True
+                return self._count(200), {"content-type": "text/event-stream"}, events
+            time.sleep(latency)
+            if failed:
+                return self._error(500, "The server had an error while processing your request")
+
+            if "image" not in fields or "prompt" not in fields:
+                return self._error(400, "image and prompt are required")
+            png = render_image(fields["image"] + fields["prompt"], behaviour.image_size)
+            payload = {"created": int(time.time()), "data": [{"b64_json": base64.b64encode(png).decode()}]}
+            return self._count(200), {}, json.dumps(payload).encode()
+        finally:
+            if not streamed:
+                self._done(received)
+
+    def _stream(self, seed: bytes, partial_images: int, latency: float, received: float) -> Iterator[bytes]:
+        """Server-sent events for a streamed edit: coarse partial frames, then the final image."""
+        size = self.behaviour.image_size
+        try:
+            for index in range(partial_images):
+                time.sleep(latency / (partial_images + 1))
+                # Each frame is sharper than the last, like the real partials
+                frame = render_image(seed, max(16, size >> (partial_images - index)))
+                yield _event("image_edit.partial_image", frame, partial_image_index=index)
+            time.sleep(latency / (partial_images + 1))
+            yield _event("image_edit.completed", render_image(seed, size), usage=MOCK_USAGE)
+        finally:
+            self._done(received)
+
+    def _done(self, received: float) -> None:
+        with self._lock:
+            self.stats.in_flight -= 1
+            self.stats.latencies.append(time.perf_counter() - received)
+
+    def _error(self, status: int, message: str, headers: dict | None = None) -> tuple[int, dict, bytes]:
+        body = {"error": {"message": message, "type": "mock_error", "code": None, "param": None}}
+        return self._count(status), headers or {}, json.dumps(body).encode()
+
+    def _count(self, status: int) -> int:
+        with self._lock:
+            self.stats.by_status[status] = self.stats.by_status.get(status, 0) + 1
+        return status
+
+
+def render_image(seed: bytes, size: int) -> bytes:
+    """A PNG that depends only on the seed: a coloured background with a contrasting disc.
+
+    :param seed: Bytes the colours are derived from.
+    :type seed: bytes
+    :param size: Width and height in pixels.
+    :type size: int
+    :returns: The encoded PNG.
+    :rtype: bytes
+    """
+    digest = hashlib.sha256(seed).digest()
+    background, foreground = tuple(digest[:3]), tuple(255 - value for value in digest[:3])
+    image = Image.new("RGB", (size, size), background)
+    margin = size // 4 + digest[3] % (size // 8)
+    ImageDraw.Draw(image).ellipse((margin, margin, size - margin, size - margin), fill=foreground)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _event(event_type: str, png: bytes, **fields) -> bytes:
+    data = {
+        "type": event_type,
+        "b64_json": base64.b64encode(png).decode(),
+        "created_at": int(time.time()),
+        "size": "1024x1024",
+        "quality": "high",
+        "background": "opaque",
+        "output_format": "png",
+        **fields,
+    }
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+def _parse_multipart(content_type: str, body: bytes) -> dict[str, bytes]:
+    message = email.parser.BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    if not message.is_multipart():
+        return {}
+    return {
+        part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+        for part in message.get_payload()
+    }
+
+
+def _handler_for(server: MockImageServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("content-length", 0)))
+            if self.path.split("?")[0] != EDIT_PATH:
+                status, headers, payload = server._error(404, f"No mock for {self.path}")
+            else:
+                status, headers, payload = server.respond(self.headers.get("content-type", ""), body)
+            self.send_response(status)
+            headers = {"content-type": "application/json", **headers}
+            if isinstance(payload, bytes):
+                headers["content-length"] = str(len(payload))
+            else:
+                headers["transfer-encoding"] = "chunked"
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            if isinstance(payload, bytes):
+                self.wfile.write(payload)
+                return
+            try:
+                for chunk in payload:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading, e.g. a preview was cancelled
+                self.close_connection = True
+            finally:
+                payload.close()
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+    return Handler
+
+
+def main(argv=None) -> None:
+    """Run the mock endpoint until interrupted."""
+    parser = argparse.ArgumentParser(prog="python -m devtools.mock_openai_server", description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=5.0, help="median seconds per generation")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal spread of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--quota", type=int, help="requests in flight beyond which every request gets a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="seconds sent in Retry-After with 429s")
+    parser.add_argument("--seed", type=int, help="seed for latency and error draws")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    behaviour = MockBehaviour(
+        latency_median=args.latency,
+        latency_sigma=args.sigma,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        quota=args.quota,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = MockImageServer(behaviour, args.host, args.port).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        logger.info("Served %s", server.stats.as_dict())
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,12 @@ a background QThread, keeping the GUI responsive while providing visual feedback
 The caller decides what work to do; this dialog only handles presentation.
 """
 
-from PySide6.QtCore import QThread, QTimer, Signal
-from PySide6.QtWidgets import QDialog, QLabel, QMessageBox, QVBoxLayout
+from PySide6.QtCore import Qt, QThread, QTimer, Signal
+from PySide6.QtGui import QPixmap
+from PySide6.QtWidgets import (QDialog, QLabel, QMessageBox, QPushButton,
+                               QVBoxLayout)
+
+PREVIEW_SIZE = 256
 
 
 class ProcessingWorker(QThread):
@@ -17,26 +21,34 @@ class ProcessingWorker(QThread):
     # marshalled across threads by Qt's event loop, making this thread-safe.
     finished = Signal(object)
     error = Signal(str)
+    preview = Signal(str, object)  # (name, image bytes)
 
-    def __init__(self, callback):
+    def __init__(self, callback, previews: bool = False):
         super().__init__()
         self.callback = callback
+        self.previews = previews
 
     def run(self):
         try:
-            result = self.callback()
+            # With previews on, the callback is handed preview.emit to report frames from this thread
+            result = self.callback(self.preview.emit) if self.previews else self.callback()
             self.finished.emit(result)
         except Exception as e:
             self.error.emit(str(e))
 
 
 class ProcessingDialog(QDialog):
-    """Modal dialog that shows animated progress while a callback runs in a background thread."""
+    """Modal dialog that shows animated progress while a callback runs in a background thread.
+
+    With previews, the callback takes a preview function to call with (name, image bytes) for each
+    partial frame, and the latest frame is shown as it arrives. With cancel, a Cancel button calls it
+    so the callback can stop early.
+    """
 
-    def __init__(self, parent, title: str, message: str, callback):
+    def __init__(self, parent, title: str, message: str, callback, cancel=None, previews: bool = False):
         super().__init__(parent)
         self.setWindowTitle(title)
-        self.resize(300, 100)
+        self.resize(300, PREVIEW_SIZE + 140 if previews else 100)
         self.setModal(True)
 
         # Stored on the dialog so the caller can inspect them after exec() returns,
@@ -44,6 +56,8 @@ class ProcessingDialog(QDialog):
         self.result = None
         self.error_message = None
         self._dot_count = 0
+        self._progress_text = "Processing"
+        self._cancel = cancel
 
         layout = QVBoxLayout(self)
 
@@ -55,6 +69,19 @@ class ProcessingDialog(QDialog):
         self._progress_label.setStyleSheet("font-size: 10pt;")
         layout.addWidget(self._progress_label)
 
+        if previews:
+            self._preview_label = QLabel("Waiting for the first preview...")
+            self._preview_label.setAlignment(Qt.AlignCenter)
+            self._preview_label.setFixedSize(PREVIEW_SIZE, PREVIEW_SIZE)
+            layout.addWidget(self._preview_label, alignment=Qt.AlignCenter)
+
+        if cancel is not None:
+            self._cancel_button = QPushButton("Cancel")
+            self._cancel_button.setFixedWidth(80)
+            self._cancel_button.setStyleSheet("background-color: red; color: white;")
+            self._cancel_button.clicked.connect(self._on_cancel)
+            layout.addWidget(self._cancel_button, alignment=Qt.AlignRight)
+
         # QTimer runs on the main thread's event loop, so it's safe to update
         # widgets directly. A second thread (like the old tkinter approach) would
         # need cross-thread synchronisation for something this simple.
@@ -62,14 +89,31 @@ class ProcessingDialog(QDialog):
         self._timer.timeout.connect(self._animate)
         self._timer.start(500)
 
-        self._worker = ProcessingWorker(callback)
+        self._worker = ProcessingWorker(callback, previews)
         self._worker.finished.connect(self._on_finished)
         self._worker.error.connect(self._on_error)
+        self._worker.preview.connect(self._show_preview)
         self._worker.start()
 
     def _animate(self):
         self._dot_count = (self._dot_count + 1) % 4
-        self._progress_label.setText("Processing" + "." * self._dot_count)
+        self._progress_label.setText(self._progress_text + "." * self._dot_count)
+
+    def _show_preview(self, name: str, data: bytes):
+        # Runs on the main thread: the signal is queued across from the worker
+        pixmap = QPixmap()
+        if not pixmap.loadFromData(data):
+            return
+        self._preview_label.setPixmap(
+            pixmap.scaled(PREVIEW_SIZE, PREVIEW_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        )
+        self._message_label.setText(f"Previewing {name}")
+
+    def _on_cancel(self):
+        # The worker finishes on its own once the callback notices, keeping whatever already completed
+        self._cancel_button.setEnabled(False)
+        self._progress_text = "Cancelling"
+        self._cancel()
 
     def _on_finished(self, result):
         self._timer.stop()
@@ -91,6 +135,8 @@ class ProcessingDialog(QDialog):
                 QMessageBox.No,
             )
             if reply == QMessageBox.Yes:
+                if self._cancel is not None:
+                    self._cancel()
                 self._worker.wait()
                 super().closeEvent(event)
             else:
@@ -64,13 +64,28 @@ class MainWindow(QWidget):
 
         layout.addLayout(button_layout)
 
-    def _run_with_processing_dialog(self, title: str, message: str, callback):
+    def _run_with_processing_dialog(self, title: str, message: str, callback, preview_handler=None):
         """Shared by all buttons — wraps any handler call in a processing dialog.
 
         Keeps the pattern consistent: show progress, run in background, report result.
         Without this, each button handler would duplicate the dialog/messagebox logic.
+        Given an avatar handler as preview_handler, the dialog also shows the generation's
+        partial frames and lets the user cancel it.
         """
-        dialog = ProcessingDialog(self, title, message, callback)
+        if preview_handler is None:
+            dialog = ProcessingDialog(self, title, message, callback)
+        else:
+
+            def run_with_previews(preview):
+                preview_handler.preview_callback = preview
+                try:
+                    return callback()
+                finally:
+                    preview_handler.preview_callback = None
+
+            dialog = ProcessingDialog(
+                self, title, message, run_with_previews, cancel=preview_handler.cancel, previews=True
+            )
         dialog.exec()
 
         # temp disable finished message boxes
@@ -100,6 +115,7 @@ class MainWindow(QWidget):
             "Processing...",
             "Generating avatar...",
             lambda: self._avatar_handler.process_avatar(user_prompt),
+            self._avatar_handler,
         )
         self.close()
 
@@ -107,11 +123,15 @@ class MainWindow(QWidget):
         # Validate before showing the preview dialog. Fail fast so the user
         # doesn't write a prompt only to find out there's no image to edit
         try:
-            image_file = self._avatar_edit_handler.validate_single_image()
+            image_files = self._avatar_edit_handler.validate_images()
         except ValueError as e:
             QMessageBox.critical(self, "Error", str(e))
             return
+        if len(image_files) > 1:
+            self._on_edit_avatars(image_files)
+            return
 
+        image_file = image_files[0]
         image_path = os.path.join("img", image_file)
         preview_dialog = PromptPreviewDialog(self, image_path, image_file)
         if preview_dialog.exec() != PromptPreviewDialog.Accepted:
@@ -123,5 +143,25 @@ class MainWindow(QWidget):
             "Processing...",
             "Processing image...",
             lambda: self._avatar_edit_handler.process_edit_avatar(user_prompt, image_file),
+            self._avatar_edit_handler,
+        )
+        self.close()
+
+    def _on_edit_avatars(self, image_files: list[str]):
+        # Too many images to preview, so one instruction is applied to all of them, except
+        # those with their own <image name>.txt prompt beside them
+        prompt_dialog = PromptDialog(
+            self, "Please modify this image by: ", f"Edit Avatars - {len(image_files)} images in img/"
+        )
+        if prompt_dialog.exec() != PromptDialog.Accepted:
+            return
+
+        user_prompt = prompt_dialog.get_prompt()
+
+        self._run_with_processing_dialog(
+            "Processing...",
+            f"Editing {len(image_files)} images...",
+            lambda: self._avatar_edit_handler.process_edit_avatars(user_prompt),
+            self._avatar_edit_handler,
         )
         self.close()
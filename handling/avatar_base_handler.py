@@ -1,12 +1,37 @@
 """Base avatar handler providing common OpenAI functionality."""
 
+import asyncio
+import base64
+import hashlib
+import itertools
 import logging
 import mimetypes
+import os
+import threading
+import time
+from typing import Callable
 
 from openai.types.image import Image
 
 from handling.base_image_handler import BaseImageHandler
-from handling.util.openai_util import create_openai_client
+from handling.util.openai_util import create_async_openai_client, create_openai_client
+from handling.util.request_control import AdaptiveLimiter, RequestStats, RetryPolicy, is_rate_limit
+from handling.util.result_cache import ResultCache
+from handling.util.upload_prep import prepare_upload
+from settings.static_dicts import (
+    AVATAR_CACHE_DIR,
+    AVATAR_CACHE_ENABLED,
+    AVATAR_CACHE_MAX_BYTES,
+    AVATAR_CACHE_TTL_SECONDS,
+    AVATAR_INITIAL_CONCURRENCY,
+    AVATAR_MAX_CONCURRENCY,
+    AVATAR_PARTIAL_IMAGES,
+    AVATAR_UPLOAD_MAX_BYTES,
+    AVATAR_UPLOAD_QUALITY,
+    AVATAR_UPLOAD_SIZE,
+    IMAGE_DIR,
+    PROCESSED_DIR_AVATAR,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,25 +46,284 @@ mimetypes.add_type("image/webp", ".webp")
 class AvatarBaseHandler(BaseImageHandler):
     """Base class for avatar handlers with OpenAI integration."""
 
-    def __init__(self):
-        super().__init__()
+    default_output_dir = PROCESSED_DIR_AVATAR
+
+    def __init__(self, input_dir: str = IMAGE_DIR, output_dir: str | None = None):
+        super().__init__(input_dir, output_dir)
         self.client = create_openai_client()
+        self.retry_policy = RetryPolicy()
+        self.request_stats = RequestStats()
+        self.limiter = None  # AdaptiveLimiter for async batches
+        self.max_concurrency = AVATAR_MAX_CONCURRENCY
+        self.avatar_cache = (
+            ResultCache(AVATAR_CACHE_DIR, AVATAR_CACHE_MAX_BYTES, AVATAR_CACHE_TTL_SECONDS)
+            if AVATAR_CACHE_ENABLED
+            else None
+        )
+        self.force_regenerate = False  # skip cache lookups for this run, replacing the stored avatars
+        self.preview_callback = None  # called with (upload name, PNG bytes) for each partial frame, e.g. by the GUI
+        self.partial_images = AVATAR_PARTIAL_IMAGES
+        self.cancel_event = threading.Event()  # set from any thread to stop generating, see cancel()
 
-    def _execute_edit_request(self, user_prompt: str, image_data) -> Image:
-        """Execute OpenAI image edit request with common parameters."""
+    def cancel(self) -> None:
+        """Stop the run in progress: streams being read are closed and no new requests are sent.
+
+        Avatars that already arrived are kept. Inputs that weren't finished stay in the input
+        directory. Safe to call from another thread, e.g. the GUI's.
+        """
+        logger.info("Cancelling avatar generation")
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def _get_input_files(self) -> list[str]:
+        # Names only: each file is opened when its request is sent, see _load_input
+        return [file for file in os.listdir(self.input_dir) if self._is_valid_file_type(file)]
+
+    def _start_batch(self) -> None:
+        """Reset the counters and the in-flight limit for a new async batch.
+
+        The limit starts at AVATAR_INITIAL_CONCURRENCY and adapts to rate limiting, up to
+        max_concurrency, see AdaptiveLimiter.
+        """
+        self.request_stats = RequestStats()
+        if self.avatar_cache is not None:
+            self.avatar_cache.reset_stats()
+        self.limiter = AdaptiveLimiter(
+            min(AVATAR_INITIAL_CONCURRENCY, self.max_concurrency), maximum=self.max_concurrency
+        )
+
+    def _log_request_stats(self) -> None:
+        stats = self.request_stats
+        logger.info(
+            "OpenAI requests: %d sent, %d succeeded, %d retried, %d rate limited, %d failed; "
+            "concurrency limit ended at %d (peak %d)",
+            stats.requests,
+            stats.succeeded,
+            stats.retried,
+            stats.rate_limited,
+            stats.failed,
+            self.limiter.limit,
+            self.limiter.peak,
+        )
+        if self.avatar_cache is not None:
+            logger.info("Avatar cache: %d restored, %d generated", self.avatar_cache.hits, self.avatar_cache.misses)
+
+    def _open_async_client(self):
+        """A fresh async client for one batch. Its connection pool belongs to the running event loop."""
+        return create_async_openai_client()
+
+    def _load_input(self, file_name: str) -> tuple[str, bytes, str]:
+        """Read an input image for upload, closing it straight away.
+
+        Inputs larger than the model's working resolution or the upload budget are
+        downscaled and re-encoded in memory first, see prepare_upload. Async batches call this
+        once a request slot is free, so only the inputs of requests in flight are open or held
+        in memory.
+
+        :param file_name: Name of the image in the input directory.
+        :type file_name: str
+        :returns: The upload as (file name, contents, MIME type).
+        :rtype: tuple[str, bytes, str]
+        """
+        with open(f"{self.input_dir}/{file_name}", "rb") as f:
+            data = f.read()
+        return prepare_upload(file_name, data)
+
+    def _avatar_cache_key(self, file_name: str, user_prompt: str) -> str | None:
+        """Cache key for an input and prompt, covering every request parameter and the post-processing.
+
+        :returns: The key, or None when the avatar cache is off.
+        :rtype: str or None
+        """
+        if self.avatar_cache is None:
+            return None
+        with open(f"{self.input_dir}/{file_name}", "rb") as f:
+            image_hash = hashlib.file_digest(f, "sha256").digest()
+        params = self._edit_params(user_prompt, None)
+        del params["image"]
+        upload = (AVATAR_UPLOAD_SIZE, AVATAR_UPLOAD_MAX_BYTES, AVATAR_UPLOAD_QUALITY)
+        return self.avatar_cache.make_key(image_hash, sorted(params.items()), upload, self._post_processing())
+
+    def _post_processing(self) -> tuple:
+        """Settings applied to a result before it is saved, which the cached avatar depends on as well."""
+        return ()
+
+    def _restore_cached_avatar(self, cache_key: str | None, destination: str) -> bool:
+        """Copy a stored avatar to its destination instead of generating it again.
+
+        :returns: Whether the avatar was restored from the cache.
+        :rtype: bool
+        """
+        if cache_key is None or self.force_regenerate:
+            return False
+        try:
+            if self.avatar_cache.lookup(cache_key) is None:
+                return False
+            self.avatar_cache.restore(cache_key, [destination])
+        except OSError as e:
+            logger.warning("Couldn't restore cached avatar, generating it instead: %s", e)
+            return False
+        logger.info("Restored cached avatar: %s", os.path.basename(destination))
+        return True
+
+    def _cache_avatar(self, cache_key: str | None, destination: str) -> None:
+        if cache_key is None:
+            return
         try:
-            result = self.client.images.edit(
-                model="gpt-image-2",
-                image=image_data,
-                prompt=user_prompt,
-                # Transparent bg not currently supported by gpt-image-2?
-                # background="transparent",
-                n=1,
-                quality="high",
-                size="1024x1024",
+            if self.force_regenerate:
+                self.avatar_cache.discard(cache_key)
+            self.avatar_cache.store(cache_key, [("avatar", destination)])
+        except OSError as e:
+            logger.warning("Couldn't cache avatar %s: %s", os.path.basename(destination), e)
+
+    def _evict_avatar_cache(self) -> None:
+        if self.avatar_cache is not None:
+            self.avatar_cache.evict()
+
+    def _edit_params(self, user_prompt: str, image_data) -> dict:
+        return {
+            "model": "gpt-image-2",
+            "image": image_data,
+            "prompt": user_prompt,
+            # Transparent bg not currently supported by gpt-image-2?
+            # background="transparent",
+            "n": 1,
+            "quality": "high",
+            "size": "1024x1024",
+        }
+
+    def _execute_edit_request(self, user_prompt: str, image_data) -> Image:
+        """Execute OpenAI image edit request with common parameters, retrying transient failures."""
+        for attempt in itertools.count(1):
+            if self.cancelled:
+                return None
+            self.request_stats.requests += 1
+            try:
+                params = self._stream_params()
+                result = self.client.images.edit(**self._edit_params(user_prompt, image_data), **params)
+                if params:
+                    with result as stream:
+                        result = self._read_stream(stream, image_data[0])
+                else:
+                    # Process a single avatar per request, i.e. each call is one in, one out
+                    result = result.data[0]
+            except Exception as error:
+                if self._give_up(error, attempt):
+                    return None
+                time.sleep(self.retry_policy.delay(error, attempt))
+                continue
+
+            if result is None:  # cancelled part way through the stream
+                return None
+            self.request_stats.succeeded += 1
+            return result
+
+    async def _execute_edit_request_async(self, client, user_prompt: str, load_image: Callable[[], object]) -> Image:
+        """Async counterpart of _execute_edit_request, made through a batch's shared async client.
+
+        Each attempt holds a slot from self.limiter, when set, and reports back whether it was rate limited.
+
+        :param load_image: Returns the image to upload. Called in a worker thread for each attempt, once it
+            holds a slot, so inputs are only read while their request is in flight.
+        :type load_image: Callable[[], object]
+        """
+        limiter = self.limiter
+        for attempt in itertools.count(1):
+            ticket = await limiter.acquire() if limiter else None
+            if self.cancelled:  # checked once a slot is free, since the batch may have been cancelled while waiting
+                if limiter:
+                    await limiter.release(ticket)
+                return None
+            self.request_stats.requests += 1
+            try:
+                image_data = await asyncio.to_thread(load_image)
+                params = self._stream_params()
+                result = await client.images.edit(**self._edit_params(user_prompt, image_data), **params)
+                if params:
+                    async with result as stream:
+                        result = await self._read_stream_async(stream, image_data[0])
+                else:
+                    result = result.data[0]
+            except Exception as error:
+                if limiter:
+                    await limiter.release(ticket, rate_limited=is_rate_limit(error))
+                if self._give_up(error, attempt):
+                    return None
+                # Back off without holding a slot, so other requests can use it
+                await asyncio.sleep(self.retry_policy.delay(error, attempt))
+                continue
+            finally:
+                image_data = None  # don't hold the upload through a backoff sleep
+
+            if result is None:  # cancelled part way through the stream
+                if limiter:
+                    await limiter.release(ticket)
+                return None
+            if limiter:
+                await limiter.release(ticket, succeeded=True)
+            self.request_stats.succeeded += 1
+            return result
+
+    def _stream_params(self) -> dict:
+        """Extra request parameters to stream partial frames, when something is showing them."""
+        if self.preview_callback is None or not self.partial_images:
+            return {}
+        return {"stream": True, "partial_images": self.partial_images}
+
+    def _read_stream(self, stream, name: str) -> Image | None:
+        """Read a streamed edit, previewing its partial frames.
+
+        :returns: The completed event, which carries the final image's b64_json like a non-streamed
+            result does, or None if the run was cancelled first.
+        """
+        for event in stream:
+            if self.cancelled:
+                logger.info("Cancelled generation for %s", name)
+                return None
+            if self._handle_stream_event(event, name):
+                return event
+        raise ValueError(f"The stream for {name} ended without a completed image")
+
+    async def _read_stream_async(self, stream, name: str) -> Image | None:
+        """Async counterpart of _read_stream."""
+        async for event in stream:
+            if self.cancelled:
+                logger.info("Cancelled generation for %s", name)
+                return None
+            if self._handle_stream_event(event, name):
+                return event
+        raise ValueError(f"The stream for {name} ended without a completed image")
+
+    def _handle_stream_event(self, event, name: str) -> bool:
+        """Hand a partial frame to preview_callback.
+
+        :returns: Whether the event is the completed image.
+        :rtype: bool
+        """
+        if event.type.endswith(".completed"):
+            return True
+        if event.type.endswith(".partial_image") and self.preview_callback is not None:
+            try:
+                self.preview_callback(name, base64.b64decode(event.b64_json))
+            except Exception:
+                # A preview that can't be shown mustn't cost the generation
+                logger.warning("Couldn't show preview %d for %s", event.partial_image_index, name, exc_info=True)
+        return False
+
+    def _give_up(self, error: Exception, attempt: int) -> bool:
+        """Count a failed attempt and decide whether it was the last."""
+        if is_rate_limit(error):
+            self.request_stats.rate_limited += 1
+        if self.retry_policy.should_retry(error, attempt):
+            self.request_stats.retried += 1
+            logger.warning(
+                "OpenAI API request failed (%s), retrying, attempt %d of %d", error, attempt, self.retry_policy.attempts
             )
-            # Process a single avatar per request, i.e. each call is one in, one out
-            return result.data[0]
-        except Exception:
-            logger.exception("OpenAI API request failed")
-            return None
+            return False
+
+        self.request_stats.failed += 1
+        logger.error("OpenAI API request failed", exc_info=error)
+        return True
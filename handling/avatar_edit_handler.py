@@ -1,69 +1,193 @@
 """Avatar editing handler using OpenAI's image editing API."""
 
-import base64
+import asyncio
 import logging
 import os
-from datetime import datetime
+from functools import partial
 
 from handling.avatar_base_handler import AvatarBaseHandler
-from settings.static_dicts import PROCESSED_DIR_AVATAR
+from handling.util.result_writer import write_base64_png
+from settings.static_dicts import IMAGE_DIR
 
 logger = logging.getLogger(__name__)
 
+PROMPT_SIDECAR_EXTENSION = ".txt"  # img/cat.txt holds the editing instruction for img/cat.png
+
 
 class AvatarEditHandler(AvatarBaseHandler):
     """Handles avatar image editing using OpenAI's image editing capabilities."""
 
-    def __init__(self):
+    def __init__(self, input_dir: str = IMAGE_DIR, output_dir: str | None = None):
         """Initialize avatar edit handler."""
-        super().__init__()
+        super().__init__(input_dir, output_dir)
 
     def validate_single_image(self) -> str:
-        """Check that exactly one image file exists in img directory.
+        """Check that exactly one image file exists in the input directory.
 
         :returns: The image filename.
         :rtype: str
         :raises ValueError: If zero or more than one image is found.
         """
-        image_files = [file for file in os.listdir("img") if self._is_valid_file_type(file)]
-
-        if len(image_files) == 0:
-            raise ValueError("No image found. Place exactly one image file in the img directory for editing.")
+        image_files = self.validate_images()
         if len(image_files) > 1:
             raise ValueError(
-                f"{len(image_files)} images in img directory. Please ensure only one image is present for editing."
+                f"{len(image_files)} images in {self.input_dir}. Please ensure only one image is present for editing."
             )
 
         return image_files[0]
 
-    def process_edit_avatar(self, user_prompt: str, image_file: str):
+    def validate_images(self) -> list[str]:
+        """Check that at least one image file exists in the input directory.
+
+        :returns: The image filenames.
+        :rtype: list[str]
+        :raises ValueError: If no image is found.
+        """
+        image_files = self._get_input_files()
+        if not image_files:
+            raise ValueError(f"No image found. Place the images to edit in {self.input_dir}.")
+        return image_files
+
+    def process_edit_avatar(self, user_prompt: str, image_file: str, force_regenerate: bool = False) -> str | None:
         """Process avatar editing.
 
         :param user_prompt: The editing instruction from the user.
         :type user_prompt: str
-        :param image_file: Filename of the image in img/ to edit.
+        :param image_file: Filename of the image in the input directory to edit.
         :type image_file: str
-        :returns: The result data from the API, or None on failure.
+        :param force_regenerate: Edit the image again, even if a result is cached for the same image and prompt.
+        :type force_regenerate: bool
+        :returns: Path of the saved edit, or None on failure.
+        :rtype: str or None
         """
         logger.info("Editing avatar with prompt: %s", user_prompt)
+        self.force_regenerate = force_regenerate
+        self.cancel_event.clear()
+
+        output_path = self._edited_avatar_path(image_file)
+        cache_key = self._avatar_cache_key(image_file, user_prompt)
+        if not self._restore_cached_avatar(cache_key, output_path):
+            result = self._execute_edit_request(user_prompt, self._load_input(image_file))
+            if not result:
+                return None
+            self._save_edited_avatar(result, output_path)
+            self._cache_avatar(cache_key, output_path)
+            self._evict_avatar_cache()
 
-        with open(f"img/{image_file}", "rb") as image_data:
-            result = self._execute_edit_request(user_prompt, image_data)
-
-        if not result:
-            return None
-
-        self._save_edited_avatar(result)
         self._archive_image(image_file)
         logger.info("Archived input image: %s", image_file)
 
-        return result
+        return output_path
+
+    def process_edit_avatars(self, user_prompt: str, force_regenerate: bool = False) -> list[str]:
+        """Edit every image in the input directory concurrently.
+
+        Each image is edited with the instruction in its sidecar file, e.g. cat.txt for
+        cat.png, when it has one, or with user_prompt otherwise. Edits are saved as
+        <input name>_edited.png as soon as they arrive.
 
-    def _save_edited_avatar(self, returned_image):
-        image_base64 = returned_image.b64_json
-        image_bytes = base64.b64decode(image_base64)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M")
-        output_filename = f"{timestamp}_edited.png"
-        with open(f"{PROCESSED_DIR_AVATAR}/{output_filename}", "wb") as f:
-            f.write(image_bytes)
-        logger.info("Saved edited image: %s", output_filename)
+        :param user_prompt: The editing instruction for images without a sidecar prompt.
+        :type user_prompt: str
+        :param force_regenerate: Edit every image again, even if a result is cached for the same image and prompt.
+        :type force_regenerate: bool
+        :returns: Paths of the saved edits.
+        :rtype: list[str]
+        :raises ValueError: If no image is found.
+        """
+        logger.info("Editing avatars with prompt: %s", user_prompt)
+        self.force_regenerate = force_regenerate
+        self.cancel_event.clear()
+
+        image_files = self.validate_images()
+        try:
+            saved = asyncio.run(self._request_edits(user_prompt, image_files))
+        finally:
+            self._evict_avatar_cache()
+        logger.info("Edited %d of %d avatars", len(saved), len(image_files))
+        return saved
+
+    async def _request_edits(self, user_prompt: str, image_files: list[str]) -> list[str]:
+        """Send every edit on one event loop through the same request path as new avatars.
+
+        :returns: Paths of the saved edits.
+        :rtype: list[str]
+        """
+        self._start_batch()
+        output_paths = self._edited_avatar_paths(image_files)
+
+        async def request(image_file):
+            prompt = await asyncio.to_thread(self._edit_prompt, image_file, user_prompt)
+            if not prompt:
+                logger.error("No editing instruction for %s, skipping it", image_file)
+                return None
+            output_path = output_paths[image_file]
+            cache_key = await asyncio.to_thread(self._avatar_cache_key, image_file, prompt)
+            if not await asyncio.to_thread(self._restore_cached_avatar, cache_key, output_path):
+                load = partial(self._load_input, image_file)
+                result = await self._execute_edit_request_async(client, prompt, load)
+                if result is None:
+                    if not self.cancelled:
+                        logger.error("Failed to edit avatar for: %s", image_file)
+                    return None
+                if not await asyncio.to_thread(self._store_edited_avatar, result, output_path, cache_key):
+                    return None
+            await asyncio.to_thread(self._archive_edited_input, image_file)
+            return output_path
+
+        async with self._open_async_client() as client:
+            saved = await asyncio.gather(*(request(image_file) for image_file in image_files))
+
+        self._log_request_stats()
+        return [output_path for output_path in saved if output_path is not None]
+
+    def _edit_prompt(self, image_file: str, user_prompt: str) -> str:
+        """The editing instruction for one image: its sidecar file's contents, or user_prompt."""
+        try:
+            with open(self._sidecar_path(image_file), encoding="utf-8") as f:
+                prompt = f.read().strip()
+        except FileNotFoundError:
+            return user_prompt
+        logger.info("Editing %s with its own prompt: %s", image_file, prompt)
+        return prompt
+
+    def _sidecar_path(self, image_file: str) -> str:
+        return f"{self.input_dir}/{os.path.splitext(image_file)[0]}{PROMPT_SIDECAR_EXTENSION}"
+
+    def _store_edited_avatar(self, returned_image, output_path: str, cache_key: str | None) -> bool:
+        try:
+            self._save_edited_avatar(returned_image, output_path)
+        except OSError as e:
+            logger.error("Failed to save edited image %s: %s", os.path.basename(output_path), e)
+            return False
+        self._cache_avatar(cache_key, output_path)
+        return True
+
+    def _archive_edited_input(self, image_file: str) -> None:
+        # The sidecar prompt goes with its image, so it isn't applied to a later image of the same name
+        if self._archive_image(image_file):
+            logger.info("Archived input image: %s", image_file)
+        sidecar_path = self._sidecar_path(image_file)
+        if os.path.exists(sidecar_path):
+            self._archive_image(os.path.basename(sidecar_path))
+
+    def _edited_avatar_paths(self, image_files: list[str]) -> dict[str, str]:
+        """Output path for each image, kept apart when two inputs share a name, e.g. cat.png and cat.jpg."""
+        paths, taken = {}, set()
+        for image_file in image_files:
+            paths[image_file] = self._edited_avatar_path(image_file, taken)
+            taken.add(paths[image_file])
+        return paths
+
+    def _edited_avatar_path(self, image_file: str, taken: set[str] = frozenset()) -> str:
+        # Numbered rather than overwritten when the name is in use, e.g. by an earlier edit of the same image
+        stem = os.path.splitext(image_file)[0]
+        output_path = f"{self.output_dir}/{stem}_edited.png"
+        number = 1
+        while output_path in taken or os.path.exists(output_path):
+            number += 1
+            output_path = f"{self.output_dir}/{stem}_edited_{number}.png"
+        return output_path
+
+    def _save_edited_avatar(self, returned_image, output_path: str):
+        write_base64_png(returned_image.b64_json, output_path)
+        logger.info("Saved edited image: %s", os.path.basename(output_path))
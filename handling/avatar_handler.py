@@ -1,13 +1,36 @@
 """Avatar generation handler using OpenAI's image generation API."""
 
+import asyncio
 import base64
+import io
 import logging
 import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import shutil
+from functools import partial
+
+from PIL import Image, ImageOps
 
 from handling.avatar_base_handler import AvatarBaseHandler
+from handling.imagehandler.circle_handler import CircleHandler
+from handling.util.avatar_packing import Tile, compose, grid_intact, packed_prompt, plan_packs, split
+from handling.util.background import remove_background
+from handling.util.perceptual_hash import Signature, group_duplicates, signature
+from handling.util.result_writer import decode_base64_png, staged_write, write_base64_png
+from handling.util.upload_prep import prepare_upload
 from settings.avatar_prompt import BASE_PROMPT
-from settings.static_dicts import IMAGE_DIR, PROCESSED_DIR_AVATAR
+from settings.static_dicts import (
+    AVATAR_BACKGROUND_SOFTNESS,
+    AVATAR_BACKGROUND_WHITE,
+    AVATAR_DEDUPE_ENABLED,
+    AVATAR_DEDUPE_MAX_DISTANCE,
+    AVATAR_PACK_MAX_SIDE,
+    AVATAR_PACK_SIZE,
+    AVATAR_PACKING_ENABLED,
+    AVATAR_REMOVE_BACKGROUND,
+    AVATAR_TO_CIRCLES,
+    AVATAR_UPLOAD_SIZE,
+    IMAGE_DIR,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -15,77 +38,363 @@ logger = logging.getLogger(__name__)
 class AvatarHandler(AvatarBaseHandler):
     """Handles avatar image generation using OpenAI's API."""
 
-    def __init__(self):
+    def __init__(self, input_dir: str = IMAGE_DIR, output_dir: str | None = None):
         """Initialize avatar handler."""
-        super().__init__()
+        super().__init__(input_dir, output_dir)
         self.prompt = BASE_PROMPT
-        self.input_files = []
+        self.dedupe_distance = AVATAR_DEDUPE_MAX_DISTANCE if AVATAR_DEDUPE_ENABLED else None
+        self.pack_size = AVATAR_PACK_SIZE if AVATAR_PACKING_ENABLED else None
+        self.tile_maps = []  # where each input of the last batch's packed requests was placed, see avatar_packing.Tile
+        self.remove_background = AVATAR_REMOVE_BACKGROUND
+        self.circle_handler = CircleHandler(input_dir) if AVATAR_TO_CIRCLES else None
 
-    def process_avatar(self, user_prompt: str) -> None:
+    def process_avatar(self, user_prompt: str, force_regenerate: bool = False) -> None:
         """Process avatar generation.
 
         :param user_prompt: The generation prompt from the user.
         :type user_prompt: str
+        :param force_regenerate: Generate every avatar again, even if one is cached for the same image and prompt.
+        :type force_regenerate: bool
         """
         logger.info("Generating avatars with prompt: %s", user_prompt)
+        self.force_regenerate = force_regenerate
+        self.cancel_event.clear()
 
-        input_images = self._get_input_files()
+        input_files = self._get_input_files()
         try:
-            processed_images = self._execute_model_requests(user_prompt, input_images)
-            # Close opened files to prevent conflicts during archiving
-            self._close_input_files()
-
-            self._save_avatars(processed_images)
-            for file_name, _ in processed_images:
-                self._archive_image(file_name)
-                logger.info("Archived input image: %s", file_name)
-
+            # Each avatar is saved and its input archived as soon as its request completes
+            saved = self._execute_model_requests(user_prompt, input_files)
         except Exception as e:
             logger.error("Failure during avatar processing: %s", e)
             raise e
+        finally:
+            self._evict_avatar_cache()
+        logger.info("Generated %d of %d avatars", len(saved), len(input_files))
+
+    def _execute_model_requests(self, user_prompt: str, input_files: list[str]) -> list[str]:
+        # Runs its own event loop, so callers (the GUI's worker thread, the CLI) stay synchronous
+        return asyncio.run(self._request_avatars(user_prompt, input_files))
+
+    async def _request_avatars(self, user_prompt: str, input_files: list[str]) -> list[str]:
+        """Send every edit request on one event loop, with at most max_concurrency in flight.
+
+        Waiting requests cost a coroutine rather than a thread, and they all share the client's
+        connection pool, so hundreds can be outstanding at once. The in-flight limit adapts to
+        rate limiting, see _start_batch.
+
+        Each result is written out as soon as it arrives, so only the responses currently
+        being saved are held in memory, however big the batch is. Near-duplicate inputs share
+        one request, see _group_duplicates, and with packing on so do small ones, see _plan_packs.
+
+        :returns: Names of the input files whose avatars were saved.
+        :rtype: list[str]
+        """
+        self._start_batch()
+        self.tile_maps = []
+
+        groups = await self._group_duplicates(input_files)
+        requests = await self._plan_packs(groups)
+        async with self._open_async_client() as client:
+            saved = await asyncio.gather(*(self._request_groups(client, user_prompt, pack) for pack in requests))
+
+        self._log_request_stats()
+        return [file_name for group in saved for file_name in group]
+
+    async def _request_groups(self, client, user_prompt: str, groups: list[list[str]]) -> list[str]:
+        """Restore or generate the avatars for one request's worth of groups of inputs.
+
+        Several groups are tiled into one packed request, see _generate_pack, and sent one by one
+        if that request fails or its result fails its quality check.
+
+        :returns: Names of the input files whose avatars were saved.
+        :rtype: list[str]
+        """
+        restored = await asyncio.gather(*(self._restore_group(user_prompt, group) for group in groups))
+        saved = [file_name for _, names in restored for file_name in names or []]
+        pending = [(group, cache_key) for group, (cache_key, names) in zip(groups, restored) if names is None]
+
+        if len(pending) > 1:
+            packed = await self._generate_pack(client, user_prompt, pending)
+            if packed is not None:
+                return saved + packed
+        generated = await asyncio.gather(
+            *(self._generate_group(client, user_prompt, group, cache_key) for group, cache_key in pending)
+        )
+        return saved + [file_name for names in generated for file_name in names]
+
+    async def _restore_group(self, user_prompt: str, group: list[str]) -> tuple[str | None, list[str] | None]:
+        """Restore a group's avatar from the avatar cache.
+
+        :returns: The group's cache key, and the inputs given an avatar, or None if it has to be generated.
+        :rtype: tuple[str or None, list[str] or None]
+        """
+        file_name = group[0]
+        cache_key = await asyncio.to_thread(self._avatar_cache_key, file_name, user_prompt)
+        if not await asyncio.to_thread(self._restore_cached_avatar, cache_key, self._avatar_path(file_name)):
+            return cache_key, None
+        await asyncio.to_thread(self._make_circles_from_file, file_name, [file_name])
+        await asyncio.to_thread(self._archive_input, file_name)
+        return cache_key, [file_name, *await asyncio.to_thread(self._fan_out, file_name, group[1:])]
+
+    async def _generate_group(self, client, user_prompt: str, group: list[str], cache_key: str | None) -> list[str]:
+        file_name = group[0]
+        load = partial(self._load_input, file_name)
+        result = await self._execute_edit_request_async(client, user_prompt, load)
+        if result is None:
+            if not self.cancelled:
+                logger.error("Failed to generate avatar for: %s", ", ".join(group))
+            return []
+        # Decoding and writing off the event loop keeps the other requests moving
+        if await asyncio.to_thread(self._store_avatar, file_name, result, cache_key) is None:
+            return []
+        return [file_name, *await asyncio.to_thread(self._fan_out, file_name, group[1:])]
+
+    async def _generate_pack(
+        self, client, user_prompt: str, pending: list[tuple[list[str], str | None]]
+    ) -> list[str] | None:
+        """Generate several groups' avatars with one request, tiling their inputs onto one canvas.
+
+        :param pending: (group, cache key) for each group in the pack.
+        :type pending: list[tuple[list[str], str or None]]
+        :returns: Names of the input files whose avatars were saved, or None if the request failed or
+            the model didn't keep the grid, and the groups should be sent one by one instead.
+        :rtype: list[str] or None
+        """
+        names = [group[0] for group, _ in pending]
+        tiles = []
+
+        def load():
+            upload, placed = self._load_pack(names)
+            tiles[:] = placed
+            return upload
+
+        prompt = packed_prompt(user_prompt, len(names))
+        result = await self._execute_edit_request_async(client, prompt, load)
+        if result is None:
+            if self.cancelled:
+                return []
+            logger.warning("The packed request for %s failed, sending them one by one", ", ".join(names))
+            return None
+        crops = await asyncio.to_thread(self._split_pack, result, tiles)
+        if crops is None:
+            logger.warning("The packed result for %s didn't keep its grid, sending them one by one", ", ".join(names))
+            return None
+
+        self.tile_maps.append(tiles)
+        logger.info("Split one packed result into %s", ", ".join(f"{tile.source} {tile.box}" for tile in tiles))
+        saved = []
+        for group, cache_key in pending:
+            if await asyncio.to_thread(self._store_tile, group[0], crops[group[0]], cache_key) is not None:
+                saved += [group[0], *await asyncio.to_thread(self._fan_out, group[0], group[1:])]
+        return saved
+
+    async def _plan_packs(self, groups: list[list[str]]) -> list[list[list[str]]]:
+        """Decide which groups share a packed request, when packing is on.
+
+        :returns: The groups for each request.
+        :rtype: list[list[list[str]]]
+        """
+        if self.pack_size is None or len(groups) < 2:
+            return [[group] for group in groups]
+
+        sizes = await asyncio.gather(*(asyncio.to_thread(self._image_size, group[0]) for group in groups))
+        by_name = {group[0]: group for group in groups}
+        requests = [[group] for group, size in zip(groups, sizes) if size is None]
+        sized = {group[0]: size for group, size in zip(groups, sizes) if size is not None}
+        for names in plan_packs(sized, self.pack_size, AVATAR_PACK_MAX_SIDE):
+            requests.append([by_name[name] for name in names])
+
+        packs = [request for request in requests if len(request) > 1]
+        if packs:
+            logger.info("Packing %d small inputs into %d requests", sum(map(len, packs)), len(packs))
+        return requests
+
+    def _image_size(self, file_name: str) -> tuple[int, int] | None:
+        try:
+            with Image.open(f"{self.input_dir}/{file_name}") as image:
+                return image.size
+        except (OSError, ValueError) as e:
+            logger.debug("Not packing %s, it couldn't be read: %s", file_name, e)
+            return None
+
+    def _load_pack(self, names: list[str]) -> tuple[tuple[str, bytes, str], list[Tile]]:
+        """Tile inputs onto one canvas for upload, like _load_input does for one.
+
+        :returns: The upload as (file name, contents, MIME type), and where each input was placed.
+        :rtype: tuple[tuple[str, bytes, str], list[Tile]]
+        """
+        sources = []
+        for name in names:
+            with Image.open(f"{self.input_dir}/{name}") as image:
+                sources.append((name, ImageOps.exif_transpose(image)))
+        canvas, tiles = compose(sources, AVATAR_UPLOAD_SIZE)
+        buffer = io.BytesIO()
+        canvas.save(buffer, "PNG")
+        upload_name = "+".join(os.path.splitext(name)[0] for name in names) + ".png"
+        return prepare_upload(upload_name, buffer.getvalue()), tiles
+
+    def _split_pack(self, returned_image, tiles: list[Tile]) -> dict[str, Image.Image] | None:
+        """Crop each input's avatar from a packed result, or None if the result failed its quality check."""
+        with Image.open(io.BytesIO(base64.b64decode(returned_image.b64_json))) as result:
+            if not grid_intact(result, AVATAR_UPLOAD_SIZE):
+                return None
+            return split(result, tiles)
 
-    def _get_input_files(self) -> list:
-        self.input_files = [
-            open(f"{IMAGE_DIR}/{file}", "rb") for file in os.listdir(IMAGE_DIR) if self._is_valid_file_type(file)
-        ]
-        return self.input_files
-
-    def _close_input_files(self) -> None:
-        for file in self.input_files:
-            file.close()
-
-    def _execute_model_requests(self, user_prompt: str, input_images: list) -> list:
-        processed_images = []
-        # Bind to local var because super() doesn't resolve correctly inside threads
-        edit_request = self._execute_edit_request
-
-        # Make concurrent api calls to prevent waiting on sequential completion
-        # Limit workers to avoid rate limiting when hitting the api with too many images
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = {}
-            for image in input_images:
-                future = executor.submit(edit_request, user_prompt, image)
-                file_name = image.name.split("/")[-1]
-                futures[future] = file_name
-
-            for future in as_completed(futures):
-                file_name = futures[future]
-                result = future.result()
-
-                if result is None:
-                    logger.error("Failed to generate avatar for: %s", file_name)
-                    continue
-
-                processed_images.append((file_name, result))
-
-        return processed_images
-
-    def _save_avatars(self, processed_data: list[tuple]):
-        for input_name, returned_image in processed_data:
-            image_base64 = returned_image.b64_json
-            image_bytes = base64.b64decode(image_base64)
-            input_stem = os.path.splitext(input_name)[0]
-            output_filename = f"{input_stem}_avatar.png"
-            with open(f"{PROCESSED_DIR_AVATAR}/{output_filename}", "wb") as f:
-                f.write(image_bytes)
-            logger.info("Saved avatar: %s", output_filename)
+    async def _group_duplicates(self, input_files: list[str]) -> list[list[str]]:
+        """Group inputs that are the same picture, so each group needs only one request.
+
+        The largest file of each group, usually the best quality copy, is the one sent.
+        Inputs that can't be hashed are sent on their own, to fail or succeed as usual.
+
+        :returns: Groups of input names, the one to send first.
+        :rtype: list[list[str]]
+        """
+        if self.dedupe_distance is None or len(input_files) < 2:
+            return [[file_name] for file_name in input_files]
+
+        hashed = await asyncio.gather(*(asyncio.to_thread(self._signature, name) for name in input_files))
+        signatures = {name: sig for name, sig, _ in sorted(hashed, key=lambda item: -item[2]) if sig is not None}
+        groups = [[name] for name, sig, _ in hashed if sig is None]
+        for group in group_duplicates(signatures, self.dedupe_distance):
+            for duplicate, bits in group[1:]:
+                logger.info("%s looks like %s (hashes %d bits apart), reusing its avatar", duplicate, group[0][0], bits)
+            groups.append([name for name, _ in group])
+
+        if len(groups) < len(input_files):
+            logger.info("Deduplicated %d inputs into %d requests", len(input_files), len(groups))
+        return groups
+
+    def _signature(self, file_name: str) -> tuple[str, Signature | None, int]:
+        path = f"{self.input_dir}/{file_name}"
+        try:
+            return file_name, signature(path), os.path.getsize(path)
+        except (OSError, ValueError) as e:
+            logger.debug("Not deduplicating %s, it couldn't be hashed: %s", file_name, e)
+            return file_name, None, 0
+
+    def _fan_out(self, file_name: str, duplicates: list[str]) -> list[str]:
+        """Copy the avatar generated for one input to its duplicates and archive them.
+
+        :returns: The duplicates that got a copy.
+        :rtype: list[str]
+        """
+        copied = []
+        for duplicate in duplicates:
+            try:
+                shutil.copyfile(self._avatar_path(file_name), self._avatar_path(duplicate))
+            except OSError as e:
+                logger.error("Failed to save avatar for %s: %s", duplicate, e)
+                continue
+            logger.info("Saved avatar for %s from duplicate %s", duplicate, file_name)
+            copied.append(duplicate)
+        self._make_circles_from_file(file_name, copied)
+        return [self._archive_input(duplicate) for duplicate in copied]
+
+    def _store_avatar(self, file_name: str, returned_image, cache_key: str | None = None) -> str | None:
+        """Save one avatar, cache it and archive its input.
+
+        :returns: The input file name, or None if the avatar couldn't be saved.
+        :rtype: str or None
+        """
+        try:
+            self._save_avatar(file_name, returned_image)
+        except OSError as e:
+            logger.error("Failed to save avatar for %s: %s", file_name, e)
+            return None
+
+        self._cache_avatar(cache_key, self._avatar_path(file_name))
+        return self._archive_input(file_name)
+
+    def _store_tile(self, file_name: str, image: Image.Image, cache_key: str | None = None) -> str | None:
+        """Save one avatar cropped from a packed result, cache it and archive its input.
+
+        :returns: The input file name, or None if the avatar couldn't be saved.
+        :rtype: str or None
+        """
+        try:
+            self._save_avatar_image(file_name, image)
+        except OSError as e:
+            logger.error("Failed to save avatar for %s: %s", file_name, e)
+            return None
+
+        self._cache_avatar(cache_key, self._avatar_path(file_name))
+        return self._archive_input(file_name)
+
+    def _archive_input(self, file_name: str) -> str:
+        if self._archive_image(file_name):
+            logger.info("Archived input image: %s", file_name)
+        return file_name
+
+    def _avatar_path(self, input_name: str) -> str:
+        input_stem = os.path.splitext(input_name)[0]
+        return f"{self.output_dir}/{input_stem}_avatar.png"
+
+    def _save_avatar(self, input_name: str, returned_image) -> None:
+        output_path = self._avatar_path(input_name)
+        if not self.remove_background and self.circle_handler is None:
+            # Nothing to post-process, so the result is streamed to disk without decoding it whole in memory
+            write_base64_png(returned_image.b64_json, output_path)
+            logger.info("Saved avatar: %s", os.path.basename(output_path))
+            return
+
+        # Post-processing needs the decoded image anyway, so it is decoded once here rather than read back from disk
+        data = decode_base64_png(returned_image.b64_json, os.path.basename(output_path))
+        with Image.open(io.BytesIO(data)) as image:
+            image.load()
+        if self.remove_background:
+            self._save_avatar_image(input_name, image)
+            return
+
+        # Only a circle to make: the PNG is saved as returned, without encoding it again
+        with staged_write(output_path) as staged_path, open(staged_path, "xb") as f:
+            f.write(data)
+        logger.info("Saved avatar: %s", os.path.basename(output_path))
+        self._make_circle(input_name, image)
+
+    def _save_avatar_image(self, input_name: str, image: Image.Image) -> None:
+        """Post-process a decoded avatar, e.g. one cropped from a packed result, and save it."""
+        if self.remove_background:
+            image = remove_background(image, AVATAR_BACKGROUND_WHITE, AVATAR_BACKGROUND_SOFTNESS)
+        output_path = self._avatar_path(input_name)
+        with staged_write(output_path) as staged_path:
+            image.save(staged_path, "PNG")
+        logger.info("Saved avatar: %s", os.path.basename(output_path))
+
+        self._make_circle(input_name, image)
+
+    def _post_processing(self) -> tuple:
+        if not self.remove_background:
+            return ()
+        return ("remove_background", AVATAR_BACKGROUND_WHITE, AVATAR_BACKGROUND_SOFTNESS)
+
+    def _make_circles_from_file(self, file_name: str, input_names: list[str]) -> None:
+        """Hand an avatar already on disk, restored from the cache or copied to duplicates, on to circles.
+
+        The avatar is read once, however many inputs it was copied to.
+        """
+        if self.circle_handler is None or not input_names:
+            return
+        avatar_path = self._avatar_path(file_name)
+        try:
+            with Image.open(avatar_path) as image:
+                image.load()
+        except OSError as e:
+            logger.error("Failed to make circle stamps from avatar %s: %s", os.path.basename(avatar_path), e)
+            return
+        for input_name in input_names:
+            self._make_circle(input_name, image)
+
+    def _make_circle(self, input_name: str, image: Image.Image) -> None:
+        """Hand a saved avatar on to circles, when configured.
+
+        The circle stamp is made from the cleaned image in memory, with no second request and no
+        re-read from disk. A circle that fails is logged, but doesn't fail the avatar.
+        """
+        if self.circle_handler is None:
+            return
+        avatar_name = os.path.basename(self._avatar_path(input_name))
+        try:
+            if self.circle_handler.process_image(input_name, image.convert("RGBA")):
+                logger.info("Made a circle stamp from avatar: %s", avatar_name)
+        except Exception:
+            logger.exception("Failed to make a circle stamp from avatar: %s", avatar_name)
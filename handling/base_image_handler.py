@@ -1,45 +1,571 @@
 """Base image handler providing common functionality for image processing."""
 
+import io
 import logging
 import os
+import sqlite3
+import time
+from concurrent.futures import as_completed
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, NamedTuple
 
+from PIL import Image as PILImage
 from PIL.Image import Image
 
+from handling.util.executors import create_executor, default_worker_count
+from handling.util.job_ledger import JobLedger
+from handling.util.leases import LeaseManager
+from handling.util.pipeline import PipelineStage, StagedPipeline
+from handling.util.recolour import create_recolour_engine
+from handling.util.result_cache import ResultCache
 from settings.init_dirs import init_directories
-from settings.static_dicts import (IMAGE_QUALITY, STANDARD_IMG_SIZE,
-                                   VALID_FORMATS)
+from settings.static_dicts import (
+    EXECUTOR_BACKEND,
+    IMAGE_DIR,
+    IMAGE_QUALITY,
+    JOB_LEDGER_ENABLED,
+    JOB_LEDGER_PATH,
+    LEASE_DIR,
+    LEASES_ENABLED,
+    MAX_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_VERSION,
+    RECOLOUR_ENGINE,
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_BYTES,
+    STANDARD_IMG_SIZE,
+    VALID_FORMATS,
+)
 
 logger = logging.getLogger(__name__)
 
+REDUCIBLE_MODES = {"L", "LA", "La", "RGB", "RGBA", "RGBa", "CMYK", "YCbCr", "LAB", "HSV", "I", "F", "PA"}
+
+
+@dataclass
+class ImageJob:
+    """One input file as it moves through the decode, transform, encode and write stages."""
+
+    file: str  # name as found in the input directory
+    name: str  # working name in the input directory once converted to png
+    stem: str  # name up to and including the first "."
+    image: Image | None = None
+    outputs: Iterable[tuple[str | None, Image]] = ()
+    failed: bool = False
+    scale: float = 1.0  # decoded size relative to the file on disk
+    cache_key: str | None = None
+    cached_codes: list | None = None  # output codes already in the result cache, when it's a hit
+    resumed: bool = False  # outputs were saved by an interrupted earlier run, only archiving is left
+    leased: bool = False  # claimed with a lease, which must still be held to save outputs and archive
+    written: list[tuple[str | None, str]] = field(default_factory=list)  # (code, destination) saved so far
+    start: float = field(default_factory=time.time)
+
+    @property
+    def needs_transform(self) -> bool:
+        return self.cached_codes is None and not self.resumed
+
+
+class EncodedOutput(NamedTuple):
+    """An output image encoded in memory, waiting to be written to its destination."""
+
+    job: ImageJob
+    code: str | None
+    destination: str
+    data: bytes
+
+
+_worker_handler = None  # the handler copy owned by a process pool worker
+
+
+def _install_worker_handler(handler) -> None:
+    global _worker_handler  # pylint: disable=global-statement
+    _worker_handler = handler
+
+
+def _process_in_worker(file: str) -> tuple[int, dict]:
+    return _worker_handler._process_file(file)  # pylint: disable=protected-access
+
 
 class BaseImageHandler:
-    """Base class for all image handlers."""
+    """Base class for all image handlers.
 
-    def __init__(self):
-        init_directories()  # init prerequisite directories that are gitignored
+    :param input_dir: Directory to take images from. Processed originals are moved to its zArchive folder.
+    :type input_dir: str
+    :param output_dir: Directory to save outputs to. Defaults to the handler's folder under img/Processed.
+    :type output_dir: str or None
+    """
+
+    default_output_dir = None  # where outputs go unless another directory is given, set by each handler
+
+    def __init__(self, input_dir: str = IMAGE_DIR, output_dir: str | None = None):
+        self.input_dir = input_dir
+        self.archive_dir = f"{input_dir}/zArchive"
+        self.output_dir = output_dir or self.default_output_dir
+        if input_dir == IMAGE_DIR and output_dir is None:
+            init_directories()  # init prerequisite directories that are gitignored
+        else:
+            self._init_directories()
+        self.open_destination = True  # open the output folder in Explorer once a batch is done
         self.valid_formats = VALID_FORMATS
         self.quality_val = IMAGE_QUALITY
         self.standard_size = STANDARD_IMG_SIZE
+        self.recolour_engine = create_recolour_engine(RECOLOUR_ENGINE)
+        self.result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES) if RESULT_CACHE_ENABLED else None
+        self.ledger = JobLedger(JOB_LEDGER_PATH) if JOB_LEDGER_ENABLED else None
+        self.ledger_run = None  # id of the ledger run files are being discovered into
+        self.leases = None
+        if LEASES_ENABLED:
+            self.enable_leases()
+        self.executor_backend = EXECUTOR_BACKEND
+        self.max_workers = MAX_WORKERS
+        self.pipeline = None  # the running StagedPipeline, to watch its queue depths
+        self.batch_stats = {}  # counters from the last execute(), summed across workers
         # Current values
         self.curr_width = 0
         self.curr_height = 0
         self.curr_canvas_size = (0, 0)
-        self.img_dir = os.listdir("./img")
+        self.img_dir = os.listdir(self.input_dir)
 
     def execute(self):
-        """Process all valid input images sequentially."""
+        """Process all valid input images on the configured executor backend.
+
+        Each file is independent, so they are handed to the executor one call of
+        _handler_function each. Anything the handler function fails to catch itself is
+        logged against its file here, so one bad file never stops the rest of the batch.
+        The "pipeline" backend instead streams the files through the staged pipeline.
+        Progress is recorded in the job ledger, so a rerun after an interruption only
+        archives files whose outputs were already saved. Counters from _collect_stats are totalled across workers into batch_stats.
+        """
         imgs = self._get_input_files()
-        for img in imgs:
-            self._handler_function(img)
+        start = time.time()
+        self._reset_stats()
+        self.discover(imgs)
+
+        if self.executor_backend == "pipeline":
+            self._run_pipeline(imgs)
+            self._log_batch(len(imgs), "pipeline", start, self._collect_stats())
+            return
+
+        executor, task = self.open_executor()
+        worker_stats = {}
+        with executor:
+            futures = {executor.submit(task, img): img for img in imgs}
+            for future in as_completed(futures):
+                try:
+                    pid, stats = future.result()
+                except Exception:
+                    logger.exception("Unexpected error processing %s", futures[future])
+                    continue
+                # Counters only grow within a worker, so the highest seen is that worker's total
+                totals = worker_stats.setdefault(pid, {})
+                for key, value in stats.items():
+                    totals[key] = max(totals.get(key, 0), value)
+
+        batch_stats = {}
+        for totals in worker_stats.values():
+            for key, value in totals.items():
+                batch_stats[key] = batch_stats.get(key, 0) + value
+        self._log_batch(len(imgs), f"{self.executor_backend} executor", start, batch_stats)
+
+    def enable_leases(self) -> None:
+        """Claim each file with a lease in the input folder before processing it.
+
+        Lets several machines (or several app instances) drain the same shared folder
+        without two of them renaming, processing or archiving the same file.
+        """
+        self.leases = LeaseManager(f"{self.input_dir}/{LEASE_DIR}")
+
+    def discover(self, files: list[str], new_run: bool = True) -> None:
+        """Record the files about to be processed in the ledger, logging how many are new or changed.
+
+        :param files: Names of the files in the input directory about to be processed.
+        :type files: list[str]
+        :param new_run: Start a new ledger run for them, as each batch does. Watch mode instead adds every
+            file to one run per session, as it settles.
+        :type new_run: bool
+        """
+        if self.ledger is None:
+            return
+        entries = []
+        for file in files:
+            try:
+                stat = os.stat(f"{self.input_dir}/{file}")
+            except OSError:
+                continue
+            entries.append((file, self.working_name(file), stat.st_size, stat.st_mtime_ns))
+        try:
+            handler = type(self).__name__
+            if new_run or self.ledger_run is None:
+                self.ledger_run = self.ledger.start_run(handler)
+            changed = self.ledger.discover(handler, self._ledger_dir(), self.ledger_run, entries)
+        except sqlite3.Error:
+            logger.exception("Failed to record discovered files in the job ledger")
+            return
+        logger.info("%d of %d files are new or changed since the last run", len(changed), len(entries))
+
+    def _ledger_dir(self) -> str:
+        """The input folder as the ledger knows it, so runs on different folders keep separate records."""
+        return os.path.realpath(self.input_dir)
+
+    def _record(self, job: ImageJob, state: str) -> None:
+        """Move the job on to a new state in the ledger. Ledger trouble never stops processing."""
+        if self.ledger is None:
+            return
+        try:
+            self.ledger.mark(type(self).__name__, self._ledger_dir(), job.name, state)
+        except sqlite3.Error:
+            logger.exception("Failed to record %s as %s in the job ledger", job.name, state)
+
+    def open_executor(self, backend: str | None = None):
+        """Create a worker pool for this handler, along with the task to submit each file name to.
+
+        :param backend: "serial", "thread" or "process". Defaults to the handler's executor_backend.
+        :type backend: str or None
+        :returns: The executor, to be used as a context manager, and the task. The task returns the worker's
+            process id and running counters for the file it handled.
+        :rtype: tuple[Executor, Callable[[str], tuple[int, dict]]]
+        """
+        backend = backend or self.executor_backend
+        if backend == "process":
+            # Hand each worker process one copy of the handler up front, so state like caches lives
+            # for the whole batch instead of being pickled afresh with every file
+            executor = create_executor(backend, self.max_workers, initializer=_install_worker_handler, initargs=(self,))
+            return executor, _process_in_worker
+        return create_executor(backend, self.max_workers), self._process_file
+
+    def _log_batch(self, count: int, backend: str, start: float, batch_stats: dict) -> None:
+        if self.result_cache is not None:
+            self.result_cache.evict()
+        self.batch_stats = batch_stats
+        logger.info("Processed %d files with the %s in %.2fs", count, backend, time.time() - start)
+        if batch_stats:
+            logger.info("Batch stats: %s", batch_stats)
+
+    def process_image(self, name: str, image: Image) -> bool:
+        """Run an image that is already in memory through this handler's transform and save its outputs.
+
+        Lets another handler pass its result straight on, e.g. a new avatar to CircleHandler, without
+        writing it out and reading it back. Nothing is renamed, cached, recorded or archived, since
+        the image has no file in the input directory.
+
+        :param name: File name the outputs are named after, as if the image had been dropped into the input directory.
+        :type name: str
+        :param image: The decoded image.
+        :type image: Image
+        :returns: Whether every output was saved.
+        :rtype: bool
+        """
+        working_name = self.working_name(name)
+        job = ImageJob(file=name, name=working_name, stem=working_name[:-3], image=image)
+        for code, output in self._transform(job):
+            self._save_output(job, output, code)
+        return not job.failed
+
+    def _process_file(self, file: str) -> tuple[int, dict]:
+        """Handle one file on an executor worker, reporting that worker's running counters.
+
+        :param file: Name of the file in the input directory.
+        :type file: str
+        :returns: The worker's process id and its counters so far.
+        :rtype: tuple[int, dict]
+        """
+        self._handler_function(file)
+        return os.getpid(), self._collect_stats()
+
+    def _collect_stats(self) -> dict[str, int]:
+        """Counters worth reporting for a batch, e.g. cache hits. Extend in a child class."""
+        if self.result_cache is None:
+            return {}
+        return self.result_cache.stats()
+
+    def _reset_stats(self) -> None:
+        """Zero the counters reported by _collect_stats before a batch starts."""
+        if self.result_cache is not None:
+            self.result_cache.reset_stats()
 
     def _handler_function(self, file):
-        """Defines the work to be done by the execute method. Requires an override from a child class.
+        """Run every stage for a single file back to back.
 
         :param file: Each image in the img generator.
-        :type file: Image
+        :type file: str
+        """
+        job = self._decode(file)
+        if job is None:
+            return
+
+        try:
+            if job.needs_transform:
+                for code, image in self._transform(job):
+                    self._save_output(job, image, code)
+            self._finish(job)
+        except Exception:
+            logger.exception("Unexpected error processing %s", job.name)
+            self._release(job.name)
+
+    def _run_pipeline(self, files: list[str]) -> None:
+        """Stream files through decode, transform, encode and write stages running concurrently.
+
+        Pixel work and PNG encoding release the GIL, so those stages get a thread per core.
+        Writing stays on one thread so each file is only archived after all of its outputs.
+        """
+        workers = self.max_workers or default_worker_count()
+        self.pipeline = StagedPipeline(
+            [
+                PipelineStage("decode", self._decode_stage),
+                PipelineStage("transform", self._transform_stage, workers=workers),
+                PipelineStage("encode", self._encode_stage, workers=workers),
+                PipelineStage("write", self._write_stage),
+            ],
+            queue_size=PIPELINE_QUEUE_SIZE,
+        )
+        self.pipeline.run(files)
+        logger.info("Pipeline stage stats: %s", self.pipeline.stats())
+
+    def _decode(self, file: str) -> ImageJob | None:
+        """Convert the file to png in the input directory and decode it into memory.
+
+        When _decode_target asks for less than full resolution, JPEGs are decoded at a reduced
+        scale and other formats are box-reduced straight after decoding, so later pixel work
+        scales with the output size. The reduction is recorded on the job as its scale.
+
+        :param file: Name of the file in the input directory.
+        :type file: str
+        :returns: The job for this file, or None if it couldn't be opened.
+        :rtype: ImageJob or None
+        """
+        name = self.working_name(file)
+        job = ImageJob(file=file, name=name, stem=name[:-3])
+
+        if not self._claim(job):
+            return None
+
+        # rename the file and change extension to png so that we can apply transparent masks
+        if not self._rename_file(file, job.name):
+            self._release(job.name)
+            return None
+
+        if self._ledger_state(job) == "saved":
+            job.resumed = True
+            logger.info("%s was saved by an interrupted run, archiving it without reprocessing", job.name)
+            return job
+        self._record(job, "renamed")
+
+        try:
+            source = f"{self.input_dir}/{job.name}"
+            if self.result_cache is not None:
+                with open(source, "rb") as f:
+                    data = f.read()
+                job.cache_key = self.result_cache.make_key(data, *self._cache_params(job))
+                job.cached_codes = self.result_cache.lookup(job.cache_key)
+                if job.cached_codes is not None:
+                    return job  # nothing to decode, the outputs are copied from the cache in _finish
+                source = io.BytesIO(data)
+
+            image = PILImage.open(source)
+            target = self._decode_target(job, image.size)
+            if target is not None:
+                image = self._reduce_to(job, image, target)
+            image.load()
+            job.image = image
+        except Exception:
+            logger.exception("Unexpected error processing %s", job.name)
+            self._release(job.name)
+            return None
+        return job
+
+    def _claim(self, job: ImageJob) -> bool:
+        """Take the lease on a file when sharing the input folder, making sure it's still there to process."""
+        if self.leases is None:
+            return True
+        if not self.leases.acquire(job.name):
+            logger.info("%s is being processed by another node", job.file)
+            return False
+        job.leased = True
+        if not os.path.exists(f"{self.input_dir}/{job.file}"):
+            # Another node finished it between our listing and taking the lease
+            logger.info("%s was already processed by another node", job.file)
+            self.leases.release(job.name)
+            return False
+        return True
+
+    def _holds_lease(self, job: ImageJob) -> bool:
+        """Whether the job may still write: it isn't leased, or no other node has taken its lease over."""
+        return not job.leased or self.leases.still_held(job.name)
+
+    def _release(self, name: str) -> None:
+        if self.leases is not None:
+            self.leases.release(name)
+
+    @staticmethod
+    def working_name(file: str) -> str:
+        """Name the file has in the input directory while it's processed: everything up to the first "." plus png."""
+        return f"{file[: file.index('.') + 1]}png"
+
+    def _ledger_state(self, job: ImageJob) -> str | None:
+        if self.ledger is None:
+            return None
+        try:
+            return self.ledger.state(type(self).__name__, self._ledger_dir(), job.name)
+        except sqlite3.Error:
+            logger.exception("Failed to read the job ledger state of %s", job.name)
+            return None
+
+    def _cache_params(self, job: ImageJob) -> list:
+        """Everything besides the input bytes that decides a job's outputs, for its result cache key.
+
+        Bump PIPELINE_VERSION whenever processing changes, so stale outputs aren't reused.
+
+        :param job: The file being processed.
+        :type job: ImageJob
+        :returns: JSON-serialisable values to fold into the key.
+        :rtype: list
+        """
+        colour_code = job.stem[job.stem.index("&") : -1] if job.stem.count("&") == 1 else None
+        return [type(self).__name__, colour_code, self.standard_size, PIPELINE_VERSION]
+
+    def _decode_target(self, job: ImageJob, size: tuple[int, int]) -> tuple[int, int] | None:
+        """Smallest size the decoded image can have without losing output quality.
+
+        :param job: The file being decoded.
+        :type job: ImageJob
+        :param size: Full size of the image on disk.
+        :type size: tuple[int, int]
+        :returns: The minimum decoded size, or None to decode at full resolution (the default).
+        :rtype: tuple[int, int] or None
+        """
+        return None
+
+    def _reduce_to(self, job: ImageJob, image: Image, target: tuple[int, int]) -> Image:
+        """Shrink an opened image towards, but never below, the target size."""
+        original_width = image.width
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale; draft() never goes below the target
+        image.draft(None, target)
+        factor = min(image.width // target[0], image.height // target[1])
+        if factor >= 2:
+            if image.mode not in REDUCIBLE_MODES:
+                # reduce() can't average palette indices or single bits, so those are expanded first
+                image = image.convert("RGBA")
+            image = image.reduce(factor)
+        job.scale = image.width / original_width
+        return image
+
+    def _transform(self, job: ImageJob) -> Iterable[tuple[str | None, Image]]:
+        """Defines the pixel work for one file. Requires an override from a child class.
+
+        :param job: The decoded file.
+        :type job: ImageJob
+        :returns: Pairs of (output code, image), where the code picks the destination in _output_path.
+            May be lazy, so each image must be saved before the next one is taken.
+        :rtype: Iterable[tuple[str or None, Image]]
         """
         raise NotImplementedError
 
+    def _output_path(self, job: ImageJob, code: str | None) -> str:
+        """Defines where each output is saved. Requires an override from a child class.
+
+        :param job: The file the output came from.
+        :type job: ImageJob
+        :param code: The output code yielded by _transform.
+        :type code: str or None
+        :returns: Path to save the output to.
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def _save_output(self, job: ImageJob, image: Image, code: str | None) -> None:
+        """Save one output straight to disk, flagging the job as failed if it can't be."""
+        if not self._holds_lease(job):
+            return
+        destination = self._output_path(job, code)
+        try:
+            image.save(destination, quality=self.quality_val)
+            job.written.append((code, destination))
+        except Exception:
+            job.failed = True
+            logger.error("Failed to save image: %s", destination)
+
+    def _finish(self, job: ImageJob) -> None:
+        """Fill in outputs from the result cache or add fresh ones to it, then archive the original."""
+        if not self._holds_lease(job):
+            # Another node took the file over after our lease expired, so it saves and archives it
+            logger.error("%s was left to the node that took over its lease", job.name)
+            return
+        if job.cached_codes is not None:
+            try:
+                self.result_cache.restore(job.cache_key, [self._output_path(job, code) for code in job.cached_codes])
+                logger.info("%s outputs copied from the result cache", job.name)
+            except OSError:
+                job.failed = True
+                logger.exception("Failed to restore cached outputs for %s", job.name)
+        elif job.cache_key is not None and not job.failed:
+            try:
+                self.result_cache.store(job.cache_key, job.written)
+            except OSError:
+                logger.exception("Failed to add %s to the result cache", job.name)
+
+        if job.failed:
+            logger.error("%s was not archived because some outputs failed to save", job.name)
+            self._release(job.name)
+            return
+        self._record(job, "saved")
+        if self._archive_image(job.name):
+            self._record(job, "archived")
+        self._release(job.name)
+        logger.info("%s processed in %.2fs", job.name, time.time() - job.start)
+
+    def _decode_stage(self, file: str) -> Iterator[ImageJob]:
+        job = self._decode(file)
+        if job is not None:
+            yield job
+
+    def _transform_stage(self, job: ImageJob) -> Iterator[ImageJob]:
+        if job.needs_transform:
+            # _transform can be lazy, so it is drawn out here for the pixel work to happen in this stage
+            # and be timed as such. Fan-outs repaint one canvas per colour, so each output is a copy
+            try:
+                job.outputs = [(code, image.copy()) for code, image in self._transform(job)]
+            except Exception:
+                # The job still goes on to the write stage, which reports it and lets go of its lease
+                job.failed = True
+                job.outputs = ()
+                logger.exception("Unexpected error processing %s", job.name)
+        yield job
+
+    def _encode_stage(self, job: ImageJob) -> Iterator[EncodedOutput | ImageJob]:
+        for code, image in job.outputs:
+            destination = self._output_path(job, code)
+            try:
+                buffer = io.BytesIO()
+                image.save(buffer, format=self._format_for(destination), quality=self.quality_val)
+                yield EncodedOutput(job, code, destination, buffer.getvalue())
+            except Exception:
+                job.failed = True
+                logger.error("Failed to save image: %s", destination)
+        job.outputs = ()
+        # The job itself follows its outputs so the write stage knows when it can archive
+        yield job
+
+    def _write_stage(self, item: EncodedOutput | ImageJob) -> tuple:
+        if isinstance(item, ImageJob):
+            self._finish(item)
+            return ()
+        if not self._holds_lease(item.job):
+            return ()
+        try:
+            with open(item.destination, "wb") as f:
+                f.write(item.data)
+            item.job.written.append((item.code, item.destination))
+        except OSError:
+            item.job.failed = True
+            logger.error("Failed to save image: %s", item.destination)
+        return ()
+
+    @staticmethod
+    def _format_for(destination: str) -> str:
+        extension = os.path.splitext(destination)[1].lower()
+        return PILImage.registered_extensions()[extension]
+
     def _get_input_files(self) -> list[str]:
         """Loops through the img directory to identify suitable images.
 
@@ -59,21 +585,29 @@ class BaseImageHandler:
         :returns: Recoloured image.
         :rtype: Image
         """
-        pixel_data = image.get_flattened_data()
-        new_image = []
+        return self.recolour_engine.colour_sub(image, colour)
 
-        for data in pixel_data:
-            if data[3] != 0 and data[0] < 200:
-                new_image.append(colour)
-            else:
-                new_image.append(data)
+    def _colour_fan_out(self, image: Image, colours: dict):
+        """Recolour one image into several colours from a single ink mask.
 
-        image.putdata(new_image)
-        return image
+        :param image: The image to recolour. The same object is repainted for each colour.
+        :type image: Image
+        :param colours: Mapping of colour code to colour tuple (R,G,B,Opacity).
+        :type colours: dict
+        :returns: Iterator of (colour code, recoloured image) pairs, to be consumed one at a time.
+        :rtype: Iterator[tuple[str, Image]]
+        """
+        return self.recolour_engine.fan_out(image, colours)
+
+    def _init_directories(self) -> None:
+        """Create the archive and output directories when they aren't the default img/ tree."""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        if self.output_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
 
     def _open_save_destination(self, processed_dir: str) -> None:
         """Open save destination folder in file explorer."""
-        if os.name == "nt":
+        if self.open_destination and os.name == "nt":
             abs_path = os.path.realpath(processed_dir)
             try:
                 os.startfile(abs_path)  # pylint: disable=no-member
@@ -83,22 +617,29 @@ class BaseImageHandler:
     def _rename_file(self, file: str, new_name: str) -> bool:
         """Rename file from old to new name."""
         try:
-            os.rename(f"img/{file}", f"img/{new_name}")
+            os.rename(f"{self.input_dir}/{file}", f"{self.input_dir}/{new_name}")
             return True
         except FileExistsError:
             logger.error("Rename failed, file already exists: %s", new_name)
             return False
+        except FileNotFoundError:
+            logger.error("Rename failed, %s is no longer in %s", file, self.input_dir)
+            return False
 
-    def _archive_image(self, file_name: str):
-        """Moves the image to the archive folder (currently hardcoded).
+    def _archive_image(self, file_name: str) -> bool:
+        """Moves the image to the archive folder.
 
-        :param file_name: Name of file under img/ to archive
+        :param file_name: Name of file in the input directory to archive
         :type file_name: str
+        :returns: Whether the image was archived.
+        :rtype: bool
         """
         try:
-            os.replace(f"img/{file_name}", f"img/zArchive/{file_name}")
+            os.replace(f"{self.input_dir}/{file_name}", f"{self.archive_dir}/{file_name}")
+            return True
         except OSError as e:
             logger.error("Failed to archive %s: %s", file_name, e)
+            return False
 
     def _is_valid_file_type(self, file_name: str):
         if not file_name:
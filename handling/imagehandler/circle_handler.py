@@ -1,39 +1,39 @@
 """Circle handler for processing circular stamps with color themes."""
 
 import logging
-import os
-import time
+import math
 
-from PIL import Image, ImageDraw
+from PIL import Image
 
 from handling.base_image_handler import BaseImageHandler
-from settings.static_dicts import COLOURS, PROCESSED_DIR_CIRCLE
+from handling.util.mask_cache import MaskCache
+from settings.static_dicts import (
+    CIRCLE_MASK_ANTIALIAS,
+    COLOURS,
+    IMAGE_DIR,
+    MASK_CACHE_MAX_BYTES,
+    MASK_SUPERSAMPLE,
+    PROCESSED_DIR_CIRCLE,
+)
 
 logger = logging.getLogger(__name__)
 
+FRAME_PADDING = 30  # white border kept around the longest side of the image, in source pixels
+
 
 class CircleHandler(BaseImageHandler):
     """Extends ImageHandler to specifically process circle shaped images used in the small, round stamp handles."""
 
-    def __init__(self):
-        super().__init__()
+    default_output_dir = PROCESSED_DIR_CIRCLE
+
+    def __init__(self, input_dir: str = IMAGE_DIR, output_dir: str | None = None):
+        super().__init__(input_dir, output_dir)
+        self.mask_antialias = CIRCLE_MASK_ANTIALIAS
+        self.mask_cache = MaskCache(MASK_CACHE_MAX_BYTES, supersample=MASK_SUPERSAMPLE)
 
     def execute(self):
         super().execute()
-        self._open_save_destination(PROCESSED_DIR_CIRCLE)
-
-    def _save_image(self, image_to_save, file_name_with_extension):
-        """Saves the image for circle processing into a Circles subfolder.
-
-        :param image_to_save: Image to save.
-        :type image_to_save: Image
-        :param file_name_with_extension: New file name, with the filetype extension (e.g. png).
-        :type file_name_with_extension: str
-        """
-        try:
-            image_to_save.save(f"img/Processed/Circles/resized_{file_name_with_extension}", quality=self.quality_val)
-        except Exception:
-            logger.error("Failed to save image: %s", file_name_with_extension)
+        self._open_save_destination(self.output_dir)
 
     def _standardise_size(self, cropped_image: Image):
         """Resize the given image to the configured standard size.
@@ -45,74 +45,89 @@ class CircleHandler(BaseImageHandler):
         """
 
         # if the cfg size is not specified, just take the smallest dimension for best resolution
-        if self.standard_size is None:
-            self.standard_size = (min(cropped_image.size), min(cropped_image.size))
+        # (kept local so one image's size doesn't leak into the rest of a parallel batch)
+        target_size = self.standard_size
+        if target_size is None:
+            target_size = (min(cropped_image.size), min(cropped_image.size))
 
         try:
-            res = cropped_image.resize(self.standard_size)
+            res = cropped_image.resize(target_size)
             return res
         except Exception:
             logger.error("Failed to standardise image size")
             return None
 
-    def _handler_function(self, file):
-        # Convert valid formats to png to allow RGBA
-        start = time.time()
-        no_extension = file[: file.index(".") + 1]
-        as_png = f"{no_extension}png"
-
-        # rename the file and change extension to png so that we can apply transparent masks
-        rename_success = self._rename_file(file, as_png)
-        if not rename_success:
-            return
-
-        image = Image.open(f"img/{as_png}")
+    def _decode_target(self, job, size):
+        # Only coloured stamps are brought down to the configured size, B&W keeps full resolution
+        if self.standard_size is None or job.stem.count("&") != 1:
+            return None
 
-        try:
-            cropped = self.resize(image)
-            is_coloured: bool = self.check_is_coloured(no_extension)
-
-            if is_coloured:
-                colour_extension = self.determine_colour_extension(no_extension)
-                # Convert the current picture into one of the standard colours
-                final_image = self.recolour(cropped, no_extension, colour_extension)
-                if final_image:
-                    self._save_image(final_image, as_png)
-            else:
-                darkened_image = self.recolour_darken(cropped)
-                self._save_image(darkened_image, f"{no_extension}png")
-            self._archive_image(f"{no_extension}png")
-
-            logger.info("%s processed in %.2fs", as_png, time.time() - start)
+        width, height = size
+        scale = max(self.standard_size) / (max(width, height) + 2 * FRAME_PADDING)
+        if scale >= 1:
+            return None
+        return max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale))
 
-        except Exception:
-            logger.exception("Unexpected error processing %s", as_png)
+    def _transform(self, job):
+        cropped = self.resize(job.image, scale=job.scale)
+        is_coloured: bool = self.check_is_coloured(job.stem)
 
-    def resize(self, image):
-        """Resize image maintaining aspect ratio."""
-        # set sizes and calculate max dimensions for canvas
+        if not is_coloured:
+            return [(None, self.recolour_darken(cropped))]
+
+        if self.standard_size is not None:
+            # Bring the frame down to its output size once, here, so recolouring works on output pixels only.
+            # Without a configured size the frame is already square at its smallest dimension, so it's left as is
+            cropped = self._standardise_size(cropped)
+
+        colour_extension = self.determine_colour_extension(job.stem)
+        if colour_extension == "&E":
+            # make a copy for all colours instead of the &E original picture
+            return self.recolour_create_each_colour(cropped, job.stem)
+
+        # Convert the current picture into one of the standard colours
+        return [(None, self.recolour(cropped, job.stem, colour_extension))]
+
+    def _output_path(self, job, code):
+        """Circles are saved into the Circles subfolder, with the colour code appended for &E variants."""
+        if code is None:
+            return f"{self.output_dir}/resized_{job.name}"
+        return f"{self.output_dir}/resized_{job.stem}{code}.png"
+
+    def resize(self, image, scale=1.0):
+        """Resize image maintaining aspect ratio.
+
+        :param image: Image to frame.
+        :type image: Image
+        :param scale: How far the image was reduced while decoding, so the padding shrinks with it.
+        :type scale: float
+        """
+        # The frame is a square with FRAME_PADDING of white around the longest side. This is the
+        # 50px-padded canvas with 20px cropped off each edge, allocated directly at its final size
         curr_width, curr_height = image.size
-        max_dimension = max(curr_width + 100, curr_height + 100)
-        curr_canvas_size = (max_dimension, max_dimension)
+        padding = round(FRAME_PADDING * scale)
+        frame_dimension = max(curr_width, curr_height) + 2 * padding
 
-        # instantiate canvas and paste in image and a border circle
-        canvas = Image.new("RGBA", curr_canvas_size, (255, 255, 255, 255))
-        ImageDraw.Draw(canvas)
-        canvas.paste(image, (50, 50))
+        cropped = Image.new("RGBA", (frame_dimension, frame_dimension), (255, 255, 255, 255))
+        cropped.paste(image, (padding, padding))
 
-        # crop image with circle
-        cropped = canvas.crop((20, 20, max_dimension - 20, max_dimension - 20))
-
-        # create transparent mask for the cropped image
-        mask = Image.new("L", cropped.size)
-        mask_draw = ImageDraw.Draw(mask)
-        width, height = cropped.size
-        mask_draw.ellipse((2.5, 2.5, width - 5, height - 5), fill=255)
+        # transparent mask for the cropped image, shared by every image of the same size
+        mask = self.mask_cache.get(cropped.size, antialias=self.mask_antialias)
 
         # add transparent background to mask
         cropped.putalpha(mask)
         return cropped
 
+    def _cache_params(self, job):
+        return super()._cache_params(job) + [self.mask_antialias]
+
+    def _collect_stats(self):
+        return super()._collect_stats() | self.mask_cache.stats()
+
+    def _reset_stats(self):
+        super()._reset_stats()
+        self.mask_cache.reset_stats()
+
     def check_is_coloured(self, filename_without_extension):
         """Check if filename contains color suffix."""
         is_coloured = filename_without_extension.count("&") == 1
@@ -153,27 +168,15 @@ class CircleHandler(BaseImageHandler):
                 cropped = self._colour_sub(cropped, COLOURS["O"])  # stampede orange
             case "&Y":
                 cropped = self._colour_sub(cropped, COLOURS["Y"])  # stampede yellow
-            case "&E":  # make a copy for all colours
-                self.recolour_create_each_colour(cropped, filename_without_extension)
-                # exit out so we don't save the &E original picture in work handler
-                return None
-
-        # STANDARDISE THE SIZES OF STAMPS
-        # post-recolour, we want to bring the images down to consistent dimensions
-        cropped = self._standardise_size(cropped)
+
+        # Sizes were already standardised in _transform, before recolouring
         return cropped
 
     def recolour_create_each_colour(self, cropped, filename_without_extension):
-        """Create image variants in each available color."""
-        # Need to iterate over all key:value pairs in std colours
-        # we want to have one cropped image and recolour it for each standard colour
-        # saving multiple copies
-
-        for code, colour in COLOURS.items():
-            colour_cropped = self._colour_sub(cropped.copy(), colour)
-            colour_cropped = self._standardise_size(colour_cropped)
-            colour_as_png = f"{filename_without_extension}{code}.png"
-            self._save_image(colour_cropped, colour_as_png)
+        """Create image variants in each available color, yielded as (colour code, image) pairs."""
+        # The ink mask is found once and each standard colour is painted through it,
+        # yielding every variant before the next colour is filled in
+        yield from self._colour_fan_out(cropped, COLOURS)
 
 
 if __name__ == "__main__":
@@ -2,12 +2,12 @@
 
 import logging
 import os
-import time
 
-from PIL import Image, ImageDraw
+from PIL import Image
 
 from handling.base_image_handler import BaseImageHandler
-from settings.static_dicts import COLOURS, PROCESSED_DIR_RECT, RECT_PATHS
+from settings.static_dicts import (COLOURS, IMAGE_DIR, PROCESSED_DIR_RECT,
+                                   RECT_PATHS)
 
 logger = logging.getLogger(__name__)
 
@@ -15,78 +15,57 @@ logger = logging.getLogger(__name__)
 class RectangleHandler(BaseImageHandler):
     """Processes rectangular images into color-sorted folders."""
 
-    def __init__(self):
-        super().__init__()
+    default_output_dir = PROCESSED_DIR_RECT
+
+    def __init__(self, input_dir: str = IMAGE_DIR, output_dir: str | None = None):
         self.rect_paths = RECT_PATHS
+        super().__init__(input_dir, output_dir)
 
     def execute(self):
         super().execute()
-        self._open_save_destination(PROCESSED_DIR_RECT)
-
-    def _handler_function(self, file):
-        # Convert valid formats to png to allow RGBA
-        start = time.time()
-        no_extension = file[: file.index(".") + 1]
-        as_png = f"{no_extension}png"
-
-        try:
-            os.rename(f"img/{file}", f"img/{as_png}")
-        except FileExistsError:
-            logger.error("Rename failed, file already exists: %s", as_png)
-            return
-        try:
-            image = Image.open(f"img/{as_png}")
-            canvas = Image.new("RGBA", image.size, (255, 255, 255, 255))
-            ImageDraw.Draw(canvas)
-            canvas.paste(image)
-
-            # check for custom stamp to determine one or many colours
-            custom_stamp = False
-            try:
-                custom_stamp = no_extension.count("&") == 1
-            except ValueError:
-                logger.info("Processing %s as generic stamp - all colours", as_png)
-
-            path = ""
-            if custom_stamp:
-                path = self.rect_paths["Custom"]
-                match no_extension[no_extension.index("&") : -1]:
-                    case "&R":
-                        canvas = self._colour_sub(canvas, COLOURS["R"])  # red
-                    case "&G":
-                        canvas = self._colour_sub(canvas, COLOURS["G"])  # medium sea green
-                    case "&B":
-                        canvas = self._colour_sub(canvas, COLOURS["B"])  # cornflour blue
-                    case "&P":
-                        canvas = self._colour_sub(canvas, COLOURS["P"])  # hot pink
-                    case "&PP":
-                        canvas = self._colour_sub(canvas, COLOURS["PP"])  # dark violet
-                    case "&O":
-                        canvas = self._colour_sub(canvas, COLOURS["O"])  # stampede orange
-                    case "&Y":
-                        canvas = self._colour_sub(canvas, COLOURS["Y"])  # stampede yellow
-                    case _:
-                        canvas = self._colour_sub(canvas, COLOURS["Black"])  # default to black if not specified
-
-                canvas.save(f"img/Processed/Rectangles/{path}/{as_png}", quality=100)
-
-                logger.info("%s processed in %.2fs", as_png, time.time() - start)
-
-            # If it's not a custom stamp, then create a copy in each standard colour
-            else:
-                for code, colour_value in COLOURS.items():
-                    rect_img = self._colour_sub(canvas.copy(), colour_value)
-                    rect_img.save(
-                        f"img/Processed/Rectangles/{self.rect_paths[code]}/{no_extension[:-1]}&{code}.png",
-                        quality=self.quality_val,
-                    )
-                logger.info("%s processed in %.2fs", as_png, time.time() - start)
-
-            self._open_save_destination(PROCESSED_DIR_RECT)
-            self._archive_image(as_png)
-
-        except Exception:
-            logger.exception("Unexpected error processing %s", as_png)
+        self._open_save_destination(self.output_dir)
+
+    def _init_directories(self):
+        super()._init_directories()
+        for path in self.rect_paths.values():
+            os.makedirs(f"{self.output_dir}/{path}", exist_ok=True)
+
+    def _transform(self, job):
+        canvas = Image.new("RGBA", job.image.size, (255, 255, 255, 255))
+        canvas.paste(job.image)
+
+        # check for custom stamp to determine one or many colours
+        custom_stamp = job.stem.count("&") == 1
+
+        if custom_stamp:
+            match job.stem[job.stem.index("&") : -1]:
+                case "&R":
+                    canvas = self._colour_sub(canvas, COLOURS["R"])  # red
+                case "&G":
+                    canvas = self._colour_sub(canvas, COLOURS["G"])  # medium sea green
+                case "&B":
+                    canvas = self._colour_sub(canvas, COLOURS["B"])  # cornflour blue
+                case "&P":
+                    canvas = self._colour_sub(canvas, COLOURS["P"])  # hot pink
+                case "&PP":
+                    canvas = self._colour_sub(canvas, COLOURS["PP"])  # dark violet
+                case "&O":
+                    canvas = self._colour_sub(canvas, COLOURS["O"])  # stampede orange
+                case "&Y":
+                    canvas = self._colour_sub(canvas, COLOURS["Y"])  # stampede yellow
+                case _:
+                    canvas = self._colour_sub(canvas, COLOURS["Black"])  # default to black if not specified
+            return [("Custom", canvas)]
+
+        # If it's not a custom stamp, then create a copy in each standard colour
+        logger.info("Processing %s as generic stamp - all colours", job.name)
+        return self._colour_fan_out(canvas, COLOURS)
+
+    def _output_path(self, job, code):
+        """Custom stamps keep their name in the Custom folder, generic ones get a colour suffix per colour folder."""
+        if code == "Custom":
+            return f"{self.output_dir}/{self.rect_paths['Custom']}/{job.name}"
+        return f"{self.output_dir}/{self.rect_paths[code]}/{job.stem[:-1]}&{code}.png"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+"""Tile several small avatar inputs into one edit request, and split the result back up.
+
+OpenAI limits how many image requests we can send a minute, not how much each one draws,
+so up to four small inputs can share one 1024x1024 request: each is placed in a cell of a
+2x2 grid separated by plain white gutters, the model is asked to edit every cell on its own,
+and each output is cropped from the cell its source was placed in.
+
+The model doesn't always respect the grid. grid_intact checks that the gutters came back as
+plain strips, which they won't if the model drew across cells or rearranged them, so the
+caller can fall back to one request per input.
+"""
+
+import logging
+from dataclasses import dataclass
+
+from PIL import Image, ImageStat
+
+from handling.exception.configuration_error import ConfigurationError
+
+logger = logging.getLogger(__name__)
+
+GRID = 2  # cells per side
+MAX_PACK_SIZE = GRID * GRID
+GUTTER = 16  # pixels of plain background between and around the cells
+GUTTER_COLOUR = (255, 255, 255)
+GUTTER_MARGIN = 3  # pixels either side of a gutter not checked, for slight misalignment
+MAX_GUTTER_DEVIATION = 12.0  # greyscale standard deviation allowed along a returned gutter
+PACK_INSTRUCTION = (
+    "The image is a {grid}x{grid} grid of separate pictures on a white background, {count} of them filled. "
+    "Edit each picture on its own as instructed below, keeping it inside its own cell. Keep the grid "
+    "layout and the plain white lines between the cells exactly as they are, and leave empty cells empty.\n\n"
+)
+
+
+@dataclass(frozen=True)
+class Tile:
+    """Where one source was placed on a packed canvas."""
+
+    source: str
+    box: tuple[int, int, int, int]  # (left, upper, right, lower) in canvas pixels
+
+
+def plan_packs(sizes: dict[str, tuple[int, int]], pack_size: int, max_side: int) -> list[list[str]]:
+    """Split inputs into packs of up to pack_size small inputs, and singles.
+
+    :param sizes: Image size by input name, in the order requests should be sent.
+    :type sizes: dict[str, tuple[int, int]]
+    :param pack_size: Most inputs to put in one request.
+    :type pack_size: int
+    :param max_side: Longest side an input may have and still be packed.
+    :type max_side: int
+    :returns: Lists of input names, one per request. Lists of one are sent as usual.
+    :rtype: list[list[str]]
+    :raises ConfigurationError: If pack_size is outside 2 to 4.
+    """
+    if not 2 <= pack_size <= MAX_PACK_SIZE:
+        raise ConfigurationError(f"Avatar pack size must be between 2 and {MAX_PACK_SIZE}, got {pack_size}")
+
+    small = [name for name, size in sizes.items() if max(size) <= max_side]
+    singles = [[name] for name, size in sizes.items() if max(size) > max_side]
+    return singles + [small[start : start + pack_size] for start in range(0, len(small), pack_size)]
+
+
+def compose(sources: list[tuple[str, Image.Image]], canvas_size: int) -> tuple[Image.Image, list[Tile]]:
+    """Lay sources out on a grid, each scaled to fit its cell and centred in it.
+
+    :param sources: (name, image) pairs, at most four.
+    :type sources: list[tuple[str, Image.Image]]
+    :param canvas_size: Width and height of the canvas, the size the model returns.
+    :type canvas_size: int
+    :returns: The canvas and where each source was placed.
+    :rtype: tuple[Image.Image, list[Tile]]
+    """
+    cell = _cell_size(canvas_size)
+    canvas = Image.new("RGB", (canvas_size, canvas_size), GUTTER_COLOUR)
+    tiles = []
+    for index, (name, image) in enumerate(sources):
+        image = image.convert("RGB")
+        image.thumbnail((cell, cell), Image.Resampling.LANCZOS)
+        row, column = divmod(index, GRID)
+        left = GUTTER + column * (cell + GUTTER) + (cell - image.width) // 2
+        upper = GUTTER + row * (cell + GUTTER) + (cell - image.height) // 2
+        canvas.paste(image, (left, upper))
+        tiles.append(Tile(name, (left, upper, left + image.width, upper + image.height)))
+    return canvas, tiles
+
+
+def grid_intact(result: Image.Image, canvas_size: int) -> bool:
+    """Whether the model kept the grid, judged by the gutters between the cells still being plain.
+
+    The gutters may have been recoloured along with the background, so only their uniformity is checked.
+
+    :param result: The image the model returned.
+    :type result: Image.Image
+    :param canvas_size: Size of the canvas that was sent.
+    :type canvas_size: int
+    :rtype: bool
+    """
+    if result.size != (canvas_size, canvas_size):
+        return False
+    grey = result.convert("L")
+    cell = _cell_size(canvas_size)
+    for boundary in range(1, GRID):
+        start = boundary * (cell + GUTTER) + GUTTER_MARGIN
+        end = start + GUTTER - 2 * GUTTER_MARGIN
+        for strip in ((start, 0, end, canvas_size), (0, start, canvas_size, end)):
+            deviation = ImageStat.Stat(grey.crop(strip)).stddev[0]
+            if deviation > MAX_GUTTER_DEVIATION:
+                logger.debug("Gutter %s varies by %.1f, the grid wasn't kept", strip, deviation)
+                return False
+    return True
+
+
+def split(result: Image.Image, tiles: list[Tile]) -> dict[str, Image.Image]:
+    """Crop each source's output from the returned image.
+
+    :returns: Output image by source name.
+    :rtype: dict[str, Image.Image]
+    """
+    return {tile.source: result.crop(tile.box) for tile in tiles}
+
+
+def packed_prompt(user_prompt: str, count: int) -> str:
+    """The prompt for a packed request: how to treat the grid, then the user's instructions."""
+    return PACK_INSTRUCTION.format(grid=GRID, count=count) + user_prompt
+
+
+def _cell_size(canvas_size: int) -> int:
+    return (canvas_size - (GRID + 1) * GUTTER) // GRID
@@ -0,0 +1,68 @@
+"""Make the plain near-white background of generated avatars transparent.
+
+gpt-image-2 can't return transparent backgrounds, so avatars come back on white. This finds
+that background with whole-image Pillow band operations, without looping over pixels in
+Python:
+
+- a pixel's whiteness is its darkest channel mapped through a lookup table: fully white from
+  the white level up, fading to not white at all over the softness levels below it, so
+  anti-aliased edges become partly transparent instead of leaving a jagged white fringe;
+- only white connected to the image border is background, so white inside the subject (eyes,
+  teeth, a white shirt) stays opaque. That region is flood filled at 1/REGION_SCALE scale,
+  where it is cheap, then grown by a cell and scaled back up to bound the full size mask.
+"""
+
+import logging
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+
+logger = logging.getLogger(__name__)
+
+REGION_SCALE = 8  # the border-connected region is found on an image this many times smaller
+BACKGROUND = 255  # cell values while flood filling the region
+CONNECTED = 128
+_REGION_LUT = [255 if value == CONNECTED else 0 for value in range(256)]
+_MOSTLY_WHITE_LUT = [BACKGROUND if value >= 128 else 0 for value in range(256)]
+
+
+def remove_background(image: Image.Image, white: int = 240, softness: int = 20) -> Image.Image:
+    """Make the near-white background around an image's subject transparent.
+
+    :param image: The image to clean. It isn't modified.
+    :type image: Image.Image
+    :param white: Channel level from which a pixel counts as background white.
+    :type white: int
+    :param softness: Levels below white over which pixels fade back to fully opaque.
+    :type softness: int
+    :returns: An RGBA copy with the background made transparent. Any transparency the image had is kept.
+    :rtype: Image.Image
+    """
+    rgba = image.convert("RGBA")
+    red, green, blue, alpha = rgba.split()
+    darkest = ImageChops.darker(ImageChops.darker(red, green), blue)
+    whiteness = darkest.point(_whiteness_lut(white, softness))
+
+    transparency = ImageChops.multiply(whiteness, _border_region(whiteness))
+    rgba.putalpha(ImageChops.darker(alpha, ImageChops.invert(transparency)))
+    return rgba
+
+
+def _whiteness_lut(white: int, softness: int) -> list[int]:
+    start = white - softness
+    return [min(255, max(0, round(255 * (value - start) / max(softness, 1)))) for value in range(256)]
+
+
+def _border_region(whiteness: Image.Image) -> Image.Image:
+    """Mask, 255 or 0, of the part of the image the background reached from the border could cover."""
+    cells = whiteness.reduce(REGION_SCALE).point(_MOSTLY_WHITE_LUT)
+    width, height = cells.size
+    border = {(x, y) for x in range(width) for y in (0, height - 1)} | {
+        (x, y) for x in (0, width - 1) for y in range(height)
+    }
+    for xy in sorted(border):
+        if cells.getpixel(xy) == BACKGROUND:
+            ImageDraw.floodfill(cells, xy, CONNECTED, thresh=0)
+
+    # Grown by a cell, since a cell on the subject's edge is only partly background
+    region = cells.point(_REGION_LUT).filter(ImageFilter.MaxFilter(3))
+    return region.resize(whiteness.size, Image.Resampling.NEAREST)
@@ -0,0 +1,122 @@
+"""Executor backends for spreading independent per-file work across cores.
+
+All backends share the concurrent.futures interface so handlers can submit work and
+collect results the same way whichever backend is configured:
+
+- serial: runs each call inline on the calling thread, as before.
+- thread: a thread pool. Pillow releases the GIL in most pixel operations and codecs.
+- process: a process pool, for pure CPU-bound work. Log records from the workers are
+  forwarded to the parent's logging handlers so per-file logs still reach stampede.log.
+"""
+
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import signal
+from concurrent.futures import (Executor, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+
+from handling.exception.configuration_error import ConfigurationError
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_BACKENDS = ("serial", "thread", "process")
+
+
+class SerialExecutor(Executor):
+    """Runs every submitted call immediately on the calling thread."""
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:  # pylint: disable=broad-exception-caught
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        return future
+
+
+class _ForwardToLoggerHandler(logging.Handler):
+    """Re-dispatches records received from worker processes to the matching parent logger."""
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        logging.getLogger(record.name).handle(record)
+        return True
+
+
+def _init_worker(log_queue, level: int, initializer, initargs: tuple) -> None:
+    """Route every record logged inside a worker process back to the parent, then run the caller's setup."""
+    # Ctrl+C reaches the whole process group, but stopping is the parent's job: it lets in-flight files
+    # finish and shuts the pool down, where an interrupted worker would only print a traceback
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    root_logger = logging.getLogger()
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    root_logger.setLevel(level)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class LoggingProcessPoolExecutor(ProcessPoolExecutor):
+    """Process pool whose workers log through the parent process's handlers."""
+
+    def __init__(self, max_workers: int | None = None, initializer=None, initargs: tuple = ()):
+        # Always spawn: handlers run on GUI worker threads, and forking a threaded process can deadlock.
+        # It is also the only start method on Windows, so every platform behaves the same.
+        context = multiprocessing.get_context("spawn")
+        self._log_queue = context.Queue()
+        self._log_listener = logging.handlers.QueueListener(self._log_queue, _ForwardToLoggerHandler())
+        self._log_listener.start()
+        super().__init__(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._log_queue, logging.getLogger().getEffectiveLevel(), initializer, initargs),
+        )
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+        # Only stop listening once the workers are gone, so their final records are not lost
+        self._log_listener.stop()
+
+
+def default_worker_count() -> int:
+    """Number of workers to use when none is configured, one per core."""
+    count = os.cpu_count() or 1
+    if os.name == "nt":
+        # Windows cannot wait on more than 61 worker processes at once
+        count = min(count, 61)
+    return count
+
+
+def create_executor(
+    backend: str = "serial", max_workers: int | None = None, initializer=None, initargs: tuple = ()
+) -> Executor:
+    """Create the executor for the configured backend.
+
+    :param backend: One of "serial", "thread" or "process".
+    :type backend: str
+    :param max_workers: Worker count for pooled backends. Defaults to the number of cores.
+    :type max_workers: int or None
+    :param initializer: Called once in each worker process before it takes any work (process backend only),
+        e.g. to install state that should live for the whole batch rather than be pickled with every call.
+    :param initargs: Arguments for the initializer.
+    :type initargs: tuple
+    :returns: An executor, to be used as a context manager.
+    :rtype: Executor
+    :raises ConfigurationError: If the backend is unknown or the worker count is invalid.
+    """
+    if backend not in EXECUTOR_BACKENDS:
+        raise ConfigurationError(f"Unknown executor backend: {backend}")
+    if max_workers is not None and max_workers < 1:
+        raise ConfigurationError(f"Worker count must be at least 1, got {max_workers}")
+
+    workers = max_workers or default_worker_count()
+    match backend:
+        case "thread":
+            return ThreadPoolExecutor(max_workers=workers)
+        case "process":
+            return LoggingProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+        case _:
+            return SerialExecutor()
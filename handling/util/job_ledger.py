@@ -0,0 +1,296 @@
+"""SQLite ledger of how far each input file has got through a batch.
+
+Every file is recorded when a batch finds it in its input folder and moves through the
+states in STATES as it is renamed, has all its outputs saved, and is archived. If a run is
+interrupted the ledger shows what was left unfinished, so the next run can archive files
+whose outputs were already saved instead of processing them again.
+
+Files are identified per handler and resolved input folder by their working (.png) name
+plus the size and modification time of the original, which survive the rename. A file
+whose fingerprint changes, or which reappears after being archived, starts again as newly
+discovered.
+
+Inspect the ledger with:
+
+    python -m handling.util.job_ledger pending
+    python -m handling.util.job_ledger changes
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from settings.static_dicts import IMAGE_DIR, JOB_LEDGER_PATH
+
+logger = logging.getLogger(__name__)
+
+STATES = ("discovered", "renamed", "saved", "archived")
+SCHEMA_VERSION = 2  # 2 added input_dir to the key and folded "processed" into "saved"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    handler TEXT NOT NULL,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    handler TEXT NOT NULL,
+    input_dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    source TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    run_id INTEGER,
+    updated REAL NOT NULL,
+    PRIMARY KEY (handler, input_dir, name)
+);
+CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated);
+"""
+
+
+class JobLedger:
+    """Per-file state records shared by every handler, thread and worker process.
+
+    Each thread opens its own connection on first use. The database runs in WAL mode so
+    workers can record progress while others read. WAL needs shared memory between the
+    processes using it, so the database must be on a local disk, never on a network share.
+
+    :param path: Location of the SQLite database file.
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # Connections can't cross into process pool workers; each worker opens its own
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def start_run(self, handler: str) -> int:
+        """Record the start of a batch.
+
+        :param handler: Name of the handler running the batch.
+        :type handler: str
+        :returns: The id of the new run.
+        :rtype: int
+        """
+        cursor = self._connection().execute("INSERT INTO runs (handler, started) VALUES (?, ?)", (handler, time.time()))
+        return cursor.lastrowid
+
+    def handlers(self) -> list[str]:
+        """Names of every handler that has run a batch.
+
+        :returns: Handler names in alphabetical order.
+        :rtype: list[str]
+        """
+        return [row[0] for row in self._connection().execute("SELECT DISTINCT handler FROM runs ORDER BY handler")]
+
+    def last_run(self, handler: str) -> float | None:
+        """When the handler's most recent batch started.
+
+        :param handler: Name of the handler.
+        :type handler: str
+        :returns: Start time as a Unix timestamp, or None if it has never run.
+        :rtype: float or None
+        """
+        row = self._connection().execute("SELECT MAX(started) FROM runs WHERE handler = ?", (handler,)).fetchone()
+        return row[0]
+
+    def discover(self, handler: str, input_dir: str, run_id: int, files: list[tuple[str, str, int, int]]) -> list[str]:
+        """Record the files found at the start of a batch.
+
+        Files already in the ledger with an unchanged fingerprint keep their state, so an
+        interrupted run can be resumed. Anything else starts over as discovered.
+
+        :param handler: Name of the handler running the batch.
+        :type handler: str
+        :param input_dir: Resolved path of the folder the files are in.
+        :type input_dir: str
+        :param run_id: The batch's id from start_run.
+        :type run_id: int
+        :param files: (source name, working name, size, mtime_ns) of each file found.
+        :type files: list[tuple[str, str, int, int]]
+        :returns: Working names of the files that are new or changed since the ledger last saw them.
+        :rtype: list[str]
+        """
+        connection = self._connection()
+        known = {
+            name: (size, mtime_ns, state)
+            for name, size, mtime_ns, state in connection.execute(
+                "SELECT name, size, mtime_ns, state FROM jobs WHERE handler = ? AND input_dir = ?", (handler, input_dir)
+            )
+        }
+
+        now = time.time()
+        changed = []
+        rows = []
+        for source, name, size, mtime_ns in files:
+            previous = known.get(name)
+            if previous is not None and previous[:2] == (size, mtime_ns) and previous[2] != "archived":
+                state = previous[2]  # unfinished from an earlier run, resume where it left off
+            else:
+                state = "discovered"
+                changed.append(name)
+            rows.append((handler, input_dir, name, source, size, mtime_ns, state, run_id, now))
+
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return changed
+
+    def mark(self, handler: str, input_dir: str, name: str, state: str) -> None:
+        """Move a file on to a new state.
+
+        :param handler: Name of the handler processing the file.
+        :type handler: str
+        :param input_dir: Resolved path of the folder the file is in.
+        :type input_dir: str
+        :param name: The file's working name.
+        :type name: str
+        :param state: One of STATES.
+        :type state: str
+        :raises ValueError: If the state is unknown.
+        """
+        if state not in STATES:
+            raise ValueError(f"Unknown job state: {state}")
+        self._connection().execute(
+            "UPDATE jobs SET state = ?, updated = ? WHERE handler = ? AND input_dir = ? AND name = ?",
+            (state, time.time(), handler, input_dir, name),
+        )
+
+    def state(self, handler: str, input_dir: str, name: str) -> str | None:
+        """Current state of a file.
+
+        :param handler: Name of the handler.
+        :type handler: str
+        :param input_dir: Resolved path of the folder the file is in.
+        :type input_dir: str
+        :param name: The file's working name.
+        :type name: str
+        :returns: The state, or None if the file isn't in the ledger.
+        :rtype: str or None
+        """
+        row = (
+            self._connection()
+            .execute(
+                "SELECT state FROM jobs WHERE handler = ? AND input_dir = ? AND name = ?", (handler, input_dir, name)
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def pending(self, handler: str | None = None) -> list[tuple[str, str, str, str]]:
+        """Files that were found but not archived, i.e. unfinished work.
+
+        :param handler: Limit to one handler, or None for all of them.
+        :type handler: str or None
+        :returns: (handler, input folder, name, state) of each unfinished file.
+        :rtype: list[tuple[str, str, str, str]]
+        """
+        return self._query("state != 'archived'", handler)
+
+    def changed_since(self, since: float, handler: str | None = None) -> list[tuple[str, str, str, str]]:
+        """Files whose state changed at or after a point in time, e.g. the start of the last run.
+
+        :param since: Unix timestamp.
+        :type since: float
+        :param handler: Limit to one handler, or None for all of them.
+        :type handler: str or None
+        :returns: (handler, input folder, name, state) of each file.
+        :rtype: list[tuple[str, str, str, str]]
+        """
+        return self._query("updated >= ?", handler, (since,))
+
+    def close(self) -> None:
+        """Close the calling thread's connection."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _query(self, condition: str, handler: str | None, params: tuple = ()) -> list[tuple[str, str, str, str]]:
+        sql = f"SELECT handler, input_dir, name, state FROM jobs WHERE {condition}"
+        if handler is not None:
+            sql += " AND handler = ?"
+            params += (handler,)
+        return self._connection().execute(sql + " ORDER BY handler, input_dir, name", params).fetchall()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit, so each state change is durable as soon as it is made
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._upgrade(connection)
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _upgrade(self, connection: sqlite3.Connection) -> None:
+        """Bring a ledger written by an older version up to SCHEMA_VERSION, keeping its records.
+
+        Version 1 didn't record input folders, so its files are assumed to be in the default img/.
+        """
+        with connection:
+            # Immediate, so only one of several processes opening an old ledger upgrades it
+            connection.execute("BEGIN IMMEDIATE")
+            if connection.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                return
+            columns = [row[1] for row in connection.execute("PRAGMA table_info(jobs)")]
+            if columns and "input_dir" not in columns:
+                connection.execute("ALTER TABLE jobs RENAME TO jobs_v1")
+                # One statement at a time, as executescript() would commit the transaction. The index
+                # goes with the old table and is recreated with the rest of the schema afterwards
+                for statement in _SCHEMA.split(";"):
+                    if statement.strip():
+                        connection.execute(statement)
+                connection.execute(
+                    "INSERT INTO jobs SELECT handler, ?, name, source, size, mtime_ns,"
+                    " CASE state WHEN 'processed' THEN 'renamed' ELSE state END, run_id, updated FROM jobs_v1",
+                    (os.path.realpath(IMAGE_DIR),),
+                )
+                connection.execute("DROP TABLE jobs_v1")
+                logger.info("Upgraded the job ledger at %s to version %d", self.path, SCHEMA_VERSION)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def main(argv=None) -> None:
+    """Command line access to the job ledger."""
+    parser = argparse.ArgumentParser(prog="python -m handling.util.job_ledger", description=__doc__.split("\n")[0])
+    parser.add_argument("command", choices=["pending", "changes"], help="unfinished files, or changes in the last run")
+    parser.add_argument("--handler", help="limit to one handler, e.g. CircleHandler")
+    args = parser.parse_args(argv)
+
+    ledger = JobLedger(JOB_LEDGER_PATH)
+    if args.command == "pending":
+        rows = ledger.pending(args.handler)
+    else:
+        handlers = [args.handler] if args.handler else ledger.handlers()
+        rows = []
+        for handler in handlers:
+            started = ledger.last_run(handler)
+            if started is not None:
+                rows += ledger.changed_since(started, handler)
+    for handler, input_dir, name, state in rows:
+        print(f"{handler}\t{state}\t{os.path.join(input_dir, name)}")
+    ledger.close()
+
+
+if __name__ == "__main__":
+    main()
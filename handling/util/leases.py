@@ -0,0 +1,242 @@
+"""Lease files that let several machines drain one shared img/ folder without double processing.
+
+Before touching a file, a node creates a lease for it in the shared folder with an
+exclusive create (O_CREAT | O_EXCL), which only one node can win, even over SMB. While it
+works, a background heartbeat keeps touching the lease's modification time. A lease that
+hasn't been touched for the TTL belongs to a node that crashed or lost the share, so
+another node may break it and take the file over.
+
+Leases are keyed by the file's working (.png) name, because the original extension
+changes when the file is renamed at the start of processing.
+
+A node that stalls for longer than the TTL can find its lease broken and taken by another
+node. The heartbeat notices when a lease file is gone or names another node, and
+still_held() checks it again before outputs are saved and the input archived, so only the
+node now holding the lease finishes the file.
+
+Only the input folder is shared. The job ledger and the result cache live in each user's
+local data folder (see settings.paths.local_data_path), apart from both img/ and the working
+directory, since the ledger runs SQLite in WAL mode, which doesn't work over network filesystems.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from settings.static_dicts import LEASE_HEARTBEAT_SECONDS, LEASE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseManager:
+    """Claims, heartbeats and releases lease files for one node.
+
+    Every process gets its own node id, so process pool workers on the same machine
+    compete for leases just like separate machines do.
+
+    :param lease_dir: Shared folder the lease files live in.
+    :type lease_dir: str
+    :param ttl: Seconds without a heartbeat after which a lease is considered abandoned.
+    :type ttl: float
+    :param heartbeat: Seconds between heartbeats. Must be comfortably shorter than the TTL.
+    :type heartbeat: float
+    """
+
+    def __init__(self, lease_dir: str, ttl: float = LEASE_TTL_SECONDS, heartbeat: float = LEASE_HEARTBEAT_SECONDS):
+        self.lease_dir = lease_dir
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self._setup()
+
+    def _setup(self) -> None:
+        self.node_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._held = set()
+        self._lock = threading.Lock()
+        self._heartbeat_thread = None
+
+    def __getstate__(self):
+        # Each worker process is its own node, with its own leases and heartbeat thread
+        return {"lease_dir": self.lease_dir, "ttl": self.ttl, "heartbeat": self.heartbeat}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
+
+    def acquire(self, key: str) -> bool:
+        """Try to claim a file.
+
+        :param key: The file's working name.
+        :type key: str
+        :returns: Whether this node now holds the lease.
+        :rtype: bool
+        """
+        os.makedirs(self.lease_dir, exist_ok=True)
+        path = self._path(key)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                if self._break_if_stale(path):
+                    continue  # the previous holder is gone, try again
+                return False
+
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"node": self.node_id, "acquired": time.time()}, f)
+            with self._lock:
+                self._held.add(key)
+            self._start_heartbeat()
+            return True
+        return False
+
+    def release(self, key: str) -> None:
+        """Give up a claimed file, after it has been archived or has failed.
+
+        :param key: The file's working name.
+        :type key: str
+        """
+        with self._lock:
+            if key not in self._held:
+                return
+            self._held.discard(key)
+        path = self._path(key)
+        if not self._owns(path):
+            logger.warning("Lease for %s was already gone, it may have been broken by another node", key)
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            logger.warning("Lease for %s was already gone, it may have been broken by another node", key)
+
+    def held(self) -> set[str]:
+        """Keys of the leases this node currently holds.
+
+        :returns: A copy of the held keys.
+        :rtype: set[str]
+        """
+        with self._lock:
+            return set(self._held)
+
+    def is_claimed(self, key: str) -> bool:
+        """Whether any node currently has a lease on a file.
+
+        :param key: The file's working name.
+        :type key: str
+        :rtype: bool
+        """
+        return os.path.exists(self._path(key))
+
+    def still_held(self, key: str) -> bool:
+        """Check that this node's lease on a file hasn't been broken or taken over by another node.
+
+        Reads the lease file, so it is current even between heartbeats. Once lost, a lease
+        stays lost until the file is acquired again, and releasing it leaves the new holder's lease alone.
+
+        :param key: The file's working name.
+        :type key: str
+        :rtype: bool
+        """
+        with self._lock:
+            if key not in self._held:
+                return False
+        if self._owns(self._path(key)):
+            return True
+        self._lose(key)
+        return False
+
+    def touch(self) -> set[str]:
+        """Refresh every held lease so other nodes know this one is still alive.
+
+        :returns: Keys of the leases found to be lost since the last heartbeat.
+        :rtype: set[str]
+        """
+        lost = set()
+        for key in self.held():
+            path = self._path(key)
+            if not self._owns(path):
+                self._lose(key)
+                lost.add(key)
+                continue
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                self._lose(key)
+                lost.add(key)
+        return lost
+
+    def _owns(self, path: str) -> bool:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f).get("node") == self.node_id
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError):
+            # Unreadable for a moment, e.g. being written by a node taking it over; assume still held
+            return True
+
+    def _lose(self, key: str) -> None:
+        with self._lock:
+            if key not in self._held:
+                return
+            self._held.discard(key)
+        logger.error("Lost the lease for %s to another node, leaving the file to it", key)
+
+    def _break_if_stale(self, path: str) -> bool:
+        try:
+            age = time.time() - os.stat(path).st_mtime
+        except FileNotFoundError:
+            return True  # released in the meantime
+        if age < self.ttl:
+            return False
+
+        # Moving the lease aside is atomic, so only one of the nodes racing to break it succeeds
+        tombstone = f"{path}.{self.node_id}.stale"
+        try:
+            os.rename(path, tombstone)
+        except OSError:
+            return False
+        try:
+            if time.time() - os.stat(tombstone).st_mtime < self.ttl:
+                # The holder heartbeated between the check and the move, so put its lease back. A link
+                # fails if another node has created a lease there in the meantime, which then stands
+                self._restore(tombstone, path)
+                return False
+            with open(tombstone, encoding="utf-8") as f:
+                previous = json.load(f).get("node")
+        except (OSError, ValueError):
+            previous = "unknown"
+        logger.warning("Broke expired lease %s held by %s", os.path.basename(path), previous)
+        try:
+            os.remove(tombstone)
+        except FileNotFoundError:
+            pass
+        return True
+
+    @staticmethod
+    def _restore(tombstone: str, path: str) -> None:
+        try:
+            os.link(tombstone, path)
+        except OSError:
+            logger.warning("Couldn't put back the lease %s, its holder will find it lost", os.path.basename(path))
+        try:
+            os.remove(tombstone)
+        except FileNotFoundError:
+            pass
+
+    def _start_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat_thread is not None:
+                return
+            self._heartbeat_thread = threading.Thread(target=self._beat, name="lease-heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+
+    def _beat(self) -> None:
+        while True:
+            time.sleep(self.heartbeat)
+            self.touch()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.lease_dir, f"{key}.lease")
@@ -0,0 +1,121 @@
+"""Size-keyed LRU cache of the circular transparency masks used by CircleHandler.
+
+Most inputs in a batch share a handful of sizes, so each mask is drawn once per size and
+reused. The cache is bounded by the total bytes of the masks it holds and evicts the least
+recently used mask first. Masks can optionally be anti-aliased by drawing the ellipse at a
+multiple of the size and box-reducing it, which is only affordable because it is cached.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw
+
+logger = logging.getLogger(__name__)
+
+
+class MaskCache:
+    """Thread-safe LRU cache of "L" circle masks keyed by size and anti-aliasing.
+
+    Returned masks are shared between callers and must not be modified.
+
+    :param max_bytes: Upper bound on the total size of cached masks.
+    :type max_bytes: int
+    :param supersample: Scale factor used to draw anti-aliased masks.
+    :type supersample: int
+    """
+
+    def __init__(self, max_bytes: int, supersample: int = 4):
+        self.max_bytes = max_bytes
+        self.supersample = supersample
+        self._masks = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        # Locks can't be pickled into process pool workers; each worker starts with an empty cache
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_masks"] = OrderedDict()
+        state["_bytes"] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, size: tuple[int, int], antialias: bool = False) -> Image.Image:
+        """Return the circle mask for an image of the given size, drawing it on a miss.
+
+        :param size: Width and height of the image the mask is for.
+        :type size: tuple[int, int]
+        :param antialias: Whether to return the supersampled, smooth-edged mask.
+        :type antialias: bool
+        :returns: The shared "L" mask.
+        :rtype: Image.Image
+        """
+        key = (size, antialias)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                self.hits += 1
+                return mask
+            self.misses += 1
+
+        # Drawn outside the lock so other sizes aren't held up; a rare duplicate draw is harmless
+        mask = self._draw(size, antialias)
+        self._store(key, mask)
+        return mask
+
+    def stats(self) -> dict[str, int]:
+        """Hit, miss and eviction counters plus current usage.
+
+        :returns: The counters by name.
+        :rtype: dict[str, int]
+        """
+        with self._lock:
+            return {
+                "mask_cache_hits": self.hits,
+                "mask_cache_misses": self.misses,
+                "mask_cache_evictions": self.evictions,
+                "mask_cache_entries": len(self._masks),
+                "mask_cache_bytes": self._bytes,
+            }
+
+    def reset_stats(self) -> None:
+        """Zero the counters, keeping the cached masks."""
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def _store(self, key, mask: Image.Image) -> None:
+        mask_bytes = mask.width * mask.height
+        if mask_bytes > self.max_bytes:
+            return  # would evict everything else and still not fit
+
+        with self._lock:
+            if key in self._masks:
+                return
+            self._masks[key] = mask
+            self._bytes += mask_bytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._masks.popitem(last=False)
+                self._bytes -= evicted.width * evicted.height
+                self.evictions += 1
+
+    def _draw(self, size: tuple[int, int], antialias: bool) -> Image.Image:
+        width, height = size
+        scale = self.supersample if antialias else 1
+
+        mask = Image.new("L", (width * scale, height * scale))
+        mask_draw = ImageDraw.Draw(mask)
+        mask_draw.ellipse((2.5 * scale, 2.5 * scale, (width - 5) * scale, (height - 5) * scale), fill=255)
+
+        if scale > 1:
+            # Averaging each scale x scale block gives every edge pixel its true coverage
+            mask = mask.reduce(scale)
+        return mask
@@ -3,18 +3,35 @@
 import os
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from handling.exception.configuration_error import ConfigurationError
 
 
-def create_openai_client():
-    """Create and return OpenAI client with API key from environment."""
+def _client_kwargs() -> dict:
     load_dotenv()
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     if OPENAI_API_KEY is None:
         raise ConfigurationError("No API key was loaded to the system environment")
-    client = OpenAI(
-        api_key=OPENAI_API_KEY, organization=os.getenv("OPENAI_ORG_ID"), project=os.getenv("OPENAI_PROJECT_ID")
-    )
-    return client
+    return {
+        "api_key": OPENAI_API_KEY,
+        "organization": os.getenv("OPENAI_ORG_ID"),
+        "project": os.getenv("OPENAI_PROJECT_ID"),
+        # Retries are handled by the avatar handlers, which also adapt their concurrency to rate limits
+        "max_retries": 0,
+    }
+
+
+def create_openai_client():
+    """Create and return OpenAI client with API key from environment."""
+    return OpenAI(**_client_kwargs())
+
+
+def create_async_openai_client():
+    """Create and return an async OpenAI client with API key from environment.
+
+    Every request made through one client shares its connection pool, so create one per
+    batch rather than one per request. The pool is bound to the event loop it is first used
+    on, so a client must not outlive its loop.
+    """
+    return AsyncOpenAI(**_client_kwargs())
@@ -0,0 +1,90 @@
+"""Perceptual hashes for spotting the same picture saved twice, e.g. as both JPEG and PNG.
+
+A difference hash (dHash) shrinks the image to 9x8 greyscale and records whether each pixel
+is brighter than its right-hand neighbour, giving 64 bits that survive re-encoding, resizing
+and mild compression but change with the picture's content. Two images count as duplicates
+when their hashes differ in only a few bits and they also share an aspect ratio and overall
+colour, which the greyscale hash can't see.
+"""
+
+import logging
+from dataclasses import dataclass
+
+from PIL import Image, ImageStat
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+MAX_ASPECT_DIFFERENCE = 0.02  # relative
+MAX_COLOUR_DIFFERENCE = 16  # per channel, out of 255
+
+
+@dataclass(frozen=True)
+class Signature:
+    """What two images are compared on."""
+
+    dhash: int
+    aspect: float
+    colour: tuple[float, float, float]
+
+
+def signature(path: str) -> Signature:
+    """Compute the perceptual signature of an image file.
+
+    :param path: Image to read.
+    :type path: str
+    :returns: Its signature.
+    :rtype: Signature
+    :raises OSError: If the file can't be read or decoded.
+    """
+    with Image.open(path) as image:
+        aspect = image.width / image.height
+        # JPEG can decode straight at 1/8 scale, which is plenty for a 9x8 thumbnail
+        image.draft("RGB", (64, 64))
+        rgb = image.convert("RGB")
+
+    pixels = rgb.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX).tobytes()
+    bits = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            offset = row * (HASH_SIZE + 1) + column
+            bits = bits << 1 | (pixels[offset] > pixels[offset + 1])
+    colour = tuple(ImageStat.Stat(rgb).mean)
+    return Signature(bits, aspect, colour)
+
+
+def distance(first: Signature, second: Signature) -> int | None:
+    """Bits by which two hashes differ, or None if the images differ in shape or colour.
+
+    :rtype: int or None
+    """
+    if abs(first.aspect - second.aspect) > MAX_ASPECT_DIFFERENCE * max(first.aspect, second.aspect):
+        return None
+    if max(abs(a - b) for a, b in zip(first.colour, second.colour)) > MAX_COLOUR_DIFFERENCE:
+        return None
+    return (first.dhash ^ second.dhash).bit_count()
+
+
+def group_duplicates(signatures: dict[str, Signature], max_distance: int) -> list[list[tuple[str, int]]]:
+    """Group near-duplicate images.
+
+    Each image joins the first group whose first image is within max_distance, so every
+    member is compared against the image that will actually be sent.
+
+    :param signatures: Signature by file name, in the order groups should be formed.
+    :type signatures: dict[str, Signature]
+    :param max_distance: Most bits two duplicates' hashes may differ by.
+    :type max_distance: int
+    :returns: Groups of (file name, distance from the group's first image), first image first.
+    :rtype: list[list[tuple[str, int]]]
+    """
+    groups = []
+    for name, current in signatures.items():
+        for group in groups:
+            bits = distance(signatures[group[0][0]], current)
+            if bits is not None and bits <= max_distance:
+                group.append((name, bits))
+                break
+        else:
+            groups.append([(name, 0)])
+    return groups
@@ -0,0 +1,137 @@
+"""Streaming pipeline that overlaps the stages of per-file work.
+
+Each stage runs on its own worker thread(s) and is connected to the next by a bounded
+queue, so reading the next file, pixel work on the current one and encoding/writing of
+earlier outputs all happen at the same time while memory stays capped by the queue sizes.
+Per-stage queue depths and timings show which stage is holding the others up.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()  # Sentinel telling a stage worker that no more items are coming
+
+
+class PipelineStage:
+    """One step of the pipeline.
+
+    :param name: Stage name used in logs and stats.
+    :type name: str
+    :param func: Called with each input item, returns an iterable of items for the next stage
+        (empty to drop the item, several to fan out).
+    :type func: Callable[[object], Iterable]
+    :param workers: Number of threads running this stage.
+    :type workers: int
+    """
+
+    def __init__(self, name: str, func: Callable[[object], Iterable], workers: int = 1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.peak_queued = 0
+
+
+class StagedPipeline:
+    """Runs items through a chain of stages with a bounded queue in front of each stage."""
+
+    def __init__(self, stages: list[PipelineStage], queue_size: int = 4):
+        self.stages = stages
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._lock = threading.Lock()
+        self._running_workers = [0] * len(stages)
+
+    def queue_depths(self) -> dict[str, int]:
+        """Number of items currently waiting in front of each stage.
+
+        :returns: Mapping of stage name to queued item count.
+        :rtype: dict[str, int]
+        """
+        return {stage.name: stage_queue.qsize() for stage, stage_queue in zip(self.stages, self._queues)}
+
+    def stats(self) -> dict[str, dict]:
+        """Throughput figures for each stage, for spotting the bottleneck after a run.
+
+        :returns: Mapping of stage name to processed count, busy time and peak queue depth.
+        :rtype: dict[str, dict]
+        """
+        return {
+            stage.name: {
+                "processed": stage.processed,
+                "busy_seconds": round(stage.busy_seconds, 3),
+                "peak_queued": stage.peak_queued,
+            }
+            for stage in self.stages
+        }
+
+    def run(self, items: Iterable) -> None:
+        """Feed every item through the stages and block until the last stage has drained.
+
+        :param items: Inputs for the first stage.
+        :type items: Iterable
+        """
+        threads = []
+        for index, stage in enumerate(self.stages):
+            self._running_workers[index] = stage.workers
+            for worker in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._work, args=(index,), name=f"pipeline-{stage.name}-{worker}", daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        for item in items:
+            self._put(0, item)
+        for _ in range(self.stages[0].workers):
+            self._queues[0].put(_STOP)
+
+        for thread in threads:
+            thread.join()
+
+    def _put(self, index: int, item) -> None:
+        # Blocks while the next stage is full, which is what keeps memory use fixed
+        self._queues[index].put(item)
+        stage = self.stages[index]
+        with self._lock:
+            stage.peak_queued = max(stage.peak_queued, self._queues[index].qsize())
+
+    def _work(self, index: int) -> None:
+        stage = self.stages[index]
+        stage_queue = self._queues[index]
+        is_last = index == len(self.stages) - 1
+
+        while True:
+            item = stage_queue.get()
+            if item is _STOP:
+                break
+
+            busy = 0.0
+            start = time.perf_counter()
+            try:
+                for output in stage.func(item):
+                    if not is_last:
+                        # Time spent blocked on a full downstream queue isn't this stage's own work
+                        busy += time.perf_counter() - start
+                        self._put(index + 1, output)
+                        start = time.perf_counter()
+            except Exception:
+                logger.exception("Pipeline stage %s failed for %s", stage.name, item)
+            busy += time.perf_counter() - start
+
+            with self._lock:
+                stage.busy_seconds += busy
+                stage.processed += 1
+
+        with self._lock:
+            self._running_workers[index] -= 1
+            last_worker_out = self._running_workers[index] == 0
+        # The last worker of a stage to finish closes the next stage once everything upstream is done
+        if last_worker_out and not is_last:
+            for _ in range(self.stages[index + 1].workers):
+                self._queues[index + 1].put(_STOP)
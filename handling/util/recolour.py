@@ -0,0 +1,137 @@
+"""Recolour engines that swap stamp "ink" for a preset colour using whole-image operations.
+
+A pixel counts as ink when it is not fully transparent and its red channel is below
+INK_RED_THRESHOLD. The engines build that mask in bulk (NumPy when installed, Pillow
+band operations otherwise) and paint the new colour through it, so the output matches
+the original per-pixel loop exactly without touching pixels in Python.
+"""
+
+import logging
+from typing import Iterator
+
+from PIL import Image, ImageChops
+
+from handling.exception.configuration_error import ConfigurationError
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the Pillow engine covers its absence
+    np = None
+
+logger = logging.getLogger(__name__)
+
+INK_RED_THRESHOLD = 200
+
+# Lookup tables for Image.point, mapping a band value straight to a mask value
+_DARK_LUT = [255 if value < INK_RED_THRESHOLD else 0 for value in range(256)]
+_OPAQUE_LUT = [0] + [255] * 255
+
+
+class RecolourEngine:
+    """Base recolour engine. Subclasses only need to provide the ink mask."""
+
+    name = "base"
+
+    def ink_mask(self, image: Image.Image) -> Image.Image:
+        """Build the mask of pixels that should take the new colour.
+
+        :param image: RGBA image to inspect.
+        :type image: Image.Image
+        :returns: An "L" mask, 255 where the pixel is ink and 0 elsewhere.
+        :rtype: Image.Image
+        """
+        raise NotImplementedError
+
+    def colour_sub(self, image: Image.Image, colour: tuple) -> Image.Image:
+        """Replace ink pixels in place with the given colour.
+
+        :param image: RGBA image to recolour.
+        :type image: Image.Image
+        :param colour: New colour as a tuple (R,G,B,Opacity).
+        :type colour: tuple
+        :returns: The same image, recoloured.
+        :rtype: Image.Image
+        """
+        self._check_mode(image)
+        image.paste(colour, mask=self.ink_mask(image))
+        return image
+
+    def fan_out(self, image: Image.Image, colours: dict) -> Iterator[tuple[str, Image.Image]]:
+        """Recolour the image into every given colour, finding the ink mask only once.
+
+        Every variant shares the untouched background, so each one costs a single fill.
+        The same image object is repainted and yielded for each colour, so consume it
+        (save or copy) before advancing to the next variant.
+
+        :param image: RGBA image to recolour. It is modified in place.
+        :type image: Image.Image
+        :param colours: Mapping of colour code to colour tuple (R,G,B,Opacity).
+        :type colours: dict
+        :returns: Iterator of (colour code, recoloured image) pairs.
+        :rtype: Iterator[tuple[str, Image.Image]]
+        """
+        self._check_mode(image)
+        mask = self.ink_mask(image)
+        for code, colour in colours.items():
+            # The mask is fixed, so painting over the previous colour touches exactly the same pixels
+            image.paste(colour, mask=mask)
+            yield code, image
+
+    def _check_mode(self, image: Image.Image) -> None:
+        if image.mode != "RGBA":
+            raise ValueError(f"Recolouring requires an RGBA image, got {image.mode}")
+
+
+class PillowRecolourEngine(RecolourEngine):
+    """Builds the ink mask with Pillow band lookups, no extra dependencies needed."""
+
+    name = "pillow"
+
+    def ink_mask(self, image: Image.Image) -> Image.Image:
+        self._check_mode(image)
+        dark = image.getchannel("R").point(_DARK_LUT)
+        opaque = image.getchannel("A").point(_OPAQUE_LUT)
+        # Both masks are strictly 0 or 255, so the per-pixel minimum is a logical AND
+        return ImageChops.darker(dark, opaque)
+
+
+class NumpyRecolourEngine(RecolourEngine):
+    """Builds the ink mask with NumPy boolean array operations."""
+
+    name = "numpy"
+
+    def __init__(self):
+        if np is None:
+            raise ConfigurationError("The numpy recolour engine was requested but NumPy is not installed")
+
+    def ink_mask(self, image: Image.Image) -> Image.Image:
+        self._check_mode(image)
+        red = np.asarray(image.getchannel("R"))
+        alpha = np.asarray(image.getchannel("A"))
+        ink = (alpha != 0) & (red < INK_RED_THRESHOLD)
+        return Image.fromarray(ink.astype(np.uint8) * 255)
+
+
+ENGINES = {
+    PillowRecolourEngine.name: PillowRecolourEngine,
+    NumpyRecolourEngine.name: NumpyRecolourEngine,
+}
+
+
+def create_recolour_engine(name: str = "auto") -> RecolourEngine:
+    """Create the recolour engine configured by name.
+
+    :param name: "numpy", "pillow", or "auto" to prefer NumPy when it is installed.
+    :type name: str
+    :returns: The recolour engine.
+    :rtype: RecolourEngine
+    :raises ConfigurationError: If the name is unknown or its dependency is missing.
+    """
+    if name == "auto":
+        name = NumpyRecolourEngine.name if np is not None else PillowRecolourEngine.name
+
+    if name not in ENGINES:
+        raise ConfigurationError(f"Unknown recolour engine: {name}")
+
+    logger.debug("Using %s recolour engine", name)
+    return ENGINES[name]()
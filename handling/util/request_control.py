@@ -0,0 +1,196 @@
+"""Retry with backoff and adaptive concurrency for rate limited API requests.
+
+A failed request is retried if the failure is transient: a 429, a 5xx, a timeout or a
+dropped connection. Between attempts the caller waits a jittered exponential backoff, or
+whatever the server's Retry-After header asks for. The jitter keeps a burst of requests that
+failed together from retrying together.
+
+AdaptiveLimiter decides how many requests may be in flight, using AIMD (additive increase,
+multiplicative decrease), as TCP does: every success raises the limit by about one per
+window of requests, and a rate limit error cuts it in half. The limit settles just under
+whatever the account's quota allows, rather than depending on a hand-tuned worker count.
+"""
+
+import asyncio
+import email.utils
+import random
+import time
+from dataclasses import asdict, dataclass
+
+from openai import APIConnectionError, APIStatusError
+
+from settings.static_dicts import (OPENAI_RETRY_ATTEMPTS,
+                                   OPENAI_RETRY_BASE_DELAY,
+                                   OPENAI_RETRY_MAX_DELAY)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}  # plus every 5xx
+
+
+@dataclass
+class RequestStats:
+    """Counters for tuning concurrency and retries against the account's quota."""
+
+    requests: int = 0  # attempts sent, including retries
+    succeeded: int = 0
+    retried: int = 0
+    rate_limited: int = 0  # 429 responses
+    failed: int = 0  # requests given up on
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def is_rate_limit(error: Exception) -> bool:
+    return isinstance(error, APIStatusError) and error.status_code == 429
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a request that raised error may succeed if sent again.
+
+    :param error: The exception the request raised.
+    :type error: Exception
+    :rtype: bool
+    """
+    if isinstance(error, APIConnectionError):
+        return True  # includes timeouts
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def retry_after(error: Exception) -> float | None:
+    """Seconds the server asked us to wait before retrying, from the Retry-After headers.
+
+    :param error: The exception the request raised.
+    :type error: Exception
+    :returns: The delay in seconds, or None if the server didn't say.
+    :rtype: float or None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return max(float(headers["retry-after-ms"]) / 1000, 0.0)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            # An HTTP date rather than a number of seconds
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """How many times to try a request and how long to wait in between.
+
+    :param attempts: Tries in total, including the first.
+    :type attempts: int
+    :param base_delay: Backoff ceiling in seconds after the first failure, doubled on every further one.
+    :type base_delay: float
+    :param max_delay: Cap on the exponential backoff ceiling.
+    :type max_delay: float
+    """
+
+    def __init__(
+        self,
+        attempts: int = OPENAI_RETRY_ATTEMPTS,
+        base_delay: float = OPENAI_RETRY_BASE_DELAY,
+        max_delay: float = OPENAI_RETRY_MAX_DELAY,
+    ):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, error: Exception, attempt: int) -> bool:
+        """Whether to try again after the given attempt (counted from 1) failed with error."""
+        return attempt < self.attempts and is_retryable(error)
+
+    def delay(self, error: Exception, attempt: int) -> float:
+        """Seconds to wait before the next attempt.
+
+        Full jitter: a uniform draw between zero and the exponential ceiling. When the server
+        sends Retry-After, that is the minimum, with a little jitter added on top.
+
+        :param error: The exception the failed attempt raised.
+        :type error: Exception
+        :param attempt: The failed attempt, counted from 1.
+        :type attempt: int
+        :rtype: float
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        requested = retry_after(error)
+        if requested is not None:
+            return requested + random.uniform(0, self.base_delay)
+        return random.uniform(0, ceiling)
+
+
+class AdaptiveLimiter:
+    """AIMD limit on the number of requests in flight on one event loop.
+
+    Acquire a slot before each attempt and release it with the outcome. Rate limit errors from
+    requests that were sent before the last decrease don't cut the limit again, so one burst
+    of 429s halves it once rather than collapsing it to the minimum.
+
+    :param initial: Starting limit.
+    :type initial: int
+    :param minimum: The limit never drops below this.
+    :type minimum: int
+    :param maximum: The limit never grows beyond this.
+    :type maximum: int
+    :param decrease: Factor the limit is multiplied by on a rate limit error.
+    :type decrease: float
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int | None = None, decrease: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial
+        self.decrease = decrease
+        self._limit = float(min(max(initial, minimum), self.maximum))
+        self.peak = int(self._limit)
+        self.in_flight = 0
+        self._epoch = 0  # bumped on every decrease
+        self._condition = None
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    async def acquire(self) -> int:
+        """Wait for a free slot.
+
+        :returns: A ticket to pass to release.
+        :rtype: int
+        """
+        # Created on first use, because asyncio primitives belong to the loop they're first used on
+        self._condition = self._condition or asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+            return self._epoch
+
+    async def release(self, ticket: int, rate_limited: bool = False, succeeded: bool = False) -> None:
+        """Free a slot and adjust the limit by how the attempt went.
+
+        :param ticket: What acquire returned.
+        :type ticket: int
+        :param rate_limited: The attempt got a 429.
+        :type rate_limited: bool
+        :param succeeded: The attempt succeeded.
+        :type succeeded: bool
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            if rate_limited and ticket == self._epoch:
+                self._limit = max(self.minimum, self._limit * self.decrease)
+                self._epoch += 1
+            elif succeeded:
+                # About one more slot per limit's worth of successes
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+                self.peak = max(self.peak, self.limit)
+            self._condition.notify_all()
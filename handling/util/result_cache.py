@@ -0,0 +1,228 @@
+"""On-disk, content-addressed cache of processed outputs.
+
+Entries are keyed by a hash of the input file's bytes plus everything else that decides the
+output (handler, colour code, target size, pipeline version), so dropping the same artwork
+back into img/ copies the earlier results instead of recomputing them. Each entry stores
+its output files in order with a manifest of their output codes, which the handler maps
+back to destinations for whatever the file is called this time.
+
+The cache is capped in bytes and evicts the least recently used entries. Entries can also be
+given a time to live, after which they count as misses. Clear it with:
+
+    python -m handling.util.result_cache clear
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from settings.static_dicts import RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+
+class ResultCache:
+    """Content-addressed store of output files, shared by every handler and worker.
+
+    :param root: Directory holding the cache entries.
+    :type root: str
+    :param max_bytes: Size the cache is trimmed back to by evict().
+    :type max_bytes: int
+    :param ttl: Seconds an entry stays valid after it is stored, or None to keep entries until evicted.
+    :type ttl: float or None
+    """
+
+    def __init__(self, root: str, max_bytes: int, ttl: float | None = None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(data: bytes, *params) -> str:
+        """Key for an input's bytes combined with the parameters that shape its outputs.
+
+        :param data: Raw bytes of the input file.
+        :type data: bytes
+        :param params: JSON-serialisable values such as handler name, colour code and size.
+        :returns: Hex digest identifying the entry.
+        :rtype: str
+        """
+        digest = hashlib.sha256(data)
+        digest.update(json.dumps(params, default=str).encode())
+        return digest.hexdigest()
+
+    def lookup(self, key: str) -> list | None:
+        """Output codes of a complete entry, or None on a miss.
+
+        :param key: Entry key from make_key.
+        :type key: str
+        :returns: The codes of the stored outputs, in order.
+        :rtype: list or None
+        """
+        manifest_path = os.path.join(self._entry_dir(key), MANIFEST)
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            codes = manifest["codes"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        if self._expired(manifest.get("created", 0)):
+            self.discard(key)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        # Mark the entry as recently used for eviction
+        try:
+            os.utime(manifest_path)
+        except OSError:
+            pass
+        return codes
+
+    def restore(self, key: str, destinations: list[str]) -> None:
+        """Write the stored outputs of an entry to their destinations, in manifest order.
+
+        :param key: Entry key from make_key.
+        :type key: str
+        :param destinations: Paths to write each stored output to.
+        :type destinations: list[str]
+        """
+        entry_dir = self._entry_dir(key)
+        for index, destination in enumerate(destinations):
+            shutil.copyfile(os.path.join(entry_dir, str(index)), destination)
+
+    def store(self, key: str, outputs: list[tuple]) -> None:
+        """Copy freshly written outputs into a new entry.
+
+        The entry is assembled in a temporary directory and renamed into place, so readers
+        never see a partial entry and concurrent workers storing the same key can't clash.
+
+        :param key: Entry key from make_key.
+        :type key: str
+        :param outputs: (code, path) pairs of the outputs just written, in order.
+        :type outputs: list[tuple]
+        """
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+        try:
+            for index, (_, path) in enumerate(outputs):
+                shutil.copyfile(path, os.path.join(staging_dir, str(index)))
+            with open(os.path.join(staging_dir, MANIFEST), "w", encoding="utf-8") as f:
+                json.dump({"codes": [code for code, _ in outputs], "created": time.time()}, f)
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            # Most likely another worker stored the same entry first
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def discard(self, key: str) -> None:
+        """Remove one entry, e.g. to replace it with a fresh result.
+
+        :param key: Entry key from make_key.
+        :type key: str
+        """
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def evict(self) -> int:
+        """Remove expired entries, then least recently used ones until the cache fits within max_bytes.
+
+        :returns: The number of entries removed.
+        :rtype: int
+        """
+        entries = []
+        total = 0
+        removed = 0
+        for entry_dir, last_used, size in self._entries():
+            if self.ttl is not None and self._expired(self._created(entry_dir)):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                removed += 1
+                continue
+            entries.append((last_used, size, entry_dir))
+            total += size
+
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            removed += 1
+
+        if removed:
+            logger.info("Evicted %d result cache entries, %d bytes remain", removed, total)
+        return removed
+
+    def clear(self) -> None:
+        """Delete every cache entry."""
+        shutil.rmtree(self.root, ignore_errors=True)
+        logger.info("Cleared result cache at %s", self.root)
+
+    def stats(self) -> dict[str, int]:
+        """Hit and miss counters for this process.
+
+        :returns: The counters by name.
+        :rtype: dict[str, int]
+        """
+        return {"result_cache_hits": self.hits, "result_cache_misses": self.misses}
+
+    def reset_stats(self) -> None:
+        """Zero the hit and miss counters."""
+        self.hits = self.misses = 0
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    @staticmethod
+    def _created(entry_dir: str) -> float:
+        try:
+            with open(os.path.join(entry_dir, MANIFEST), encoding="utf-8") as f:
+                return json.load(f).get("created", 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _entries(self):
+        if not os.path.isdir(self.root):
+            return
+        for shard in os.scandir(self.root):
+            if not shard.is_dir() or shard.name.startswith(".staging-"):
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    last_used = os.stat(os.path.join(entry.path, MANIFEST)).st_mtime
+                except OSError:
+                    continue  # incomplete entry
+                size = sum(file.stat().st_size for file in os.scandir(entry.path))
+                yield entry.path, last_used, size
+
+
+def main(argv=None) -> None:
+    """Command line access to the result cache."""
+    parser = argparse.ArgumentParser(prog="python -m handling.util.result_cache", description=__doc__.split("\n")[0])
+    parser.add_argument("command", choices=["clear", "evict"], help="clear everything, or trim to the size cap")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES)
+    if args.command == "clear":
+        cache.clear()
+    else:
+        cache.evict()
+
+
+if __name__ == "__main__":
+    main()
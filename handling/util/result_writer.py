@@ -0,0 +1,147 @@
+"""Write base64 image results from the API to disk without holding a decoded copy in memory.
+
+A 1024x1024 PNG result arrives as a few megabytes of base64 text. Decoding it in one go
+keeps a second full copy alive until it is written, for every result landing at once in a
+concurrent batch. Here the text is decoded and written a fixed size chunk at a time to a
+temporary file beside the destination, which is renamed into place only once it is complete,
+so a failed or interrupted write never leaves a truncated image under the real name. A
+result that is post-processed before it is saved has to be held decoded anyway, so it is
+decoded in memory once instead, see decode_base64_png, rather than written and read back.
+
+The PNG signature and IHDR header are checked on the first chunk, so a payload that isn't a
+PNG is rejected before anything else is decoded.
+"""
+
+import base64
+import binascii
+import logging
+import os
+import struct
+import uuid
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024  # base64 characters decoded per write, a multiple of 4
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_IHDR = struct.Struct(">I4sII")  # chunk length, chunk type, width, height
+HEADER_SIZE = len(PNG_SIGNATURE) + _IHDR.size
+
+
+class InvalidResultError(OSError):
+    """Raised when a result payload isn't valid base64 or isn't a PNG."""
+
+
+def write_base64_png(payload: str | bytes, path: str, chunk_size: int = CHUNK_SIZE) -> None:
+    """Decode a base64 PNG to a file, chunk by chunk, replacing the file atomically.
+
+    :param payload: The base64 text, e.g. a result's b64_json.
+    :type payload: str or bytes
+    :param path: File to write.
+    :type path: str
+    :param chunk_size: Base64 characters decoded at a time, rounded down to a multiple of 4.
+    :type chunk_size: int
+    :raises InvalidResultError: If the payload isn't valid base64 or doesn't start with a PNG header.
+    :raises OSError: If the file can't be written.
+    """
+    with staged_base64_png(payload, path, chunk_size):
+        pass
+
+
+def decode_base64_png(payload: str | bytes, result_name: str) -> bytes:
+    """Decode a whole base64 PNG in memory, checking it like write_base64_png does.
+
+    :param payload: The base64 text, e.g. a result's b64_json.
+    :type payload: str or bytes
+    :param result_name: Name used in error messages, e.g. the file the result is for.
+    :type result_name: str
+    :returns: The PNG file's bytes.
+    :rtype: bytes
+    :raises InvalidResultError: If the payload isn't valid base64 or doesn't start with a PNG header.
+    """
+    try:
+        data = base64.b64decode(payload)
+    except binascii.Error as e:
+        raise InvalidResultError(f"Result for {result_name} isn't valid base64: {e}") from e
+    _check_png_header(data, result_name)
+    return data
+
+
+@contextmanager
+def staged_base64_png(payload: str | bytes, path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Decode a base64 PNG to a temporary file beside path, which is moved over path once the block completes.
+
+    The block can read the decoded file and rewrite it in place, e.g. to post-process the image,
+    before it goes live. If the block raises, the temporary file is removed and path is untouched.
+
+    :param payload: The base64 text, e.g. a result's b64_json.
+    :type payload: str or bytes
+    :param path: File to write.
+    :type path: str
+    :param chunk_size: Base64 characters decoded at a time, rounded down to a multiple of 4.
+    :type chunk_size: int
+    :returns: Context manager giving the temporary file's path.
+    :rtype: Iterator[str]
+    :raises InvalidResultError: If the payload isn't valid base64 or doesn't start with a PNG header.
+    :raises OSError: If the file can't be written.
+    """
+    with staged_write(path) as temporary_path:
+        _decode_to(payload, temporary_path, chunk_size, os.path.basename(path))
+        yield temporary_path
+
+
+@contextmanager
+def staged_write(path: str) -> Iterator[str]:
+    """A temporary path beside path, moved over it once the block completes, or removed if the block raises.
+
+    :param path: File to replace.
+    :type path: str
+    :returns: Context manager giving the temporary path to write to.
+    :rtype: Iterator[str]
+    """
+    # Not mkstemp, which would leave the file readable by its owner only
+    directory, name = os.path.split(path)
+    temporary_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex}.part")
+    try:
+        yield temporary_path
+        os.replace(temporary_path, path)
+    except BaseException:
+        try:
+            os.unlink(temporary_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _decode_to(payload: str | bytes, path: str, chunk_size: int, result_name: str) -> None:
+    chunk_size = max(4, chunk_size - chunk_size % 4)
+    # Slices of a str are decoded as they are, slices of bytes through a view, so neither is copied whole
+    if not isinstance(payload, str):
+        payload = memoryview(payload)
+
+    with open(path, "xb") as f:
+        head = b""  # start of the file, held back until the header can be checked
+        for start in range(0, len(payload), chunk_size):
+            try:
+                data = binascii.a2b_base64(payload[start : start + chunk_size])
+            except binascii.Error as e:
+                raise InvalidResultError(f"Result for {result_name} isn't valid base64: {e}") from e
+            if head is not None:
+                head += data
+                if len(head) < HEADER_SIZE:
+                    continue
+                _check_png_header(head, result_name)
+                data, head = head, None
+            f.write(data)
+        if head is not None:
+            _check_png_header(head, result_name)
+
+
+def _check_png_header(data: bytes, result_name: str) -> None:
+    # The signature is followed straight away by the 13 byte IHDR chunk, holding the image's size
+    if not data.startswith(PNG_SIGNATURE) or len(data) < HEADER_SIZE:
+        raise InvalidResultError(f"Result for {result_name} isn't a PNG")
+    length, chunk_type, width, height = _IHDR.unpack_from(data, len(PNG_SIGNATURE))
+    if chunk_type != b"IHDR" or length != 13 or not width or not height:
+        raise InvalidResultError(f"Result for {result_name} has a broken PNG header")
@@ -0,0 +1,92 @@
+"""Shrink avatar inputs to the model's working resolution before they are uploaded.
+
+The image model works at 1024x1024 whatever it is sent, so an 8-20MB render only costs
+upload time. Inputs larger than the working size, or bigger than the byte budget, are
+downscaled and re-encoded in memory: JPEG for opaque images, WebP (PNG where WebP isn't
+available) when there is transparency to keep. Quality is stepped down until the upload
+fits the budget. Inputs that already fit are sent untouched, to avoid a needless lossy
+round trip.
+"""
+
+import io
+import logging
+import os
+
+from PIL import Image, ImageOps, features
+
+from settings.static_dicts import (AVATAR_UPLOAD_MAX_BYTES,
+                                   AVATAR_UPLOAD_QUALITY, AVATAR_UPLOAD_SIZE)
+
+logger = logging.getLogger(__name__)
+
+MIN_QUALITY = 50  # below this the model is working from visible artefacts
+QUALITY_STEP = 10
+UPLOAD_FORMATS = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+def prepare_upload(
+    file_name: str,
+    data: bytes,
+    max_side: int = AVATAR_UPLOAD_SIZE,
+    max_bytes: int = AVATAR_UPLOAD_MAX_BYTES,
+    quality: int = AVATAR_UPLOAD_QUALITY,
+) -> tuple[str, bytes, str]:
+    """Downscale and re-encode an input for upload if it is larger than it needs to be.
+
+    :param file_name: Name of the input, used for the upload's name.
+    :type file_name: str
+    :param data: The input file's contents.
+    :type data: bytes
+    :param max_side: Longest side the upload needs, the model's working resolution.
+    :type max_side: int
+    :param max_bytes: Size budget for one upload.
+    :type max_bytes: int
+    :param quality: Starting JPEG/WebP quality, lowered until the budget is met.
+    :type quality: int
+    :returns: The upload as (file name, contents, MIME type).
+    :rtype: tuple[str, bytes, str]
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        if image.format in UPLOAD_FORMATS and max(image.size) <= max_side and len(data) <= max_bytes:
+            return file_name, data, UPLOAD_FORMATS[image.format]
+
+        # JPEG can decode straight at a fraction of full size, far faster than decoding it all
+        image.draft(None, (max_side, max_side))
+        image = ImageOps.exif_transpose(image)  # re-encoding drops EXIF, so apply its rotation now
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        upload_format, image = _upload_format(image)
+
+        stem = os.path.splitext(file_name)[0]
+        name = f"{stem}.{upload_format.lower().replace('jpeg', 'jpg')}"
+        encoded = _encode(image, upload_format, quality, max_bytes)
+
+    if len(encoded) > max_bytes:
+        logger.warning(
+            "%s is still %d bytes at the lowest quality, over the %d byte budget", file_name, len(encoded), max_bytes
+        )
+    logger.debug("Prepared %s for upload: %d -> %d bytes as %s", file_name, len(data), len(encoded), name)
+    return name, encoded, UPLOAD_FORMATS[upload_format]
+
+
+def _upload_format(image: Image.Image) -> tuple[str, Image.Image]:
+    """Pick the encoding for an image and convert it to a mode that encoding takes."""
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    if not has_alpha:
+        return "JPEG", image.convert("RGB")
+    image = image.convert("RGBA")
+    if image.getextrema()[3][0] == 255:
+        # An alpha channel that is fully opaque carries nothing worth keeping
+        return "JPEG", image.convert("RGB")
+    return ("WEBP" if features.check("webp") else "PNG"), image
+
+
+def _encode(image: Image.Image, upload_format: str, quality: int, max_bytes: int) -> bytes:
+    while True:
+        buffer = io.BytesIO()
+        if upload_format == "PNG":
+            image.save(buffer, "PNG", optimize=True)
+            return buffer.getvalue()  # lossless, so quality can't bring it under budget
+        image.save(buffer, upload_format, quality=quality)
+        if buffer.tell() <= max_bytes or quality - QUALITY_STEP < MIN_QUALITY:
+            return buffer.getvalue()
+        quality -= QUALITY_STEP
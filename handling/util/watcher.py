@@ -0,0 +1,160 @@
+"""Folder watchers that report files which may have been added or changed.
+
+On Linux, InotifyWatcher asks the kernel (through libc via ctypes, no extra dependency)
+to report files as they are closed after writing or moved in, so new stamps are seen
+within milliseconds without rescanning the folder. Everywhere else, or when inotify is
+unavailable (e.g. some network shares), PollingWatcher rescans on an interval.
+
+Watchers only report candidates. A reported file may still be mid-copy, so callers should
+wait for its size and modification time to settle before reading it.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# inotify event flags, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class PollingWatcher:
+    """Reports every file in the watched folders on each check.
+
+    :param root: Folder to watch.
+    :type root: str
+    :param subfolders: Subfolders of root to watch as well.
+    :type subfolders: list[str]
+    """
+
+    def __init__(self, root: str, subfolders: list[str] = ()):
+        self.root = root
+        self.subfolders = list(subfolders)
+
+    def scan(self) -> list[str]:
+        """Every file currently in the watched folders.
+
+        :returns: Paths relative to root, e.g. "stamp.jpg" or "circles/stamp.jpg".
+        :rtype: list[str]
+        """
+        found = []
+        for folder in ["", *self.subfolders]:
+            try:
+                with os.scandir(os.path.join(self.root, folder)) as entries:
+                    found += [os.path.join(folder, entry.name) for entry in entries if entry.is_file()]
+            except FileNotFoundError:
+                continue
+        return found
+
+    def changes(self, timeout: float) -> list[str]:
+        """Wait for the poll interval, then report every file.
+
+        :param timeout: Seconds to wait.
+        :type timeout: float
+        :returns: Paths relative to root.
+        :rtype: list[str]
+        """
+        time.sleep(timeout)
+        return self.scan()
+
+    def close(self) -> None:
+        """Nothing to release for polling."""
+
+
+class InotifyWatcher(PollingWatcher):
+    """Reports files closed after writing or moved into the watched folders, using Linux inotify.
+
+    :param root: Folder to watch.
+    :type root: str
+    :param subfolders: Subfolders of root to watch as well.
+    :type subfolders: list[str]
+    :raises OSError: If inotify isn't available.
+    """
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_Q_OVERFLOW
+
+    def __init__(self, root: str, subfolders: list[str] = ()):
+        super().__init__(root, subfolders)
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._folders = {}  # watch descriptor to folder relative to root
+        for folder in ["", *self.subfolders]:
+            path = os.path.join(self.root, folder)
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(path), self.MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                os.close(self._fd)
+                raise OSError(error, f"inotify_add_watch failed for {path}")
+            self._folders[wd] = folder
+
+    def changes(self, timeout: float) -> list[str]:
+        """Wait up to timeout for files to be written or moved in.
+
+        :param timeout: Seconds to wait when nothing happens.
+        :type timeout: float
+        :returns: Paths relative to root, possibly empty.
+        :rtype: list[str]
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        found = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # The kernel dropped events, so fall back to a full listing
+                logger.warning("inotify queue overflowed, rescanning %s", self.root)
+                return self.scan()
+            if mask & IN_ISDIR or wd not in self._folders:
+                continue
+            found.append(os.path.join(self._folders[wd], name))
+        return found
+
+    def close(self) -> None:
+        """Release the inotify file descriptor."""
+        os.close(self._fd)
+
+
+def create_watcher(root: str, subfolders: list[str] = (), polling: bool = False) -> PollingWatcher:
+    """Create the best watcher available on this platform.
+
+    :param root: Folder to watch.
+    :type root: str
+    :param subfolders: Subfolders of root to watch as well.
+    :type subfolders: list[str]
+    :param polling: Always poll, e.g. for network shares that don't deliver inotify events.
+    :type polling: bool
+    :returns: An InotifyWatcher on Linux when possible, otherwise a PollingWatcher.
+    :rtype: PollingWatcher
+    """
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root, subfolders)
+        except (OSError, AttributeError) as e:
+            logger.warning("inotify unavailable, polling %s instead: %s", root, e)
+    return PollingWatcher(root, subfolders)
@@ -0,0 +1,225 @@
+"""Watch mode: process stamps continuously as they land in a folder, instead of batch-and-wait.
+
+Files are routed to a handler by the subfolder they're dropped into (WATCH_ROUTES), or by
+filename rules for files in the watched folder itself. Each route keeps a warm worker
+pool for the whole session, so a stamp is picked up and processed within seconds of its
+copy finishing. A file is only submitted once its size and modification time have held
+still for WATCH_SETTLE_SECONDS, so half-copied files are never read.
+
+Batches trim the result cache when they finish, which a session never does, so the daemon
+trims it every WATCH_CACHE_EVICT_SECONDS and once more when it stops. Each handler's job
+ledger run covers the whole session, with every file recorded once, when it settles.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from handling.base_image_handler import BaseImageHandler
+from handling.util.executors import default_worker_count
+from handling.util.watcher import create_watcher
+from settings.static_dicts import (VALID_FORMATS, WATCH_CACHE_EVICT_SECONDS,
+                                   WATCH_DEFAULT_ROUTE, WATCH_FILENAME_RULES,
+                                   WATCH_POLL_INTERVAL, WATCH_ROUTES,
+                                   WATCH_SETTLE_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+
+class WatchDaemon:
+    """Watches a folder and feeds settled files to the routed handler's worker pool.
+
+    :param root: Folder to watch.
+    :type root: str
+    :param handler_factory: Called with a route name and input folder to create the handler for that route.
+    :type handler_factory: Callable[[str, str], BaseImageHandler]
+    :param routes: Subfolder name to route name.
+    :type routes: dict[str, str]
+    :param filename_rules: (regex, route name) pairs tried in order for files directly in root.
+    :type filename_rules: list[tuple[str, str]]
+    :param default_route: Route for files in root that match no rule, or None to leave them alone.
+    :type default_route: str or None
+    :param polling: Poll instead of using inotify.
+    :type polling: bool
+    """
+
+    def __init__(
+        self,
+        root: str,
+        handler_factory: Callable[[str, str], BaseImageHandler],
+        routes: dict[str, str] | None = None,
+        filename_rules: list[tuple[str, str]] | None = None,
+        default_route: str | None = WATCH_DEFAULT_ROUTE,
+        polling: bool = False,
+    ):
+        self.root = root
+        self.handler_factory = handler_factory
+        self.routes = WATCH_ROUTES if routes is None else routes
+        rules = WATCH_FILENAME_RULES if filename_rules is None else filename_rules
+        self.filename_rules = [(re.compile(pattern), route) for pattern, route in rules]
+        self.default_route = default_route
+        self.polling = polling
+        self.settle_seconds = WATCH_SETTLE_SECONDS
+        self.poll_interval = WATCH_POLL_INTERVAL
+        self.evict_interval = WATCH_CACHE_EVICT_SECONDS
+        self.watcher = None
+        self.processed = 0
+        self.failed = 0
+        self._pools = {}  # (folder, route) to (handler, executor, task)
+        self._pending = {}  # path relative to root to (fingerprint, monotonic time it was first seen unchanged)
+        self._attempted = {}  # (folder, working name) to the fingerprint submitted, so files aren't resubmitted
+        self._lock = threading.Lock()
+        self._last_evicted = time.monotonic()
+
+    def route(self, path: str) -> str | None:
+        """Pick the route for a file.
+
+        :param path: Path relative to root.
+        :type path: str
+        :returns: The route name, or None if the file isn't for this daemon.
+        :rtype: str or None
+        """
+        folder, name = os.path.split(path)
+        if folder:
+            return self.routes.get(folder)
+        for pattern, route in self.filename_rules:
+            if pattern.search(name):
+                return route
+        return self.default_route
+
+    def run(self, stop: threading.Event | None = None) -> None:
+        """Watch and process until stopped or interrupted with Ctrl+C.
+
+        :param stop: Set from another thread to end the session.
+        :type stop: threading.Event or None
+        """
+        stop = stop or threading.Event()
+        self.start()
+        try:
+            while not stop.is_set():
+                self.tick()
+        except KeyboardInterrupt:
+            logger.info("Watch interrupted")
+        finally:
+            self.close()
+
+    def start(self) -> None:
+        """Create the routed subfolders, start the watcher and warm up a worker pool per route."""
+        for folder, route in self.routes.items():
+            os.makedirs(os.path.join(self.root, folder), exist_ok=True)
+            self._pool(folder, route)
+        self.watcher = create_watcher(self.root, list(self.routes), polling=self.polling)
+        logger.info("Watching %s with %s, routes: %s", self.root, type(self.watcher).__name__, self.routes)
+        # Anything already waiting is picked up like a new arrival
+        self._observe(self.watcher.scan())
+
+    def tick(self) -> None:
+        """Wait up to one poll interval for changes, then submit every file that has finished writing."""
+        self._observe(self.watcher.changes(self.poll_interval))
+        ready = {}
+        for path, fingerprint in self._settled(time.monotonic()):
+            folder, name = os.path.split(path)
+            ready.setdefault((folder, self.route(path)), []).append((name, fingerprint))
+        for (folder, route), files in ready.items():
+            self._submit(folder, route, files)
+        if time.monotonic() - self._last_evicted >= self.evict_interval:
+            self._evict_caches()
+
+    def close(self) -> None:
+        """Let in-flight files finish, then shut the worker pools and watcher down."""
+        for _, executor, _ in self._pools.values():
+            executor.shutdown(wait=True)
+        self._evict_caches()
+        self._pools.clear()
+        if self.watcher is not None:
+            self.watcher.close()
+        logger.info("Watch stopped: %d files processed, %d failed", self.processed, self.failed)
+
+    def _evict_caches(self) -> None:
+        """Trim each result cache the routes use back to its size cap."""
+        self._last_evicted = time.monotonic()
+        # Routes normally share one cache directory, which only needs walking once
+        caches = {
+            handler.result_cache.root: handler.result_cache
+            for handler, _, _ in self._pools.values()
+            if handler.result_cache is not None
+        }
+        for cache in caches.values():
+            try:
+                cache.evict()
+            except OSError:
+                logger.exception("Failed to trim the result cache at %s", cache.root)
+
+    def _observe(self, paths: list[str]) -> None:
+        for path in paths:
+            name = os.path.basename(path)
+            if path in self._pending or name.startswith(".") or not name.lower().endswith(VALID_FORMATS):
+                continue
+            if self.route(path) is not None:
+                self._pending[path] = None
+
+    def _settled(self, now: float) -> list[tuple[str, tuple[int, int]]]:
+        """Pending files whose size and modification time haven't changed for the settle time."""
+        ready = []
+        for path, seen in list(self._pending.items()):
+            try:
+                stat = os.stat(os.path.join(self.root, path))
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+
+            fingerprint = (stat.st_size, stat.st_mtime_ns)
+            folder, name = os.path.split(path)
+            with self._lock:
+                attempted = self._attempted.get((folder, BaseImageHandler.working_name(name)))
+            if attempted == fingerprint:
+                # Already submitted, this is the same file renamed to png or left behind after failing
+                del self._pending[path]
+            elif seen is None or seen[0] != fingerprint or stat.st_size == 0:
+                self._pending[path] = (fingerprint, now)
+            elif now - seen[1] >= self.settle_seconds:
+                del self._pending[path]
+                ready.append((path, fingerprint))
+        return ready
+
+    def _pool(self, folder: str, route: str):
+        pool = self._pools.get((folder, route))
+        if pool is None:
+            handler = self.handler_factory(route, os.path.join(self.root, folder) if folder else self.root)
+            # The pipeline backend is batch-shaped, so stream single files through a thread pool instead
+            backend = "thread" if handler.executor_backend == "pipeline" else handler.executor_backend
+            executor, task = handler.open_executor(backend)
+            # Start every worker now, so the first stamp doesn't wait for process start-up
+            for _ in range(handler.max_workers or default_worker_count()):
+                executor.submit(os.getpid)
+            pool = self._pools[(folder, route)] = (handler, executor, task)
+        return pool
+
+    def _submit(self, folder: str, route: str, files: list[tuple[str, tuple[int, int]]]) -> None:
+        handler, executor, task = self._pool(folder, route)
+        handler.discover([name for name, _ in files], new_run=False)
+        for name, fingerprint in files:
+            key = (folder, handler.working_name(name))
+            with self._lock:
+                self._attempted[key] = fingerprint
+            logger.info("Submitting %s to %s", os.path.join(folder, name), route)
+            future = executor.submit(task, name)
+            future.add_done_callback(lambda future, handler=handler, key=key: self._done(handler, key, future))
+
+    def _done(self, handler: BaseImageHandler, key: tuple[str, str], future: Future) -> None:
+        # Runs on whichever thread finished the future
+        error = future.exception()
+        if error is not None:
+            logger.error("Unexpected error processing %s", key[1], exc_info=error)
+        # The handler archives a file once all its outputs are saved, so one left behind failed
+        finished = error is None and not os.path.exists(os.path.join(handler.input_dir, key[1]))
+        with self._lock:
+            if finished:
+                self.processed += 1
+                self._attempted.pop(key, None)
+            else:
+                self.failed += 1
@@ -1,5 +1,6 @@
 """Stampede Resizer — main entry point."""
 
+import multiprocessing
 import os
 import sys
 
@@ -23,4 +24,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Lets process pool workers start from the frozen exe instead of relaunching the GUI
+    multiprocessing.freeze_support()
     main()
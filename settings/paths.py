@@ -15,3 +15,25 @@ def resource_path(relative_path: str) -> str:
     else:
         base = os.path.abspath(".")
     return os.path.join(base, relative_path)
+
+
+def local_data_path(relative_path: str) -> str:
+    """Resolve a path under the per-user local data folder, for state that must not be shared.
+
+    The job ledger and result caches live here rather than next to img/ or the exe, since those
+    are often on a network share, where SQLite's WAL mode doesn't work. Set STAMPEDE_DATA_DIR to
+    use another folder.
+
+    On Windows this is %LOCALAPPDATA%/stampede, on macOS ~/Library/Application Support/stampede,
+    elsewhere $XDG_DATA_HOME/stampede or ~/.local/share/stampede.
+    """
+    base = os.environ.get("STAMPEDE_DATA_DIR")
+    if not base:
+        if os.name == "nt":
+            root = os.environ.get("LOCALAPPDATA") or os.path.expanduser(os.path.join("~", "AppData", "Local"))
+        elif sys.platform == "darwin":
+            root = os.path.expanduser(os.path.join("~", "Library", "Application Support"))
+        else:
+            root = os.environ.get("XDG_DATA_HOME") or os.path.expanduser(os.path.join("~", ".local", "share"))
+        base = os.path.join(root, "stampede")
+    return os.path.join(os.path.abspath(base), relative_path)
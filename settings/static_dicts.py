@@ -1,5 +1,7 @@
 """Static configuration dictionaries for colors, paths, and settings."""
 
+from settings.paths import local_data_path
+
 COLOURS = {
     "R": (255, 0, 0, 255),  # Red
     "G": (60, 179, 113, 255),  # Medium Sea Green
@@ -26,6 +28,51 @@ RECT_PATHS = {
 VALID_FORMATS = ("jpg", "png", "jpeg", "webp")
 IMAGE_QUALITY = 100
 STANDARD_IMG_SIZE = None  # (200,200)
+RECOLOUR_ENGINE = "auto"  # "numpy", "pillow", or "auto" to use NumPy when installed
+EXECUTOR_BACKEND = "process"  # "serial", "thread", "process" or "pipeline"
+MAX_WORKERS = None  # None uses one worker per core
+PIPELINE_QUEUE_SIZE = 4  # Items allowed to wait between each pipeline stage
+MASK_CACHE_MAX_BYTES = 64 * 1024 * 1024  # Memory allowed for cached circle masks, per worker
+CIRCLE_MASK_ANTIALIAS = False  # Smooth the circle edge with a supersampled mask
+MASK_SUPERSAMPLE = 4  # Scale the anti-aliased mask is drawn at before being reduced
+RESULT_CACHE_ENABLED = True  # Reuse earlier outputs when identical artwork is processed again
+RESULT_CACHE_DIR = local_data_path("cache")  # Per-user local folder, never next to a shared img/
+RESULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+PIPELINE_VERSION = 1  # Bump whenever image processing changes, so cached outputs aren't reused
+JOB_LEDGER_ENABLED = True  # Record per-file progress so interrupted batches can be resumed
+JOB_LEDGER_PATH = local_data_path("ledger.sqlite3")  # Local disk only: SQLite WAL fails on network shares
+WATCH_ROUTES = {"circles": "circles", "rectangles": "rectangles"}  # Watched subfolder to handler
+WATCH_FILENAME_RULES = []  # (regex, handler) pairs for files in the watched folder itself, e.g. (r"^C_", "circles")
+WATCH_DEFAULT_ROUTE = None  # Handler for files in the watched folder that match no rule, None to leave them
+WATCH_SETTLE_SECONDS = 1.0  # How long a file's size must hold still before it's treated as fully written
+WATCH_POLL_INTERVAL = 0.5  # Seconds between checks for new and settling files
+WATCH_CACHE_EVICT_SECONDS = 300  # How often watch mode trims the result cache back to RESULT_CACHE_MAX_BYTES
+LEASES_ENABLED = False  # Claim files with lease files, so several machines can share one img/ folder
+LEASE_DIR = ".leases"  # Folder for lease files, inside the input folder
+LEASE_TTL_SECONDS = 60  # A lease without a heartbeat for this long belongs to a crashed node
+LEASE_HEARTBEAT_SECONDS = 15
+AVATAR_INITIAL_CONCURRENCY = 10  # Avatar generations in flight at the start of a batch
+AVATAR_MAX_CONCURRENCY = 50  # Ceiling for the in-flight limit, which grows until OpenAI rate limits us
+OPENAI_RETRY_ATTEMPTS = 5  # Tries per request for 429s, 5xx errors and dropped connections
+OPENAI_RETRY_BASE_DELAY = 1.0  # Seconds, doubled after every failed attempt and jittered
+OPENAI_RETRY_MAX_DELAY = 60.0
+AVATAR_UPLOAD_SIZE = 1024  # Longest side of avatar uploads, the model's working resolution
+AVATAR_UPLOAD_MAX_BYTES = 1_500_000  # Size budget per upload, JPEG/WebP quality is lowered to meet it
+AVATAR_UPLOAD_QUALITY = 90  # Starting quality for re-encoded uploads
+AVATAR_PARTIAL_IMAGES = 2  # Partial frames streamed per generation as GUI previews, ~100 extra tokens each; 0 for none
+AVATAR_DEDUPE_ENABLED = True  # Send one request for inputs that are the same picture, e.g. a JPEG and PNG copy
+AVATAR_DEDUPE_MAX_DISTANCE = 6  # Most bits two perceptual hashes may differ by and still count as the same picture
+AVATAR_PACKING_ENABLED = False  # Tile small inputs into shared requests to save request quota, splitting the result
+AVATAR_PACK_SIZE = 4  # Inputs per packed request, 2 to 4
+AVATAR_PACK_MAX_SIDE = 512  # Only inputs this small are packed, as each comes back at about half the full size
+AVATAR_REMOVE_BACKGROUND = False  # Make the white background around generated avatars transparent
+AVATAR_BACKGROUND_WHITE = 240  # Channel level from which a pixel counts as background white
+AVATAR_BACKGROUND_SOFTNESS = 20  # Levels below that over which edge pixels fade back to opaque
+AVATAR_TO_CIRCLES = False  # Also make a circle stamp from every new avatar, in memory, saved with the circles
+AVATAR_CACHE_ENABLED = False  # Reuse the stored avatar for the same image, prompt and model settings
+AVATAR_CACHE_DIR = local_data_path("avatar-cache")
+AVATAR_CACHE_MAX_BYTES = 512 * 1024 * 1024
+AVATAR_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # Regenerate after a month, None to keep until evicted
 
 IMAGE_DIR = "img"
 PROCESSED_DIR_CIRCLE = "img/Processed/Circles"
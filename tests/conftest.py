@@ -1,8 +1,8 @@
 """Shared test fixtures for handler unit tests.
 
-All handler constructors hit the filesystem (init_directories, os.listdir).
-The autouse fixture below patches these globally so any handler can be
-instantiated in tests without a real img/ directory.
+All handler constructors hit the filesystem (init_directories, os.listdir,
+the result cache and job ledger). The autouse fixture below patches these globally so any
+handler can be instantiated in tests without a real img/ directory.
 """
 
 import base64
@@ -23,14 +23,19 @@ def patch_handler_init():
     with (
         patch("settings.init_dirs.init_directories"),
         patch("handling.base_image_handler.os.listdir", return_value=[]),
+        patch("handling.base_image_handler.RESULT_CACHE_ENABLED", False),
+        patch("handling.base_image_handler.JOB_LEDGER_ENABLED", False),
     ):
         yield
 
 
 @pytest.fixture
 def mock_openai_client():
-    """Patches the OpenAI client factory so avatar handlers can be instantiated."""
-    with patch("handling.avatar_base_handler.create_openai_client", return_value=MagicMock()):
+    """Patches the OpenAI client factories so avatar handlers can be instantiated and run."""
+    with (
+        patch("handling.avatar_base_handler.create_openai_client", return_value=MagicMock()),
+        patch("handling.avatar_base_handler.create_async_openai_client", return_value=MagicMock()),
+    ):
         yield
 
 
@@ -90,3 +95,18 @@ def mock_openai_response():
     response = MagicMock()
     response.b64_json = b64
     return response
+
+
+@pytest.fixture
+def api_error():
+    """Factory for OpenAI API status errors, e.g. api_error(429, {"retry-after": "2"})."""
+    import openai
+
+    def make(status_code, headers=None):
+        response = MagicMock(status_code=status_code, headers=headers or {})
+        error_class = {429: openai.RateLimitError, 500: openai.InternalServerError}.get(
+            status_code, openai.APIStatusError
+        )
+        return error_class(f"Error code: {status_code}", response=response, body=None)
+
+    return make
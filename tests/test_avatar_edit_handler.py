@@ -6,7 +6,14 @@ Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
 - THEN: the expected outcome is asserted
 """
 
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
 import pytest
+from PIL import Image
+
+from handling.util.result_cache import ResultCache
 
 
 class TestValidateSingleImage:
@@ -57,3 +64,111 @@ class TestValidateSingleImage:
         # THEN it should raise as if the directory were empty
         with pytest.raises(ValueError, match="No image found"):
             avatar_edit_handler.validate_single_image()
+
+
+class TestProcessEditAvatar:
+    def test_cached_edit_skips_the_request(self, avatar_edit_handler, mock_openai_response, tmp_path, monkeypatch):
+        # GIVEN an edit handler with an avatar cache, and an image to edit twice
+        (tmp_path / "in").mkdir()
+        avatar_edit_handler.input_dir, avatar_edit_handler.output_dir = str(tmp_path / "in"), str(tmp_path)
+        avatar_edit_handler.avatar_cache = ResultCache(str(tmp_path / "cache"), max_bytes=1_000_000)
+        request = MagicMock(return_value=mock_openai_response)
+        monkeypatch.setattr(avatar_edit_handler, "_execute_edit_request", request)
+        monkeypatch.setattr(avatar_edit_handler, "_archive_image", lambda name: True)
+        Image.new("RGB", (32, 32), (200, 30, 30)).save(tmp_path / "in" / "avatar.png")
+
+        # WHEN the same edit is requested twice, then forced
+        first = avatar_edit_handler.process_edit_avatar("add a hat", "avatar.png")
+        second = avatar_edit_handler.process_edit_avatar("add a hat", "avatar.png")
+        avatar_edit_handler.process_edit_avatar("add a hat", "avatar.png", force_regenerate=True)
+
+        # THEN only the first and the forced edit should reach the API, each run saving the edit
+        assert request.call_count == 2
+        assert first.endswith("_edited.png") and open(second, "rb").read()[:4] == b"\x89PNG"
+
+    def test_failed_edit_returns_none(self, avatar_edit_handler, tmp_path, monkeypatch):
+        # GIVEN an API request that fails
+        avatar_edit_handler.input_dir = str(tmp_path)
+        Image.new("RGB", (32, 32)).save(tmp_path / "avatar.png")
+        monkeypatch.setattr(avatar_edit_handler, "_execute_edit_request", lambda prompt, image: None)
+
+        # WHEN editing
+        # THEN nothing should be reported as saved
+        assert avatar_edit_handler.process_edit_avatar("add a hat", "avatar.png") is None
+
+
+class _FakeAsyncClient:
+    """Stands in for AsyncOpenAI, answering images.edit with the given coroutine function."""
+
+    def __init__(self, edit):
+        self.images = SimpleNamespace(edit=edit)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+
+class TestProcessEditAvatars:
+    @pytest.fixture
+    def batch_handler(self, avatar_edit_handler, mock_openai_response, tmp_path, monkeypatch):
+        """An edit handler over real folders holding cat.png with a sidecar prompt, dog.png and dog.jpg."""
+        for folder in ("in", "out", "archive"):
+            (tmp_path / folder).mkdir()
+        for name in ("cat.png", "dog.png", "dog.jpg"):
+            Image.new("RGB", (32, 32), (200, 30, 30)).save(tmp_path / "in" / name)
+        (tmp_path / "in" / "cat.txt").write_text("give the cat a crown\n", encoding="utf-8")
+        avatar_edit_handler.input_dir, avatar_edit_handler.output_dir = str(tmp_path / "in"), str(tmp_path / "out")
+        avatar_edit_handler.archive_dir = str(tmp_path / "archive")
+        monkeypatch.setattr("handling.avatar_edit_handler.os.listdir", lambda _: ["cat.png", "dog.png", "dog.jpg"])
+        avatar_edit_handler.calls, avatar_edit_handler.failing = {}, None
+
+        async def edit(**params):
+            name = params["image"][0]
+            avatar_edit_handler.calls[name] = params["prompt"]
+            if name == avatar_edit_handler.failing:
+                raise ValueError("not retryable")
+            return SimpleNamespace(data=[mock_openai_response])
+
+        monkeypatch.setattr(avatar_edit_handler, "_open_async_client", lambda: _FakeAsyncClient(edit))
+        return avatar_edit_handler
+
+    def test_every_image_is_edited_with_its_own_or_the_shared_prompt(self, batch_handler, tmp_path):
+        # GIVEN three images, one with a sidecar prompt
+        # WHEN editing them as a batch
+        saved = batch_handler.process_edit_avatars("add a hat")
+
+        # THEN the sidecar should override the shared prompt for its image only
+        assert batch_handler.calls == {
+            "cat.png": "give the cat a crown",
+            "dog.png": "add a hat",
+            "dog.jpg": "add a hat",
+        }
+        # AND each edit should be named after its input, without the two dogs overwriting each other
+        outputs = sorted(entry.name for entry in os.scandir(tmp_path / "out"))
+        assert outputs == ["cat_edited.png", "dog_edited.png", "dog_edited_2.png"]
+        assert len(saved) == 3
+        # AND the inputs should be archived along with the sidecar
+        archived = sorted(entry.name for entry in os.scandir(tmp_path / "archive"))
+        assert archived == ["cat.png", "cat.txt", "dog.jpg", "dog.png"]
+
+    def test_failed_edit_leaves_its_input_in_place(self, batch_handler, tmp_path):
+        # GIVEN an edit that fails for one of the images
+        batch_handler.failing = "dog.jpg"
+
+        # WHEN editing the batch
+        saved = batch_handler.process_edit_avatars("add a hat")
+
+        # THEN the other edits should still be saved, and the failed input kept for another try
+        assert len(saved) == 2
+        assert sorted(entry.name for entry in os.scandir(tmp_path / "in")) == ["dog.jpg"]
+
+    def test_no_images_raises(self, avatar_edit_handler, monkeypatch):
+        # GIVEN an empty img directory
+        monkeypatch.setattr("handling.avatar_edit_handler.os.listdir", lambda _: [])
+
+        # WHEN editing as a batch
+        # THEN a ValueError should be raised before any request is made
+        with pytest.raises(ValueError, match="No image found"):
+            avatar_edit_handler.process_edit_avatars("add a hat")
@@ -6,68 +6,614 @@ Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
 - THEN: the expected outcome is asserted
 """
 
+import asyncio
+import base64
+import io
 import logging
-from unittest.mock import MagicMock
+import os
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image, ImageDraw, ImageOps
 
 from handling.avatar_base_handler import AvatarBaseHandler
+from handling.avatar_handler import AvatarHandler
+from handling.util.request_control import RetryPolicy
+from handling.util.result_cache import ResultCache
 
 
-class TestExecuteModelRequest:
-    def _make_mock_image(self, name):
-        """Helper to create a mock file object with a .name attribute."""
-        img = MagicMock()
-        img.name = name
-        return img
+def _returning(respond):
+    """An async stand-in for _execute_edit_request_async that answers with respond(file name)."""
+
+    async def request(self, client, user_prompt, load_image):
+        return respond(load_image()[0])
+
+    return request
+
+
+class _FakeAsyncClient:
+    """Stands in for AsyncOpenAI, answering images.edit with the given coroutine function."""
+
+    def __init__(self, edit):
+        self.images = SimpleNamespace(edit=edit)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
 
+
+@pytest.fixture(autouse=True)
+def stored(avatar_handler, monkeypatch):
+    """Records saves and archives on avatar_handler.stored instead of touching the filesystem."""
+    avatar_handler.stored = []
+    monkeypatch.setattr(avatar_handler, "_load_input", lambda name: (name, b"", "image/png"))
+    monkeypatch.setattr(
+        avatar_handler, "_save_avatar", lambda name, image: avatar_handler.stored.append(("save", name, image))
+    )
+    monkeypatch.setattr(avatar_handler, "_archive_image", lambda name: avatar_handler.stored.append(("archive", name)))
+
+
+class TestExecuteModelRequest:
     def test_successful_results_collected(self, avatar_handler, mock_openai_response, monkeypatch):
         # GIVEN one input image and a successful API response
-        mock_image = self._make_mock_image("img/test.png")
-        monkeypatch.setattr(AvatarBaseHandler, "_execute_edit_request", lambda self, p, i: mock_openai_response)
-        monkeypatch.setattr(avatar_handler, "_save_avatars", lambda x: None)
+        monkeypatch.setattr(
+            AvatarBaseHandler, "_execute_edit_request_async", _returning(lambda name: mock_openai_response)
+        )
 
         # WHEN executing the model request
-        result = avatar_handler._execute_model_requests("prompt", [mock_image])
+        result = avatar_handler._execute_model_requests("prompt", ["test.png"])
 
-        # THEN the result should contain the filename paired with the response
-        assert len(result) == 1
-        assert result[0] == ("test.png", mock_openai_response)
+        # THEN the input should be reported as saved, and its avatar saved and archived
+        assert result == ["test.png"]
+        assert avatar_handler.stored == [("save", "test.png", mock_openai_response), ("archive", "test.png")]
 
     def test_none_results_skipped(self, avatar_handler, monkeypatch):
         # GIVEN one input image and an API that returns None (failure)
-        mock_image = self._make_mock_image("img/failed.png")
-        monkeypatch.setattr(AvatarBaseHandler, "_execute_edit_request", lambda self, p, i: None)
-        monkeypatch.setattr(avatar_handler, "_save_avatars", lambda x: None)
+        monkeypatch.setattr(AvatarBaseHandler, "_execute_edit_request_async", _returning(lambda name: None))
 
         # WHEN executing the model request
-        result = avatar_handler._execute_model_requests("prompt", [mock_image])
+        result = avatar_handler._execute_model_requests("prompt", ["failed.png"])
 
-        # THEN no results should be collected
-        assert len(result) == 0
+        # THEN nothing should be saved, and the input should stay put to be retried
+        assert result == []
+        assert avatar_handler.stored == []
 
     def test_mixed_success_and_failure(self, avatar_handler, mock_openai_response, monkeypatch):
         # GIVEN two images where the first succeeds and the second fails
-        img_ok = self._make_mock_image("img/good.png")
-        img_fail = self._make_mock_image("img/bad.png")
-        responses = {"img/good.png": mock_openai_response, "img/bad.png": None}
-        monkeypatch.setattr(AvatarBaseHandler, "_execute_edit_request", lambda self, p, i: responses[i.name])
-        monkeypatch.setattr(avatar_handler, "_save_avatars", lambda x: None)
+        responses = {"good.png": mock_openai_response, "bad.png": None}
+        monkeypatch.setattr(AvatarBaseHandler, "_execute_edit_request_async", _returning(lambda name: responses[name]))
 
         # WHEN executing the model request
-        result = avatar_handler._execute_model_requests("prompt", [img_ok, img_fail])
+        result = avatar_handler._execute_model_requests("prompt", ["good.png", "bad.png"])
 
-        # THEN only the successful result should be collected
-        assert len(result) == 1
-        assert result[0][0] == "good.png"
+        # THEN only the successful result should be saved and archived
+        assert result == ["good.png"]
+        assert [call[1] for call in avatar_handler.stored] == ["good.png", "good.png"]
 
     def test_failure_is_logged(self, avatar_handler, monkeypatch, caplog):
         # GIVEN an input image and an API that returns None
-        mock_image = self._make_mock_image("img/broken.png")
-        monkeypatch.setattr(AvatarBaseHandler, "_execute_edit_request", lambda self, p, i: None)
-        monkeypatch.setattr(avatar_handler, "_save_avatars", lambda x: None)
+        monkeypatch.setattr(AvatarBaseHandler, "_execute_edit_request_async", _returning(lambda name: None))
 
         # WHEN executing the model request
         with caplog.at_level(logging.ERROR):
-            avatar_handler._execute_model_requests("prompt", [mock_image])
+            avatar_handler._execute_model_requests("prompt", ["broken.png"])
 
         # THEN the failure should be logged with the filename
         assert "broken.png" in caplog.text
+
+    def test_in_flight_requests_are_capped(self, avatar_handler, mock_openai_response, monkeypatch):
+        # GIVEN twenty images, a concurrency ceiling of five and a slow API
+        in_flight = peak = 0
+
+        async def slow_edit(**params):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return SimpleNamespace(data=[mock_openai_response])
+
+        monkeypatch.setattr(avatar_handler, "_open_async_client", lambda: _FakeAsyncClient(slow_edit))
+        avatar_handler.max_concurrency = 5
+        images = [f"{i}.png" for i in range(20)]
+
+        # WHEN executing the model requests
+        result = avatar_handler._execute_model_requests("prompt", images)
+
+        # THEN every image should get a result, with no more than five requests outstanding at once
+        assert len(result) == 20
+        assert peak == 5
+
+    def test_requests_share_one_client(self, avatar_handler, mock_openai_response, monkeypatch):
+        # GIVEN a batch of three images
+        clients = set()
+
+        async def request(self, client, user_prompt, load_image):
+            clients.add(id(client))
+            return mock_openai_response
+
+        monkeypatch.setattr(AvatarBaseHandler, "_execute_edit_request_async", request)
+        images = [f"{i}.png" for i in range(3)]
+
+        # WHEN executing the model requests
+        avatar_handler._execute_model_requests("prompt", images)
+
+        # THEN they should all go through the same client, and so the same connection pool
+        assert len(clients) == 1
+
+
+class TestRetries:
+    def _run(self, avatar_handler, edit, monkeypatch):
+        monkeypatch.setattr(avatar_handler, "_open_async_client", lambda: _FakeAsyncClient(edit))
+        avatar_handler.retry_policy = RetryPolicy(attempts=3, base_delay=0)
+        return avatar_handler._execute_model_requests("prompt", ["stamp.png"])
+
+    def test_rate_limited_request_is_retried(self, avatar_handler, mock_openai_response, api_error, monkeypatch):
+        # GIVEN an API that rate limits the first attempt
+        responses = [api_error(429, {"retry-after-ms": "1"}), SimpleNamespace(data=[mock_openai_response])]
+
+        async def edit(**params):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        # WHEN requesting an avatar
+        result = self._run(avatar_handler, edit, monkeypatch)
+
+        # THEN it should be retried and succeed, with the retry and the 429 counted
+        assert result == ["stamp.png"]
+        stats = avatar_handler.request_stats
+        assert (stats.requests, stats.succeeded, stats.retried, stats.rate_limited, stats.failed) == (2, 1, 1, 1, 0)
+
+    def test_persistent_server_errors_give_up(self, avatar_handler, api_error, monkeypatch):
+        # GIVEN an API that keeps failing with a 500
+        async def edit(**params):
+            raise api_error(500)
+
+        # WHEN requesting an avatar
+        result = self._run(avatar_handler, edit, monkeypatch)
+
+        # THEN it should stop after the configured attempts and report the avatar as failed
+        assert result == []
+        assert (avatar_handler.request_stats.requests, avatar_handler.request_stats.failed) == (3, 1)
+
+    def test_bad_request_is_not_retried(self, avatar_handler, api_error, monkeypatch):
+        # GIVEN an API that rejects the request outright
+        async def edit(**params):
+            raise api_error(400)
+
+        # WHEN requesting an avatar
+        result = self._run(avatar_handler, edit, monkeypatch)
+
+        # THEN it should fail at once, since sending it again can't help
+        assert result == []
+        assert (avatar_handler.request_stats.requests, avatar_handler.request_stats.retried) == (1, 0)
+
+
+class TestStreamingResults:
+    def test_each_result_is_stored_before_the_batch_finishes(self, avatar_handler, mock_openai_response, monkeypatch):
+        # GIVEN a fast request and one that is still waiting on the API
+        release_slow = asyncio.Event()
+        stored_while_waiting = []
+
+        async def edit(**params):
+            if params["image"][0] == "slow.png":
+                await asyncio.sleep(0.05)
+                stored_while_waiting.extend(avatar_handler.stored)
+                release_slow.set()
+            return SimpleNamespace(data=[mock_openai_response])
+
+        monkeypatch.setattr(avatar_handler, "_open_async_client", lambda: _FakeAsyncClient(edit))
+        # WHEN executing the batch
+        result = avatar_handler._execute_model_requests("prompt", ["slow.png", "fast.png"])
+
+        # THEN the fast avatar should already be saved and archived while the slow one waits
+        assert sorted(result) == ["fast.png", "slow.png"]
+        assert [call[:2] for call in stored_while_waiting] == [("save", "fast.png"), ("archive", "fast.png")]
+
+    def test_save_failure_leaves_input_unarchived(self, avatar_handler, mock_openai_response, monkeypatch, caplog):
+        # GIVEN an avatar that can't be written, e.g. because the disk is full
+        def fail(name, image):
+            raise OSError("No space left on device")
+
+        monkeypatch.setattr(avatar_handler, "_save_avatar", fail)
+        monkeypatch.setattr(
+            AvatarBaseHandler, "_execute_edit_request_async", _returning(lambda name: mock_openai_response)
+        )
+
+        # WHEN executing the batch
+        with caplog.at_level(logging.ERROR):
+            result = avatar_handler._execute_model_requests("prompt", ["full.png"])
+
+        # THEN the input should not be archived, so the next run picks it up again
+        assert result == []
+        assert avatar_handler.stored == []
+        assert "full.png" in caplog.text
+
+
+class TestSaveAvatar:
+    def test_decodes_response_to_png(self, avatar_handler, mock_openai_response, tmp_path):
+        # GIVEN an output folder and a generated image
+        avatar_handler.output_dir = str(tmp_path)
+
+        # WHEN saving it, bypassing the recording stand-in
+        AvatarHandler._save_avatar(avatar_handler, "stamp.jpg", mock_openai_response)
+
+        # THEN a decoded PNG should be written, named after the input
+        assert (tmp_path / "stamp_avatar.png").read_bytes()[:8] == b"\x89PNG\r\n\x1a\n"
+
+
+class TestPostProcessing:
+    @pytest.fixture
+    def white_avatar(self, avatar_handler, tmp_path):
+        avatar_handler.output_dir = str(tmp_path)
+        avatar_handler.remove_background = True
+        image = _disc((64, 64))
+        ImageDraw.Draw(image).rectangle((30, 30, 34, 34), fill=(255, 255, 255))
+        return SimpleNamespace(b64_json=base64.b64encode(_png(image)))
+
+    def test_white_background_is_made_transparent(self, avatar_handler, white_avatar, tmp_path):
+        # WHEN saving an avatar drawn on white, with white inside its subject too
+        AvatarHandler._save_avatar(avatar_handler, "stamp.jpg", white_avatar)
+
+        # THEN the background should be transparent, and the subject, white included, opaque
+        with Image.open(tmp_path / "stamp_avatar.png") as avatar:
+            assert avatar.mode == "RGBA"
+            assert avatar.getpixel((2, 2))[3] == 0
+            assert avatar.getpixel((20, 32))[3] == 255
+            assert avatar.getpixel((32, 32))[3] == 255
+
+    def test_avatar_is_handed_on_to_circles(self, avatar_handler, white_avatar, tmp_path):
+        # GIVEN avatars set to be made into circle stamps too
+        from handling.imagehandler.circle_handler import CircleHandler
+
+        avatar_handler.circle_handler = CircleHandler(str(tmp_path), str(tmp_path / "circles"))
+
+        # WHEN saving an avatar
+        AvatarHandler._save_avatar(avatar_handler, "stamp.jpg", white_avatar)
+
+        # THEN a circle stamp should be saved from it as well, without a file to read it from
+        assert (tmp_path / "stamp_avatar.png").exists()
+        assert [entry.name for entry in os.scandir(tmp_path / "circles")] == ["resized_stamp.png"]
+
+    def test_failed_circle_does_not_fail_the_avatar(self, avatar_handler, white_avatar, tmp_path, caplog):
+        # GIVEN a circle handler that fails
+        avatar_handler.circle_handler = SimpleNamespace(process_image=lambda name, image: 1 / 0)
+
+        # WHEN saving an avatar
+        with caplog.at_level(logging.ERROR):
+            AvatarHandler._save_avatar(avatar_handler, "stamp.jpg", white_avatar)
+
+        # THEN the avatar should still be saved, and the failure logged
+        assert (tmp_path / "stamp_avatar.png").exists()
+        assert "circle stamp" in caplog.text
+
+    def test_plain_result_is_streamed_to_disk(self, avatar_handler, white_avatar, tmp_path, monkeypatch):
+        # GIVEN no post-processing, and a base64 decoder that would fail if the whole result were decoded in memory
+        avatar_handler.remove_background = False
+        png = base64.b64decode(white_avatar.b64_json)
+
+        def whole_decode(data):
+            raise AssertionError("result decoded in memory")
+
+        monkeypatch.setattr("handling.util.result_writer.base64.b64decode", whole_decode)
+
+        # WHEN saving an avatar
+        AvatarHandler._save_avatar(avatar_handler, "stamp.jpg", white_avatar)
+
+        # THEN it should be written as returned, with no temporary file left behind
+        assert (tmp_path / "stamp_avatar.png").read_bytes() == png
+        assert [entry.name for entry in os.scandir(tmp_path)] == ["stamp_avatar.png"]
+
+    def test_post_processed_result_is_decoded_and_encoded_once(
+        self, avatar_handler, white_avatar, tmp_path, monkeypatch
+    ):
+        # GIVEN a count of the image files opened and the PNGs encoded
+        opened, encoded = [], []
+        open_image, save_image = Image.open, Image.Image.save
+        monkeypatch.setattr(Image, "open", lambda fp, *args: opened.append(fp) or open_image(fp, *args))
+        monkeypatch.setattr(Image.Image, "save", lambda image, *args: encoded.append(args) or save_image(image, *args))
+
+        # WHEN saving an avatar that needs its background removed
+        AvatarHandler._save_avatar(avatar_handler, "stamp.jpg", white_avatar)
+
+        # THEN the result should be opened from memory, not read back from disk, and encoded a single time
+        assert [type(fp) for fp in opened] == [io.BytesIO]
+        assert len(encoded) == 1
+        with open_image(tmp_path / "stamp_avatar.png") as avatar:
+            assert avatar.getpixel((2, 2))[3] == 0
+        assert [entry.name for entry in os.scandir(tmp_path)] == ["stamp_avatar.png"]
+
+    def test_invalid_result_leaves_earlier_avatar_in_place(self, avatar_handler, white_avatar, tmp_path):
+        # GIVEN an earlier avatar, and a result that isn't a PNG
+        (tmp_path / "stamp_avatar.png").write_bytes(b"earlier")
+        broken = SimpleNamespace(b64_json=base64.b64encode(b"not a png at all, just some text"))
+
+        # WHEN saving it with post-processing on
+        with pytest.raises(OSError, match="isn't a PNG"):
+            AvatarHandler._save_avatar(avatar_handler, "stamp.jpg", broken)
+
+        # THEN the earlier avatar should be untouched
+        assert [entry.name for entry in os.scandir(tmp_path)] == ["stamp_avatar.png"]
+        assert (tmp_path / "stamp_avatar.png").read_bytes() == b"earlier"
+
+
+class TestLazyInputs:
+    def test_inputs_are_only_read_once_a_slot_is_free(self, avatar_handler, mock_openai_response, monkeypatch):
+        # GIVEN three inputs and a concurrency limit of one
+        events = []
+        monkeypatch.setattr(
+            avatar_handler, "_load_input", lambda name: events.append(f"load {name}") or (name, b"", "image/png")
+        )
+
+        async def edit(**params):
+            await asyncio.sleep(0.01)
+            events.append(f"done {params['image'][0]}")
+            return SimpleNamespace(data=[mock_openai_response])
+
+        monkeypatch.setattr(avatar_handler, "_open_async_client", lambda: _FakeAsyncClient(edit))
+        avatar_handler.max_concurrency = 1
+
+        # WHEN executing the batch
+        avatar_handler._execute_model_requests("prompt", ["a.png", "b.png", "c.png"])
+
+        # THEN each input should be read only after the previous request finished
+        assert [event.split()[0] for event in events] == ["load", "done"] * 3
+
+    def test_load_input_reads_and_closes_the_file(self, avatar_handler, tmp_path):
+        # GIVEN a small image in the input folder
+        Image.new("RGB", (64, 64), (200, 30, 30)).save(tmp_path / "stamp.jpg")
+        avatar_handler.input_dir = str(tmp_path)
+
+        # WHEN loading it for upload, bypassing the stand-in
+        upload = AvatarHandler._load_input(avatar_handler, "stamp.jpg")
+
+        # THEN the whole file should be read into memory with its MIME type, leaving no handle open
+        assert upload == ("stamp.jpg", (tmp_path / "stamp.jpg").read_bytes(), "image/jpeg")
+
+
+class TestAvatarCache:
+    @pytest.fixture
+    def cached_handler(self, avatar_handler, mock_openai_response, tmp_path, monkeypatch):
+        """A handler with a real avatar cache and output folder, counting API calls."""
+        (tmp_path / "in").mkdir()
+        (tmp_path / "out").mkdir()
+        Image.new("RGB", (32, 32), (200, 30, 30)).save(tmp_path / "in" / "stamp.png")
+        avatar_handler.input_dir, avatar_handler.output_dir = str(tmp_path / "in"), str(tmp_path / "out")
+        avatar_handler.avatar_cache = ResultCache(str(tmp_path / "cache"), max_bytes=1_000_000)
+        monkeypatch.setattr(avatar_handler, "_save_avatar", partial(AvatarHandler._save_avatar, avatar_handler))
+        avatar_handler.calls = []
+
+        async def edit(**params):
+            avatar_handler.calls.append(params["prompt"])
+            return SimpleNamespace(data=[mock_openai_response])
+
+        monkeypatch.setattr(avatar_handler, "_open_async_client", lambda: _FakeAsyncClient(edit))
+        return avatar_handler
+
+    def test_same_image_and_prompt_is_restored(self, cached_handler, tmp_path):
+        # GIVEN an avatar generated once
+        cached_handler._execute_model_requests("prompt", ["stamp.png"])
+        generated = (tmp_path / "out" / "stamp_avatar.png").read_bytes()
+        (tmp_path / "out" / "stamp_avatar.png").unlink()
+
+        # WHEN the same image is run again with the same prompt
+        result = cached_handler._execute_model_requests("prompt", ["stamp.png"])
+
+        # THEN the stored avatar should be restored without another request, and the input archived
+        assert result == ["stamp.png"]
+        assert cached_handler.calls == ["prompt"]
+        assert (tmp_path / "out" / "stamp_avatar.png").read_bytes() == generated
+        assert cached_handler.stored[-1] == ("archive", "stamp.png")
+
+    def test_changed_prompt_or_forced_run_generates_again(self, cached_handler):
+        # GIVEN an avatar generated once
+        cached_handler._execute_model_requests("prompt", ["stamp.png"])
+
+        # WHEN the prompt changes, and when the same prompt is forced to regenerate
+        cached_handler._execute_model_requests("edited prompt", ["stamp.png"])
+        cached_handler.force_regenerate = True
+        cached_handler._execute_model_requests("prompt", ["stamp.png"])
+
+        # THEN each should send a new request
+        assert cached_handler.calls == ["prompt", "edited prompt", "prompt"]
+
+    def test_key_covers_model_parameters(self, cached_handler, monkeypatch):
+        # GIVEN the key for an image and prompt
+        key = cached_handler._avatar_cache_key("stamp.png", "prompt")
+
+        # WHEN the request quality changes
+        params = cached_handler._edit_params
+        monkeypatch.setattr(cached_handler, "_edit_params", lambda *args: {**params(*args), "quality": "low"})
+
+        # THEN the key should change too
+        assert cached_handler._avatar_cache_key("stamp.png", "prompt") != key
+
+    def test_key_covers_background_removal(self, cached_handler, monkeypatch):
+        # GIVEN keys for the same image and prompt, with and without background removal
+        plain = cached_handler._avatar_cache_key("stamp.png", "prompt")
+        cached_handler.remove_background = True
+        cleaned = cached_handler._avatar_cache_key("stamp.png", "prompt")
+
+        # WHEN the background white level changes too
+        monkeypatch.setattr("handling.avatar_handler.AVATAR_BACKGROUND_WHITE", 200)
+
+        # THEN each should have its own key, so a cleaned avatar is never restored for a plain one
+        assert len({plain, cleaned, cached_handler._avatar_cache_key("stamp.png", "prompt")}) == 3
+
+    def test_restored_avatar_is_handed_on_to_circles(self, cached_handler, tmp_path):
+        # GIVEN an avatar generated once, and avatars now set to be made into circle stamps too
+        from handling.imagehandler.circle_handler import CircleHandler
+
+        cached_handler._execute_model_requests("prompt", ["stamp.png"])
+        cached_handler.circle_handler = CircleHandler(str(tmp_path / "in"), str(tmp_path / "circles"))
+
+        # WHEN the same image is run again and restored from the cache
+        cached_handler._execute_model_requests("prompt", ["stamp.png"])
+
+        # THEN a circle stamp should be made from the restored avatar
+        assert cached_handler.calls == ["prompt"]
+        assert [entry.name for entry in os.scandir(tmp_path / "circles")] == ["resized_stamp.png"]
+
+
+class TestDedupe:
+    def test_duplicates_share_one_request(self, avatar_handler, mock_openai_response, tmp_path, monkeypatch, caplog):
+        # GIVEN one photo queued as both PNG and JPEG, plus a different photo
+        (tmp_path / "in").mkdir()
+        (tmp_path / "out").mkdir()
+        photo = Image.effect_mandelbrot((400, 300), (-2.0, -1.2, 1.0, 1.2), 60).convert("RGB")
+        photo.save(tmp_path / "in" / "customer.png")
+        photo.save(tmp_path / "in" / "customer copy.jpg", quality=85)
+        Image.linear_gradient("L").resize((400, 300)).convert("RGB").save(tmp_path / "in" / "other.png")
+        avatar_handler.input_dir, avatar_handler.output_dir = str(tmp_path / "in"), str(tmp_path / "out")
+        monkeypatch.setattr(avatar_handler, "_save_avatar", partial(AvatarHandler._save_avatar, avatar_handler))
+        sent = []
+
+        async def edit(**params):
+            sent.append(params["image"][0])
+            return SimpleNamespace(data=[mock_openai_response])
+
+        monkeypatch.setattr(avatar_handler, "_open_async_client", lambda: _FakeAsyncClient(edit))
+
+        # WHEN generating avatars for all three
+        with caplog.at_level(logging.INFO):
+            saved = avatar_handler._execute_model_requests("prompt", ["customer copy.jpg", "customer.png", "other.png"])
+
+        # THEN the copies should need one request, sent from the larger file, with the avatar fanned out to both
+        assert sorted(sent) == ["customer.png", "other.png"]
+        assert sorted(saved) == ["customer copy.jpg", "customer.png", "other.png"]
+        outputs = sorted(entry.name for entry in os.scandir(tmp_path / "out"))
+        assert outputs == ["customer copy_avatar.png", "customer_avatar.png", "other_avatar.png"]
+        assert ("archive", "customer copy.jpg") in avatar_handler.stored
+        assert "customer copy.jpg looks like customer.png" in caplog.text
+
+    def test_duplicates_are_handed_on_to_circles(self, avatar_handler, mock_openai_response, tmp_path, monkeypatch):
+        # GIVEN one photo queued twice, with avatars set to be made into circle stamps too
+        from handling.imagehandler.circle_handler import CircleHandler
+
+        (tmp_path / "in").mkdir()
+        (tmp_path / "out").mkdir()
+        photo = Image.effect_mandelbrot((400, 300), (-2.0, -1.2, 1.0, 1.2), 60).convert("RGB")
+        photo.save(tmp_path / "in" / "customer.png")
+        photo.save(tmp_path / "in" / "customer copy.png")
+        avatar_handler.input_dir, avatar_handler.output_dir = str(tmp_path / "in"), str(tmp_path / "out")
+        avatar_handler.circle_handler = CircleHandler(str(tmp_path / "in"), str(tmp_path / "circles"))
+        monkeypatch.setattr(avatar_handler, "_save_avatar", partial(AvatarHandler._save_avatar, avatar_handler))
+        monkeypatch.setattr(
+            AvatarBaseHandler, "_execute_edit_request_async", _returning(lambda name: mock_openai_response)
+        )
+
+        # WHEN generating avatars for both
+        avatar_handler._execute_model_requests("prompt", ["customer.png", "customer copy.png"])
+
+        # THEN the copy should get its own circle stamp, not only the input that was sent
+        circles = sorted(entry.name for entry in os.scandir(tmp_path / "circles"))
+        assert circles == ["resized_customer copy.png", "resized_customer.png"]
+
+    def test_dedupe_can_be_turned_off(self, avatar_handler, mock_openai_response, monkeypatch):
+        # GIVEN dedupe switched off
+        avatar_handler.dedupe_distance = None
+        monkeypatch.setattr(
+            AvatarBaseHandler, "_execute_edit_request_async", _returning(lambda name: mock_openai_response)
+        )
+
+        # WHEN generating avatars
+        # THEN every input should get its own request, without being read for hashing
+        assert sorted(avatar_handler._execute_model_requests("prompt", ["a.png", "b.png"])) == ["a.png", "b.png"]
+
+
+class TestPacking:
+    @pytest.fixture
+    def packing_handler(self, avatar_handler, tmp_path, monkeypatch):
+        """A handler with packing on, over four small inputs and one large one, recording what it sends."""
+        (tmp_path / "in").mkdir()
+        (tmp_path / "out").mkdir()
+        colours = [(220, 30, 30), (30, 220, 30), (30, 30, 220), (220, 220, 30)]
+        for index, colour in enumerate(colours):
+            Image.new("RGB", (200 + index * 50, 200), colour).save(tmp_path / "in" / f"small{index}.png")
+        Image.new("RGB", (1500, 1500), (120, 40, 160)).save(tmp_path / "in" / "large.png")
+        avatar_handler.input_dir, avatar_handler.output_dir = str(tmp_path / "in"), str(tmp_path / "out")
+        avatar_handler.pack_size = 4
+        avatar_handler.prompts = []
+        monkeypatch.setattr(avatar_handler, "_load_input", partial(AvatarHandler._load_input, avatar_handler))
+        return avatar_handler
+
+    def _serve(self, handler, monkeypatch, respond):
+        async def edit(**params):
+            handler.prompts.append(params["prompt"])
+            with Image.open(io.BytesIO(params["image"][1])) as upload:
+                return SimpleNamespace(data=[SimpleNamespace(b64_json=base64.b64encode(_png(respond(upload))))])
+
+        monkeypatch.setattr(handler, "_open_async_client", lambda: _FakeAsyncClient(edit))
+
+    def test_small_inputs_share_one_request(self, packing_handler, tmp_path, monkeypatch):
+        # GIVEN a model that edits every cell and keeps the grid
+        self._serve(packing_handler, monkeypatch, lambda upload: ImageOps.invert(upload.convert("RGB")))
+
+        # WHEN generating avatars for all five inputs
+        names = ["large.png", *(f"small{index}.png" for index in range(4))]
+        saved = packing_handler._execute_model_requests("prompt", names)
+
+        # THEN the four small inputs should share one request, and the large one be sent alone
+        assert sorted(saved) == sorted(names)
+        assert len(packing_handler.prompts) == 2
+        assert sum("grid" in prompt for prompt in packing_handler.prompts) == 1
+        # AND each small avatar should be its own input's edit, cropped at its shape and recorded in the tile map
+        with Image.open(tmp_path / "out" / "small0_avatar.png") as avatar:
+            assert avatar.getpixel((10, 10)) == (35, 225, 225)
+        with Image.open(tmp_path / "out" / "small2_avatar.png") as avatar:
+            assert avatar.width / avatar.height == pytest.approx(300 / 200, rel=0.02)
+        assert sorted(tile.source for tile in packing_handler.tile_maps[0]) == [
+            f"small{index}.png" for index in range(4)
+        ]
+
+    def test_result_without_its_grid_falls_back_to_single_requests(self, packing_handler, monkeypatch, caplog):
+        # GIVEN a model that paints one picture over the whole canvas
+        self._serve(packing_handler, monkeypatch, lambda upload: _disc(upload.size))
+
+        # WHEN generating avatars for the small inputs
+        with caplog.at_level(logging.WARNING):
+            saved = packing_handler._execute_model_requests("prompt", [f"small{index}.png" for index in range(4)])
+
+        # THEN the packed result should be discarded and each input sent on its own
+        assert len(saved) == 4
+        assert len(packing_handler.prompts) == 5
+        assert "didn't keep its grid" in caplog.text
+        assert packing_handler.tile_maps == []
+
+    def test_failed_packed_request_falls_back_to_single_requests(
+        self, packing_handler, mock_openai_response, monkeypatch, caplog
+    ):
+        # GIVEN a packed request that fails even after its retries, while single requests succeed
+        sent = []
+
+        async def request(self, client, user_prompt, load_image):
+            sent.append(load_image()[0])
+            return None if "grid" in user_prompt else mock_openai_response
+
+        monkeypatch.setattr(AvatarBaseHandler, "_execute_edit_request_async", request)
+
+        # WHEN generating avatars for the small inputs
+        with caplog.at_level(logging.WARNING):
+            saved = packing_handler._execute_model_requests("prompt", [f"small{index}.png" for index in range(4)])
+
+        # THEN each input should be sent on its own after the packed request, rather than left behind
+        assert sorted(saved) == [f"small{index}.png" for index in range(4)]
+        assert len(sent) == 5
+        assert "packed request for" in caplog.text
+
+
+def _png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _disc(size):
+    image = Image.new("RGB", size, (250, 250, 250))
+    ImageDraw.Draw(image).ellipse((size[0] // 5, size[1] // 5, size[0] * 4 // 5, size[1] * 4 // 5), fill=(20, 20, 20))
+    return image
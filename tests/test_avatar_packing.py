@@ -0,0 +1,67 @@
+"""Tests for tiling several avatar inputs into one request.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import pytest
+from PIL import Image, ImageDraw, ImageOps
+
+from handling.exception.configuration_error import ConfigurationError
+from handling.util.avatar_packing import (compose, grid_intact, plan_packs,
+                                          split)
+
+
+class TestPlanPacks:
+    def test_small_inputs_are_packed_and_large_ones_sent_alone(self):
+        # GIVEN five small inputs and one large one
+        sizes = {f"small{index}.png": (400, 300) for index in range(5)}
+        sizes["large.png"] = (2000, 2000)
+
+        # WHEN planning packs of up to four
+        plan = plan_packs(sizes, pack_size=4, max_side=512)
+
+        # THEN the large input should go alone, and the small ones in order into a full and a partial pack
+        assert plan == [["large.png"], [f"small{index}.png" for index in range(4)], ["small4.png"]]
+
+    @pytest.mark.parametrize("pack_size", [1, 5])
+    def test_pack_size_must_fit_the_grid(self, pack_size):
+        # GIVEN a pack size the 2x2 grid can't hold, or one that packs nothing
+        # WHEN planning
+        # THEN it should be reported as a configuration error
+        with pytest.raises(ConfigurationError, match="between 2 and 4"):
+            plan_packs({"a.png": (10, 10)}, pack_size=pack_size, max_side=512)
+
+
+class TestComposeAndSplit:
+    def test_each_source_is_cropped_back_from_its_cell(self):
+        # GIVEN three differently coloured sources of different shapes
+        colours = {"red.png": (220, 0, 0), "green.png": (0, 220, 0), "blue.png": (0, 0, 220)}
+        sizes = {"red.png": (300, 300), "green.png": (400, 200), "blue.png": (100, 200)}
+        sources = [(name, Image.new("RGB", sizes[name], colour)) for name, colour in colours.items()]
+
+        # WHEN tiling them onto a canvas and splitting an edit that kept the grid
+        canvas, tiles = compose(sources, 1024)
+        edited = ImageOps.invert(canvas)
+        crops = split(edited, tiles)
+
+        # THEN each crop should be its own source's edit, at the source's aspect ratio
+        assert [tile.source for tile in tiles] == list(colours)
+        for name, colour in colours.items():
+            assert crops[name].getpixel((crops[name].width // 2, crops[name].height // 2)) == tuple(
+                255 - value for value in colour
+            )
+            assert crops[name].width / crops[name].height == pytest.approx(sizes[name][0] / sizes[name][1], rel=0.02)
+        assert grid_intact(edited, 1024)
+
+    def test_result_that_ignores_the_grid_is_rejected(self):
+        # GIVEN a result where the model drew one big picture across the cells
+        canvas, _ = compose([("a.png", Image.new("RGB", (300, 300), (200, 0, 0)))], 1024)
+        ImageDraw.Draw(canvas).ellipse((200, 200, 824, 824), fill=(0, 0, 200))
+
+        # WHEN checking it
+        # THEN the grid should be reported broken, as should a result of the wrong size
+        assert not grid_intact(canvas, 1024)
+        assert not grid_intact(Image.new("RGB", (512, 512), "white"), 1024)
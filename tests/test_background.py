@@ -0,0 +1,58 @@
+"""Tests for removing the white background from generated avatars.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+from PIL import Image, ImageDraw
+
+from handling.util.background import remove_background
+
+
+def _portrait():
+    # A dark head on a white background, with a white eye inside it
+    image = Image.new("RGB", (256, 256), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((48, 48, 208, 208), fill=(60, 40, 30))
+    draw.ellipse((96, 96, 128, 128), fill=(255, 255, 255))
+    return image
+
+
+class TestRemoveBackground:
+    def test_background_becomes_transparent_and_subject_stays(self):
+        # GIVEN a subject on a plain white background
+        image = _portrait()
+
+        # WHEN removing the background
+        cleaned = remove_background(image)
+
+        # THEN the background should be transparent, and the subject opaque with its colours untouched
+        assert cleaned.mode == "RGBA"
+        assert cleaned.getpixel((5, 5))[3] == 0
+        assert cleaned.getpixel((128, 180)) == (60, 40, 30, 255)
+        # AND white enclosed by the subject should be kept
+        assert cleaned.getpixel((112, 112)) == (255, 255, 255, 255)
+        assert image.mode == "RGB"
+
+    def test_near_white_fades_instead_of_cutting_off(self):
+        # GIVEN a strip of greys from the white level down past the softness
+        image = Image.new("RGB", (64, 64), (255, 255, 255))
+        for x, level in enumerate([250, 240, 230, 220, 200]):
+            image.paste((level, level, level), (x * 8, 0, x * 8 + 8, 64))
+
+        # WHEN removing the background with white at 240 and 20 levels of softness
+        alphas = [remove_background(image).getpixel((x * 8 + 4, 32))[3] for x in range(5)]
+
+        # THEN alpha should ramp from transparent to opaque
+        assert alphas == [0, 0, 127, 255, 255]
+
+    def test_existing_transparency_is_kept(self):
+        # GIVEN an image whose left half is already transparent
+        image = _portrait().convert("RGBA")
+        image.paste((60, 40, 30, 0), (0, 0, 128, 256))
+
+        # WHEN removing the background
+        # THEN the transparent half should stay transparent, subject included
+        assert remove_background(image).getpixel((100, 180))[3] == 0
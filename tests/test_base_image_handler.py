@@ -11,8 +11,23 @@ understand what the code is supposed to do without reading the implementation.
 
 import logging
 
+import pytest
 from PIL import Image
 
+from handling.base_image_handler import BaseImageHandler
+from handling.exception.configuration_error import ConfigurationError
+
+logger = logging.getLogger(__name__)
+
+
+class _LoggingHandler(BaseImageHandler):
+    """Module-level so it can be pickled into process pool workers."""
+
+    def _handler_function(self, file):
+        if file.startswith("bad"):
+            raise RuntimeError("boom")
+        logger.info("handled %s", file)
+
 
 class TestIsValidFileType:
     def test_accepts_jpg(self, base_handler):
@@ -151,3 +166,46 @@ class TestRenameFile:
         # WHEN attempting to rename
         # THEN it should return False rather than crashing
         assert base_handler._rename_file("old.jpg", "existing.png") is False
+
+
+class TestExecute:
+    @pytest.mark.parametrize("backend", ["serial", "thread", "process"])
+    def test_every_file_is_handled_and_logged(self, backend, caplog):
+        # GIVEN three input images and a configured executor backend
+        handler = _LoggingHandler()
+        handler.img_dir = ["a.png", "b.jpg", "notes.txt", "c.webp"]
+        handler.executor_backend = backend
+        handler.max_workers = 2
+
+        # WHEN executing the batch
+        with caplog.at_level(logging.INFO):
+            handler.execute()
+
+        # THEN each valid file should be handled once, with its log record reaching the parent process
+        for file in ("a.png", "b.jpg", "c.webp"):
+            assert caplog.text.count(f"handled {file}") == 1
+        assert "notes.txt" not in caplog.text
+
+    @pytest.mark.parametrize("backend", ["serial", "thread"])
+    def test_unhandled_error_is_logged_and_batch_continues(self, backend, caplog):
+        # GIVEN a batch where one file raises out of the handler function
+        handler = _LoggingHandler()
+        handler.img_dir = ["bad.png", "good.png"]
+        handler.executor_backend = backend
+
+        # WHEN executing the batch
+        with caplog.at_level(logging.INFO):
+            handler.execute()
+
+        # THEN the failure should be logged against its file and the other file still handled
+        assert "Unexpected error processing bad.png" in caplog.text
+        assert "handled good.png" in caplog.text
+
+    def test_unknown_backend_raises(self, base_handler):
+        # GIVEN a misconfigured executor backend
+        base_handler.executor_backend = "gpu"
+
+        # WHEN executing
+        # THEN a ConfigurationError should be raised before any work starts
+        with pytest.raises(ConfigurationError, match="Unknown executor backend"):
+            base_handler.execute()
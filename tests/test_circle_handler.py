@@ -6,7 +6,22 @@ Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
 - THEN: the expected outcome is asserted
 """
 
-from PIL import Image
+import shutil
+
+import pytest
+from PIL import Image, ImageDraw
+
+
+def _legacy_resize(image):
+    """The original pad, paste and crop geometry, kept as the reference for the direct frame."""
+    max_dimension = max(image.size[0] + 100, image.size[1] + 100)
+    canvas = Image.new("RGBA", (max_dimension, max_dimension), (255, 255, 255, 255))
+    canvas.paste(image, (50, 50))
+    cropped = canvas.crop((20, 20, max_dimension - 20, max_dimension - 20))
+    mask = Image.new("L", cropped.size)
+    ImageDraw.Draw(mask).ellipse((2.5, 2.5, cropped.size[0] - 5, cropped.size[1] - 5), fill=255)
+    cropped.putalpha(mask)
+    return cropped
 
 
 class TestCheckIsColoured:
@@ -80,6 +95,33 @@ class TestResize:
         centre_pixel = result.getpixel((cx, cy))
         assert centre_pixel[3] == 255
 
+    @pytest.mark.parametrize("mode", ["RGBA", "RGB", "L", "P"])
+    @pytest.mark.parametrize("size", [(100, 100), (140, 90), (37, 211)])
+    def test_matches_legacy_pad_and_crop(self, circle_handler, mode, size):
+        # GIVEN a noisy input in one of the modes Image.open can return
+        img = Image.effect_noise(size, 64).convert(mode)
+
+        # WHEN resizing through the direct frame geometry
+        result = circle_handler.resize(img)
+
+        # THEN the output should be pixel-identical to padding, pasting and cropping
+        expected = _legacy_resize(img)
+        assert result.size == expected.size
+        assert result.tobytes() == expected.tobytes()
+
+    def test_masks_are_reused_for_same_sized_images(self, circle_handler):
+        # GIVEN two inputs of the same size and one of another size
+        images = [Image.new("RGBA", size, (0, 0, 0, 255)) for size in [(100, 80), (100, 80), (60, 60)]]
+
+        # WHEN resizing all of them
+        for img in images:
+            circle_handler.resize(img)
+
+        # THEN the mask should only be drawn once per size, as reported in the handler's stats
+        stats = circle_handler._collect_stats()
+        assert stats["mask_cache_hits"] == 1
+        assert stats["mask_cache_misses"] == 2
+
 
 class TestStandardiseSize:
     def test_auto_detects_from_smallest_dimension(self, circle_handler):
@@ -103,3 +145,90 @@ class TestStandardiseSize:
 
         # THEN it should resize to exactly that size
         assert result.size == (80, 80)
+
+    @pytest.mark.parametrize("stem", ["stamp&R.", "stamp&E."])
+    def test_coloured_circle_is_resized_once(self, circle_handler, monkeypatch, stem):
+        # GIVEN a configured size and a count of resizes
+        from handling.base_image_handler import ImageJob
+
+        circle_handler.standard_size = (80, 80)
+        calls = []
+        original = circle_handler._standardise_size
+        monkeypatch.setattr(circle_handler, "_standardise_size", lambda image: calls.append(1) or original(image))
+        job = ImageJob(file=f"{stem}png", name=f"{stem}png", stem=stem, image=Image.new("RGBA", (200, 200)))
+
+        # WHEN transforming a coloured circle, in one colour or in every colour
+        sizes = [image.size for _, image in circle_handler._transform(job)]
+
+        # THEN the frame should be resized a single time, before any recolouring
+        assert len(calls) == 1
+        assert set(sizes) == {(80, 80)}
+
+
+class TestReducedDecoding:
+    @pytest.fixture
+    def large_jpeg(self, tmp_path, monkeypatch):
+        """A 1600x1200 JPEG stamp with a dark ring, sitting in a real img/ directory."""
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "img").mkdir()
+        img = Image.new("RGB", (1600, 1200), (255, 255, 255))
+        ImageDraw.Draw(img).ellipse((100, 100, 1500, 1100), outline=(0, 0, 0), width=60)
+        img.save("img/ring&R.jpg", quality=95)
+        return "ring&R.jpg"
+
+    def test_jpeg_is_decoded_near_target_size(self, circle_handler, large_jpeg):
+        # GIVEN a configured output size far below the source resolution
+        circle_handler.standard_size = (200, 200)
+
+        # WHEN decoding the file
+        job = circle_handler._decode(large_jpeg)
+
+        # THEN the JPEG should be decoded at a reduced scale that still covers the output size
+        assert job.image.width < 1600
+        assert job.image.width >= 200 * 1600 / 1660
+        assert job.scale == job.image.width / 1600
+
+    def test_full_resolution_without_configured_size(self, circle_handler, large_jpeg):
+        # GIVEN no configured output size
+        circle_handler.standard_size = None
+
+        # WHEN decoding the file
+        job = circle_handler._decode(large_jpeg)
+
+        # THEN the image should be decoded at full size
+        assert job.image.size == (1600, 1200)
+        assert job.scale == 1.0
+
+    def test_reduced_output_matches_full_resolution_output(self, circle_handler, large_jpeg, monkeypatch):
+        # GIVEN a second copy of the stamp processed from a full-resolution decode
+        circle_handler.standard_size = (200, 200)
+        shutil.copy(f"img/{large_jpeg}", "img/copy&R.jpg")
+        with monkeypatch.context() as m:
+            m.setattr(circle_handler, "_decode_target", lambda job, size: None)
+            full = dict(circle_handler._transform(circle_handler._decode("copy&R.jpg")))[None]
+
+        # WHEN processing the original through the reduced decode
+        reduced = dict(circle_handler._transform(circle_handler._decode(large_jpeg)))[None]
+
+        # THEN the output should be the configured size and visually the same stamp
+        assert reduced.size == full.size == (200, 200)
+        red_channels = zip(reduced.getchannel("R").tobytes(), full.getchannel("R").tobytes())
+        differing = sum(abs(a - b) > 64 for a, b in red_channels)
+        assert differing / (200 * 200) < 0.05
+
+    def test_palette_png_is_reduced(self, circle_handler, tmp_path, monkeypatch):
+        # GIVEN a large palette-mode coloured stamp and a small configured output size
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "img").mkdir()
+        img = Image.new("RGB", (800, 800), (255, 255, 255))
+        ImageDraw.Draw(img).ellipse((100, 100, 700, 700), outline=(0, 0, 0), width=40)
+        img.convert("P", palette=Image.Palette.ADAPTIVE, colors=8).save("img/b&B.png")
+        circle_handler.standard_size = (100, 100)
+
+        # WHEN decoding and transforming it
+        job = circle_handler._decode("b&B.png")
+        outputs = dict(circle_handler._transform(job))
+
+        # THEN it should be decoded at a reduced size and still make a stamp of the configured size
+        assert job.image.width < 800
+        assert outputs[None].size == (100, 100)
@@ -0,0 +1,98 @@
+"""Tests for the headless command line entry point.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+from PIL import Image
+
+import cli
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestParser:
+    def test_circles_options(self, tmp_path):
+        # GIVEN a circles command with every batch option
+        argv = ["circles", "--workers", "8", "--input", str(tmp_path), "--output", "out", "--size", "200x200"]
+
+        # WHEN parsing it
+        args = cli.build_parser().parse_args(argv)
+
+        # THEN each option should be converted
+        assert (args.command, args.workers, args.input, args.output) == ("circles", 8, str(tmp_path), "out")
+        assert args.size == (200, 200)
+
+    @pytest.mark.parametrize("argv", [["circles", "--size", "big"], ["avatar-edit"], ["circles", "--input", "missing"]])
+    def test_invalid_arguments_exit_with_usage_error(self, argv):
+        # GIVEN a malformed size, a missing required prompt or a missing input folder
+        # WHEN parsing the command line
+        # THEN argparse should exit with status 2
+        with pytest.raises(SystemExit) as exc_info:
+            cli.build_parser().parse_args(argv)
+        assert exc_info.value.code == 2
+
+
+class TestCreateHandler:
+    def test_handler_uses_given_folders_and_options(self, tmp_path):
+        # GIVEN a rectangles command pointed at temporary folders
+        output = tmp_path / "out"
+        args = cli.build_parser().parse_args(
+            ["rectangles", "--input", str(tmp_path), "--output", str(output), "--workers", "3", "--backend", "thread"]
+        )
+
+        # WHEN creating its handler
+        handler = cli.create_handler(args)
+
+        # THEN the handler should use those folders and options, without opening Explorer afterwards
+        assert (handler.input_dir, handler.output_dir) == (str(tmp_path), str(output))
+        assert (handler.max_workers, handler.executor_backend) == (3, "thread")
+        assert handler.open_destination is False
+        assert (tmp_path / "zArchive").is_dir()
+        assert (output / "1 Custom").is_dir()
+
+    def test_avatar_concurrency_is_applied(self, tmp_path, mock_openai_client):
+        # GIVEN an avatars command with a concurrency limit
+        args = cli.build_parser().parse_args(["avatars", "--input", str(tmp_path), "--concurrency", "200"])
+
+        # WHEN creating its handler
+        handler = cli.create_handler(args)
+
+        # THEN the handler should keep that many generations in flight
+        assert handler.max_concurrency == 200
+
+
+class TestHeadlessRun:
+    def test_circles_run_without_gui_or_openai_imports(self, tmp_path):
+        # GIVEN an input folder holding one coloured stamp
+        (tmp_path / "in").mkdir()
+        Image.new("RGB", (60, 40), (20, 20, 20)).save(tmp_path / "in" / "stamp&R.jpg")
+        script = (
+            "import sys, cli\n"
+            "code = cli.main(['circles', '--backend', 'serial', '--input', 'in', '--output', 'out', '--quiet'])\n"
+            "assert 'PySide6' not in sys.modules and 'openai' not in sys.modules, 'heavy import'\n"
+            "sys.exit(code)\n"
+        )
+
+        # WHEN running the circles command in a fresh interpreter
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=tmp_path,
+            env={**os.environ, "PYTHONPATH": REPO_ROOT},
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+
+        # THEN it should succeed without loading Qt or OpenAI, writing the output and archiving the input
+        assert result.returncode == 0, result.stderr
+        # os.listdir is patched out for every test by conftest, so list the directories with scandir
+        assert [entry.name for entry in os.scandir(tmp_path / "out")] == ["resized_stamp&R.png"]
+        assert [entry.name for entry in os.scandir(tmp_path / "in" / "zArchive")] == ["stamp&R.png"]
@@ -0,0 +1,22 @@
+"""Tests for the executor backends.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import signal
+
+from handling.util.executors import LoggingProcessPoolExecutor
+
+
+class TestLoggingProcessPoolExecutor:
+    def test_workers_leave_ctrl_c_to_the_parent(self):
+        # GIVEN a process pool
+        with LoggingProcessPoolExecutor(max_workers=1) as pool:
+            # WHEN asking a worker how it handles SIGINT
+            handler = pool.submit(signal.getsignal, signal.SIGINT).result(timeout=60)
+
+        # THEN it should ignore it, so Ctrl+C only stops the parent, which shuts the pool down cleanly
+        assert handler == signal.SIG_IGN
@@ -0,0 +1,175 @@
+"""Tests for JobLedger.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+
+import pytest
+
+from handling.util.job_ledger import JobLedger
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = JobLedger(str(tmp_path / "ledger.sqlite3"))
+    yield ledger
+    ledger.close()
+
+
+class TestDiscover:
+    def test_new_files_start_as_discovered(self, ledger):
+        # GIVEN a fresh ledger
+        run_id = ledger.start_run("CircleHandler")
+
+        # WHEN recording two files
+        changed = ledger.discover(
+            "CircleHandler", "img", run_id, [("a.jpg", "a.png", 10, 1), ("b.png", "b.png", 20, 2)]
+        )
+
+        # THEN both should be reported as new and pending
+        assert changed == ["a.png", "b.png"]
+        assert ledger.state("CircleHandler", "img", "a.png") == "discovered"
+        assert len(ledger.pending("CircleHandler")) == 2
+
+    def test_unfinished_file_keeps_its_state(self, ledger):
+        # GIVEN a file whose outputs were saved before the run was interrupted
+        ledger.discover("CircleHandler", "img", ledger.start_run("CircleHandler"), [("a.jpg", "a.png", 10, 1)])
+        ledger.mark("CircleHandler", "img", "a.png", "saved")
+
+        # WHEN the next run finds it again, renamed but otherwise unchanged
+        changed = ledger.discover(
+            "CircleHandler", "img", ledger.start_run("CircleHandler"), [("a.png", "a.png", 10, 1)]
+        )
+
+        # THEN it should resume from its saved state rather than count as changed
+        assert changed == []
+        assert ledger.state("CircleHandler", "img", "a.png") == "saved"
+
+    @pytest.mark.parametrize(
+        "state, fingerprint",
+        [("saved", (11, 1)), ("saved", (10, 2)), ("archived", (10, 1))],
+    )
+    def test_changed_or_archived_file_starts_over(self, ledger, state, fingerprint):
+        # GIVEN a file recorded in an earlier run
+        ledger.discover("CircleHandler", "img", ledger.start_run("CircleHandler"), [("a.jpg", "a.png", 10, 1)])
+        ledger.mark("CircleHandler", "img", "a.png", state)
+
+        # WHEN a file of the same name turns up edited, or again after being archived
+        changed = ledger.discover(
+            "CircleHandler", "img", ledger.start_run("CircleHandler"), [("a.jpg", "a.png", *fingerprint)]
+        )
+
+        # THEN it should be treated as new work
+        assert changed == ["a.png"]
+        assert ledger.state("CircleHandler", "img", "a.png") == "discovered"
+
+    def test_handlers_are_tracked_separately(self, ledger):
+        # GIVEN a file archived by one handler
+        ledger.discover("CircleHandler", "img", ledger.start_run("CircleHandler"), [("a.png", "a.png", 10, 1)])
+        ledger.mark("CircleHandler", "img", "a.png", "archived")
+
+        # WHEN another handler looks it up
+        # THEN it should be unknown to that handler
+        assert ledger.state("RectangleHandler", "img", "a.png") is None
+        assert ledger.pending() == []
+
+    def test_input_folders_are_tracked_separately(self, ledger):
+        # GIVEN a file saved but not archived from one input folder
+        ledger.discover("CircleHandler", "/shop/img", ledger.start_run("CircleHandler"), [("a.png", "a.png", 10, 1)])
+        ledger.mark("CircleHandler", "/shop/img", "a.png", "saved")
+
+        # WHEN a file of the same name and size turns up in another folder
+        changed = ledger.discover(
+            "CircleHandler", "/home/img", ledger.start_run("CircleHandler"), [("a.png", "a.png", 10, 1)]
+        )
+
+        # THEN it should be new work there, without touching the first folder's record
+        assert changed == ["a.png"]
+        assert ledger.state("CircleHandler", "/shop/img", "a.png") == "saved"
+        assert ledger.pending() == [
+            ("CircleHandler", "/home/img", "a.png", "discovered"),
+            ("CircleHandler", "/shop/img", "a.png", "saved"),
+        ]
+
+
+class TestUpgrade:
+    def test_version_1_ledger_keeps_its_records(self, tmp_path):
+        # GIVEN a ledger written before input folders were recorded, with a file left half done
+        path = str(tmp_path / "ledger.sqlite3")
+        connection = sqlite3.connect(path)
+        connection.executescript("""
+            CREATE TABLE runs (id INTEGER PRIMARY KEY, handler TEXT NOT NULL, started REAL NOT NULL);
+            CREATE TABLE jobs (handler TEXT NOT NULL, name TEXT NOT NULL, source TEXT NOT NULL,
+                size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, state TEXT NOT NULL, run_id INTEGER,
+                updated REAL NOT NULL, PRIMARY KEY (handler, name));
+            CREATE INDEX jobs_updated ON jobs (updated);
+            INSERT INTO jobs VALUES ('CircleHandler', 'a.png', 'a.jpg', 10, 1, 'saved', 1, 0);
+            INSERT INTO jobs VALUES ('CircleHandler', 'b.png', 'b.jpg', 10, 1, 'processed', 1, 0);
+            """)
+        connection.close()
+
+        # WHEN it is opened by this version
+        ledger = JobLedger(path)
+        img = os.path.realpath("img")
+
+        # THEN its files should be kept under the default img/ folder, with "processed" counted as renamed
+        assert ledger.state("CircleHandler", img, "a.png") == "saved"
+        assert ledger.state("CircleHandler", img, "b.png") == "renamed"
+        ledger.close()
+
+
+class TestQueries:
+    def test_changes_since_last_run(self, ledger):
+        # GIVEN a file finished in an earlier run
+        ledger.discover("CircleHandler", "img", ledger.start_run("CircleHandler"), [("old.png", "old.png", 1, 1)])
+        ledger.mark("CircleHandler", "img", "old.png", "archived")
+
+        # WHEN a later run processes another file
+        ledger.start_run("CircleHandler")
+        since = ledger.last_run("CircleHandler")
+        ledger.discover("CircleHandler", "img", 2, [("new.png", "new.png", 1, 1)])
+        ledger.mark("CircleHandler", "img", "new.png", "renamed")
+
+        # THEN only that file should show as changed since the run started
+        assert ledger.changed_since(since, "CircleHandler") == [("CircleHandler", "img", "new.png", "renamed")]
+        assert ledger.handlers() == ["CircleHandler"]
+
+    def test_unknown_state_is_rejected(self, ledger):
+        # GIVEN a ledger
+        # WHEN marking a file with a state outside STATES
+        # THEN it should raise
+        with pytest.raises(ValueError):
+            ledger.mark("CircleHandler", "img", "a.png", "done")
+
+
+class TestConcurrency:
+    def test_threads_and_pickled_copies_share_the_database(self, ledger):
+        # GIVEN files recorded from the main thread
+        files = [(f"{i}.png", f"{i}.png", 1, 1) for i in range(8)]
+        ledger.discover("CircleHandler", "img", ledger.start_run("CircleHandler"), files)
+
+        # WHEN worker threads and a copy sent to another process mark them archived
+        def mark(names):
+            for name in names:
+                ledger.mark("CircleHandler", "img", name, "archived")
+            ledger.close()
+
+        threads = [threading.Thread(target=mark, args=([f"{i}.png"],)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        copy = pickle.loads(pickle.dumps(ledger))
+        for i in range(4, 8):
+            copy.mark("CircleHandler", "img", f"{i}.png", "archived")
+        copy.close()
+
+        # THEN every update should be visible
+        assert ledger.pending() == []
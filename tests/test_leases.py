@@ -0,0 +1,136 @@
+"""Tests for LeaseManager.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import os
+import pickle
+import time
+
+import pytest
+
+from handling.util.leases import LeaseManager
+
+
+@pytest.fixture
+def lease_dir(tmp_path):
+    return str(tmp_path / ".leases")
+
+
+class TestAcquire:
+    def test_only_one_node_wins(self, lease_dir):
+        # GIVEN two nodes sharing a lease folder
+        first, second = LeaseManager(lease_dir), LeaseManager(lease_dir)
+
+        # WHEN both try to claim the same file
+        # THEN only the first should get it, until it lets go
+        assert first.acquire("stamp.png") is True
+        assert second.acquire("stamp.png") is False
+        first.release("stamp.png")
+        assert second.acquire("stamp.png") is True
+
+    def test_expired_lease_is_broken(self, lease_dir):
+        # GIVEN a lease whose holder stopped heartbeating longer ago than the TTL
+        crashed, survivor = LeaseManager(lease_dir, ttl=10), LeaseManager(lease_dir, ttl=10)
+        crashed.acquire("stamp.png")
+        stale = time.time() - 30
+        os.utime(os.path.join(lease_dir, "stamp.png.lease"), (stale, stale))
+
+        # WHEN another node tries to claim the file
+        # THEN it should take the lease over, leaving no tombstone behind
+        assert survivor.acquire("stamp.png") is True
+        assert [entry.name for entry in os.scandir(lease_dir)] == ["stamp.png.lease"]
+
+    def test_fresh_lease_is_kept(self, lease_dir):
+        # GIVEN a lease that is still being heartbeated
+        holder, other = LeaseManager(lease_dir, ttl=10), LeaseManager(lease_dir, ttl=10)
+        holder.acquire("stamp.png")
+
+        # WHEN another node tries to claim it
+        # THEN it should be refused
+        assert other.acquire("stamp.png") is False
+        assert holder.held() == {"stamp.png"}
+
+
+class TestHeartbeat:
+    def test_heartbeat_keeps_lease_fresh(self, lease_dir):
+        # GIVEN a held lease that looks old, with a fast heartbeat
+        holder = LeaseManager(lease_dir, ttl=10, heartbeat=0.05)
+        holder.acquire("stamp.png")
+        path = os.path.join(lease_dir, "stamp.png.lease")
+        os.utime(path, (0, 0))
+
+        # WHEN the heartbeat has had a chance to run
+        time.sleep(0.3)
+
+        # THEN the lease should have been touched and can't be taken over
+        assert time.time() - os.stat(path).st_mtime < 10
+        assert LeaseManager(lease_dir, ttl=10).acquire("stamp.png") is False
+
+    def test_pickled_copy_is_a_separate_node(self, lease_dir):
+        # GIVEN a manager holding a lease, as sent to a process pool worker
+        holder = LeaseManager(lease_dir)
+        holder.acquire("a.png")
+
+        # WHEN it is pickled
+        copy = pickle.loads(pickle.dumps(holder))
+
+        # THEN the copy should start with no leases under its own node id
+        assert copy.held() == set()
+        assert copy.node_id != holder.node_id
+        assert copy.acquire("a.png") is False
+
+
+class TestTakeover:
+    def _steal(self, lease_dir, key):
+        # What a node breaking an expired lease leaves behind: the same file, naming itself
+        thief = LeaseManager(lease_dir)
+        os.remove(os.path.join(lease_dir, f"{key}.lease"))
+        assert thief.acquire(key)
+        return thief
+
+    def test_heartbeat_reports_a_lease_taken_over(self, lease_dir):
+        # GIVEN a node whose lease was broken and retaken by another node while it stalled
+        holder = LeaseManager(lease_dir, ttl=10)
+        holder.acquire("stamp.png")
+        holder.acquire("other.png")
+        self._steal(lease_dir, "stamp.png")
+
+        # WHEN it next heartbeats
+        lost = holder.touch()
+
+        # THEN it should report and drop that lease only
+        assert lost == {"stamp.png"}
+        assert holder.held() == {"other.png"}
+        assert holder.still_held("stamp.png") is False
+        assert holder.still_held("other.png") is True
+
+    def test_releasing_a_lost_lease_keeps_the_new_holders(self, lease_dir):
+        # GIVEN a lease taken over before the heartbeat noticed
+        holder = LeaseManager(lease_dir, ttl=10)
+        holder.acquire("stamp.png")
+        thief = self._steal(lease_dir, "stamp.png")
+
+        # WHEN the original holder releases it
+        holder.release("stamp.png")
+
+        # THEN the new holder's lease should still be there
+        assert thief.still_held("stamp.png") is True
+
+    def test_put_back_lease_never_replaces_a_new_one(self, lease_dir):
+        # GIVEN a lease moved aside while checking it, and a new lease created at its path meanwhile
+        newcomer = LeaseManager(lease_dir)
+        newcomer.acquire("stamp.png")
+        tombstone = os.path.join(lease_dir, "stamp.png.lease.old-node.stale")
+        with open(tombstone, "w", encoding="utf-8") as f:
+            f.write('{"node": "old-node"}')
+
+        # WHEN the moved lease is put back
+        LeaseManager._restore(tombstone, os.path.join(lease_dir, "stamp.png.lease"))
+
+        # THEN the new lease should stand, and the tombstone be gone
+        assert newcomer.still_held("stamp.png") is True
+        assert [entry.name for entry in os.scandir(lease_dir)] == ["stamp.png.lease"]
@@ -0,0 +1,83 @@
+"""Tests for MaskCache.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import pickle
+
+from PIL import Image, ImageDraw
+
+from handling.util.mask_cache import MaskCache
+
+
+class TestMaskCache:
+    def test_mask_matches_directly_drawn_ellipse(self):
+        # GIVEN the mask CircleHandler used to draw for every image
+        expected = Image.new("L", (120, 120))
+        ImageDraw.Draw(expected).ellipse((2.5, 2.5, 115, 115), fill=255)
+
+        # WHEN fetching a plain mask of the same size
+        mask = MaskCache(max_bytes=1_000_000).get((120, 120))
+
+        # THEN the pixels should be identical
+        assert mask.tobytes() == expected.tobytes()
+
+    def test_repeated_sizes_are_hits(self):
+        # GIVEN an empty cache
+        cache = MaskCache(max_bytes=1_000_000)
+
+        # WHEN requesting two sizes, one of them twice
+        first = cache.get((50, 50))
+        cache.get((60, 60))
+        second = cache.get((50, 50))
+
+        # THEN the repeat should be served from the cache
+        assert second is first
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_least_recently_used_mask_is_evicted(self):
+        # GIVEN a cache with room for two 10x10 masks
+        cache = MaskCache(max_bytes=200)
+        cache.get((10, 10))
+        cache.get((9, 10))
+
+        # WHEN touching the first size and then adding a third
+        cache.get((10, 10))
+        cache.get((8, 10))
+
+        # THEN the untouched (9, 10) mask should have been evicted, not the recently used one
+        stats = cache.stats()
+        assert stats["mask_cache_evictions"] == 1
+        assert stats["mask_cache_bytes"] <= 200
+        misses = cache.misses
+        cache.get((10, 10))
+        assert cache.misses == misses
+
+    def test_antialiased_mask_has_soft_edges(self):
+        # GIVEN a cache that supersamples anti-aliased masks
+        cache = MaskCache(max_bytes=1_000_000, supersample=4)
+
+        # WHEN fetching the plain and anti-aliased masks for the same size
+        plain = cache.get((80, 80))
+        smooth = cache.get((80, 80), antialias=True)
+
+        # THEN both should be the right size, but only the smooth one has partial coverage at the edge
+        assert smooth.size == plain.size == (80, 80)
+        assert set(plain.tobytes()) == {0, 255}
+        assert len(set(smooth.tobytes())) > 2
+        assert smooth.getpixel((40, 40)) == 255 and smooth.getpixel((0, 0)) == 0
+
+    def test_pickles_without_its_masks(self):
+        # GIVEN a cache holding a mask
+        cache = MaskCache(max_bytes=1_000_000)
+        cache.get((30, 30))
+
+        # WHEN pickling it for a process pool worker
+        clone = pickle.loads(pickle.dumps(cache))
+
+        # THEN the worker's copy should work but start empty
+        assert clone.stats()["mask_cache_entries"] == 0
+        assert clone.get((30, 30)).size == (30, 30)
@@ -0,0 +1,178 @@
+"""Tests for the mock images.edit server, driven through the real OpenAI client.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import base64
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from devtools.mock_openai_server import (MockBehaviour, MockImageServer,
+                                         MockStats)
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """Starts a mock server with the given behaviour and points the OpenAI clients at it."""
+    servers = []
+
+    def start(**behaviour):
+        server = MockImageServer(MockBehaviour(latency_median=0.01, latency_sigma=0, seed=1, **behaviour)).start()
+        servers.append(server)
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        monkeypatch.setenv("OPENAI_API_KEY", "mock")
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def handler(tmp_path):
+    def create():
+        from handling.avatar_handler import AvatarHandler
+
+        (tmp_path / "in").mkdir(exist_ok=True)
+        handler = AvatarHandler(str(tmp_path / "in"), str(tmp_path / "out"))
+        handler.retry_policy.base_delay = 0.01
+        for index in range(3):
+            Image.new("RGB", (64, 64), (index * 80, 0, 0)).save(tmp_path / "in" / f"stamp{index}.png")
+        return handler
+
+    return create
+
+
+class TestMockServer:
+    def test_responses_are_deterministic_pngs(self, serve, handler):
+        # GIVEN a mock server and an avatar handler pointed at it
+        serve(image_size=64)
+        avatar_handler = handler()
+        upload = avatar_handler._load_input("stamp0.png")
+
+        # WHEN the same edit is requested twice, and once with another prompt
+        first = avatar_handler._execute_edit_request("prompt", upload)
+        again = avatar_handler._execute_edit_request("prompt", upload)
+        other = avatar_handler._execute_edit_request("other prompt", upload)
+
+        # THEN identical requests should get the same PNG, and a different prompt a different one
+        assert first.b64_json == again.b64_json != other.b64_json
+        with Image.open(io.BytesIO(base64.b64decode(first.b64_json))) as image:
+            assert (image.format, image.size) == ("PNG", (64, 64))
+
+    def test_batch_completes_through_the_async_engine(self, serve, handler, tmp_path):
+        # GIVEN a mock server with some latency
+        server = serve(image_size=64)
+        avatar_handler = handler()
+
+        # WHEN generating avatars for three inputs
+        saved = avatar_handler._execute_model_requests("prompt", ["stamp0.png", "stamp1.png", "stamp2.png"])
+
+        # THEN every avatar should be saved and every input archived
+        assert sorted(saved) == ["stamp0.png", "stamp1.png", "stamp2.png"]
+        assert sorted(entry.name for entry in os.scandir(tmp_path / "out")) == [
+            f"stamp{index}_avatar.png" for index in range(3)
+        ]
+        assert server.stats.by_status == {200: 3}
+        # AND each request's latency should be recorded, at least the injected 10ms
+        assert len(server.stats.latencies) == 3
+        assert server.stats.latency_percentiles()["latency_p50"] >= 0.01
+
+    def test_latency_percentiles_use_nearest_rank(self):
+        # GIVEN latencies of 1 to 100 ms, recorded out of order
+        stats = MockStats(latencies=[index / 1000 for index in range(100, 0, -1)])
+
+        # WHEN summarising them
+        # THEN each percentile should be a latency that was seen, and the summary replace the raw list
+        expected = {"latency_p50": 0.05, "latency_p95": 0.095, "latency_p99": 0.099, "latency_max": 0.1}
+        assert stats.latency_percentiles() == expected
+        assert "latencies" not in stats.as_dict()
+        assert MockStats().latency_percentiles()["latency_p99"] is None
+
+    def test_injected_errors_are_retried(self, serve, handler):
+        # GIVEN a server that fails every request
+        server = serve(error_rate=1.0)
+        avatar_handler = handler()
+        avatar_handler.retry_policy.attempts = 2
+
+        # WHEN generating an avatar
+        saved = avatar_handler._execute_model_requests("prompt", ["stamp0.png"])
+
+        # THEN the request should be retried once, then given up
+        assert saved == []
+        assert server.stats.by_status == {500: 2}
+
+    def test_quota_rate_limits_and_sends_retry_after(self, serve, handler):
+        # GIVEN a server that only allows one request in flight, with a slow generation
+        server = serve(quota=1, retry_after=0.01)
+        server.behaviour.latency_median = 0.1
+        avatar_handler = handler()
+        avatar_handler.max_concurrency = 3
+
+        # WHEN generating three avatars at once
+        saved = avatar_handler._execute_model_requests("prompt", ["stamp0.png", "stamp1.png", "stamp2.png"])
+
+        # THEN the extra requests should be rate limited, and the handler should back off and still finish
+        assert len(saved) == 3
+        assert server.stats.by_status[429] >= 1
+        assert avatar_handler.request_stats.rate_limited == server.stats.by_status[429]
+        assert avatar_handler.limiter.limit < 3
+
+
+class TestStreamingPreviews:
+    def test_partial_frames_are_previewed_before_each_avatar(self, serve, handler, tmp_path):
+        # GIVEN a streaming mock server and a handler with something showing previews
+        server = serve(image_size=64)
+        avatar_handler = handler()
+        frames = []
+        avatar_handler.preview_callback = lambda name, data: frames.append((name, Image.open(io.BytesIO(data)).size))
+
+        # WHEN generating three avatars
+        saved = avatar_handler._execute_model_requests("prompt", ["stamp0.png", "stamp1.png", "stamp2.png"])
+
+        # THEN each input should get two partial frames, sharper each time, before its full size avatar is saved
+        assert len(saved) == 3
+        assert sorted(frames) == sorted(
+            (f"stamp{index}.png", size) for index in range(3) for size in [(16, 16), (32, 32)]
+        )
+        for entry in os.scandir(tmp_path / "out"):
+            with Image.open(entry.path) as image:
+                assert image.size == (64, 64)
+        assert server.stats.by_status == {200: 3}
+
+    def test_single_edit_is_previewed_too(self, serve, handler):
+        # GIVEN a streaming mock server
+        serve(image_size=64)
+        avatar_handler = handler()
+        frames = []
+        avatar_handler.preview_callback = lambda name, data: frames.append(name)
+
+        # WHEN requesting one edit through the synchronous client
+        result = avatar_handler._execute_edit_request("prompt", avatar_handler._load_input("stamp0.png"))
+
+        # THEN its partial frames should be previewed and the completed image returned
+        assert frames == ["stamp0.png", "stamp0.png"]
+        with Image.open(io.BytesIO(base64.b64decode(result.b64_json))) as image:
+            assert image.size == (64, 64)
+
+    def test_cancelling_from_a_preview_stops_the_batch(self, serve, handler, tmp_path, caplog):
+        # GIVEN an operator who cancels as soon as the first preview looks wrong
+        serve(image_size=64)
+        avatar_handler = handler()
+        avatar_handler.max_concurrency = 1
+        avatar_handler.preview_callback = lambda name, data: avatar_handler.cancel()
+
+        # WHEN generating three avatars one at a time
+        saved = avatar_handler._execute_model_requests("prompt", ["stamp0.png", "stamp1.png", "stamp2.png"])
+
+        # THEN nothing should be saved, no further request sent, and every input left for another run
+        assert saved == []
+        assert avatar_handler.request_stats.requests == 1
+        assert len([entry for entry in os.scandir(tmp_path / "in") if entry.is_file()]) == 3
+        assert "Failed to generate" not in caplog.text
@@ -0,0 +1,60 @@
+"""Tests for path resolution.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import os
+
+import pytest
+
+from settings.paths import local_data_path
+from settings.static_dicts import (AVATAR_CACHE_DIR, IMAGE_DIR,
+                                   JOB_LEDGER_PATH, RESULT_CACHE_DIR)
+
+
+def _is_under(path, folder):
+    return os.path.commonpath([os.path.abspath(path), os.path.abspath(folder)]) == os.path.abspath(folder)
+
+
+class TestLocalDataPath:
+    @pytest.mark.parametrize("path", [JOB_LEDGER_PATH, RESULT_CACHE_DIR, AVATAR_CACHE_DIR])
+    def test_defaults_are_outside_the_shared_input_tree(self, path):
+        # GIVEN the configured ledger and cache locations
+        # WHEN comparing them to the shared input folder and the working directory
+        # THEN they should be absolute and inside neither
+        assert os.path.isabs(path)
+        assert not _is_under(path, IMAGE_DIR)
+        assert not _is_under(path, os.getcwd())
+
+    def test_independent_of_working_directory(self, tmp_path, monkeypatch):
+        # GIVEN a path resolved from one working directory
+        monkeypatch.delenv("STAMPEDE_DATA_DIR", raising=False)
+        before = local_data_path("ledger.sqlite3")
+
+        # WHEN moving into another folder, as the frozen app does into the exe's folder
+        monkeypatch.chdir(tmp_path)
+
+        # THEN the path should resolve to the same place, outside the new folder
+        assert local_data_path("ledger.sqlite3") == before
+        assert not _is_under(before, tmp_path)
+
+    def test_windows_uses_local_app_data(self, tmp_path, monkeypatch):
+        # GIVEN a Windows machine with %LOCALAPPDATA% set
+        monkeypatch.delenv("STAMPEDE_DATA_DIR", raising=False)
+        monkeypatch.setattr(os, "name", "nt")
+        monkeypatch.setenv("LOCALAPPDATA", str(tmp_path))
+
+        # WHEN resolving the ledger path
+        # THEN it should be in a stampede folder under %LOCALAPPDATA%
+        assert local_data_path("ledger.sqlite3") == os.path.join(str(tmp_path), "stampede", "ledger.sqlite3")
+
+    def test_environment_override(self, tmp_path, monkeypatch):
+        # GIVEN STAMPEDE_DATA_DIR pointing at a chosen folder
+        monkeypatch.setenv("STAMPEDE_DATA_DIR", str(tmp_path))
+
+        # WHEN resolving a path
+        # THEN it should be under that folder
+        assert local_data_path("cache") == os.path.join(str(tmp_path), "cache")
@@ -0,0 +1,72 @@
+"""Tests for perceptual hashing and duplicate grouping.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+from PIL import Image, ImageOps
+
+from handling.util.perceptual_hash import distance, group_duplicates, signature
+
+
+def _picture():
+    """A detailed RGB picture, standing in for a customer photo."""
+    fractal = Image.effect_mandelbrot((400, 300), (-2.0, -1.2, 1.0, 1.2), 60)
+    return Image.merge("RGB", (fractal, ImageOps.invert(fractal), fractal.rotate(180)))
+
+
+def _other_picture():
+    return Image.merge("RGB", [Image.linear_gradient("L").resize((400, 300)).rotate(angle) for angle in (0, 90, 45)])
+
+
+class TestSignature:
+    def test_reencoded_and_resized_copy_is_close(self, tmp_path):
+        # GIVEN the same picture saved as a PNG, and as a smaller JPEG
+        _picture().save(tmp_path / "a.png")
+        _picture().resize((200, 150)).save(tmp_path / "a.jpg", quality=80)
+
+        # WHEN comparing their signatures
+        bits = distance(signature(str(tmp_path / "a.png")), signature(str(tmp_path / "a.jpg")))
+
+        # THEN the hashes should be only a few bits apart
+        assert bits is not None and bits <= 6
+
+    def test_different_picture_is_far(self, tmp_path):
+        # GIVEN two different pictures of the same size
+        _picture().save(tmp_path / "a.png")
+        _other_picture().save(tmp_path / "b.png")
+
+        # WHEN comparing their signatures
+        bits = distance(signature(str(tmp_path / "a.png")), signature(str(tmp_path / "b.png")))
+
+        # THEN they should not count as duplicates
+        assert bits is None or bits > 6
+
+    def test_recoloured_copy_is_not_a_duplicate(self, tmp_path):
+        # GIVEN a picture and a copy with a strong red tint, which hashes much the same in greyscale
+        picture = _picture()
+        picture.save(tmp_path / "a.png")
+        red, green, blue = picture.split()
+        Image.merge("RGB", (red.point(lambda value: min(255, value + 80)), green, blue)).save(tmp_path / "b.png")
+
+        # WHEN comparing their signatures
+        # THEN the colour check should tell them apart
+        assert distance(signature(str(tmp_path / "a.png")), signature(str(tmp_path / "b.png"))) is None
+
+
+class TestGroupDuplicates:
+    def test_duplicates_join_the_first_matching_group(self, tmp_path):
+        # GIVEN two copies of one picture and one other picture
+        _picture().save(tmp_path / "a.png")
+        _other_picture().save(tmp_path / "b.png")
+        _picture().save(tmp_path / "c.jpg", quality=90)
+        signatures = {name: signature(str(tmp_path / name)) for name in ("a.png", "b.png", "c.jpg")}
+
+        # WHEN grouping them
+        groups = group_duplicates(signatures, max_distance=6)
+
+        # THEN the copies should share a group, led by the first one seen
+        assert [[name for name, _ in group] for group in groups] == [["a.png", "c.jpg"], ["b.png"]]
+        assert groups[0][0] == ("a.png", 0)
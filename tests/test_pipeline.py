@@ -0,0 +1,79 @@
+"""Tests for StagedPipeline.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import logging
+import threading
+
+from handling.util.pipeline import PipelineStage, StagedPipeline
+
+
+class TestStagedPipeline:
+    def test_items_flow_through_every_stage(self):
+        # GIVEN a three stage pipeline where the middle stage fans out
+        results = []
+        lock = threading.Lock()
+
+        def collect(item):
+            with lock:
+                results.append(item)
+            return ()
+
+        pipeline = StagedPipeline(
+            [
+                PipelineStage("double", lambda x: [x * 2]),
+                PipelineStage("fan", lambda x: [x, x + 1], workers=3),
+                PipelineStage("collect", collect),
+            ],
+            queue_size=2,
+        )
+
+        # WHEN running ten items through it
+        pipeline.run(range(10))
+
+        # THEN every fanned-out item should reach the last stage exactly once
+        assert sorted(results) == sorted([x * 2 for x in range(10)] + [x * 2 + 1 for x in range(10)])
+        assert pipeline.stats()["fan"]["processed"] == 10
+        assert pipeline.stats()["collect"]["processed"] == 20
+
+    def test_queues_never_exceed_their_bound(self):
+        # GIVEN a fast producer feeding a slow consumer through a queue of two
+        release = threading.Event()
+
+        def slow(item):
+            release.wait(0.01)
+            return ()
+
+        pipeline = StagedPipeline([PipelineStage("pass", lambda x: [x]), PipelineStage("slow", slow)], queue_size=2)
+
+        # WHEN running many items
+        pipeline.run(range(50))
+
+        # THEN no queue should ever have held more than its bound
+        assert all(stage["peak_queued"] <= 2 for stage in pipeline.stats().values())
+        assert pipeline.queue_depths() == {"pass": 0, "slow": 0}
+
+    def test_stage_error_is_logged_and_run_continues(self, caplog):
+        # GIVEN a stage that fails on one item
+        seen = []
+
+        def fussy(item):
+            if item == 3:
+                raise ValueError("bad item")
+            return [item]
+
+        pipeline = StagedPipeline(
+            [PipelineStage("fussy", fussy), PipelineStage("sink", lambda x: seen.append(x) or ())]
+        )
+
+        # WHEN running items through it
+        with caplog.at_level(logging.ERROR):
+            pipeline.run(range(5))
+
+        # THEN the failure should be logged and the remaining items still processed
+        assert "Pipeline stage fussy failed for 3" in caplog.text
+        assert seen == [0, 1, 2, 4]
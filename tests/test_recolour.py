@@ -0,0 +1,149 @@
+"""Tests for the recolour engines.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import random
+
+import pytest
+from PIL import Image
+
+from handling.exception.configuration_error import ConfigurationError
+from handling.util import recolour
+from handling.util.recolour import (NumpyRecolourEngine, PillowRecolourEngine,
+                                    create_recolour_engine)
+from settings.static_dicts import COLOURS
+
+
+def _legacy_colour_sub(image, colour):
+    """The original per-pixel loop, kept as the reference the engines must match."""
+    new_image = []
+    for data in image.get_flattened_data():
+        if data[3] != 0 and data[0] < 200:
+            new_image.append(colour)
+        else:
+            new_image.append(data)
+    image.putdata(new_image)
+    return image
+
+
+def _noisy_image(width=64, height=48, seed=7):
+    rng = random.Random(seed)
+    img = Image.new("RGBA", (width, height))
+    # Bias values around the 200 red threshold and the zero alpha edge case
+    img.putdata(
+        [
+            (
+                rng.choice([0, 199, 200, 201, rng.randrange(256)]),
+                rng.randrange(256),
+                rng.randrange(256),
+                rng.choice([0, 1, 255, rng.randrange(256)]),
+            )
+            for _ in range(width * height)
+        ]
+    )
+    return img
+
+
+def _available_engines():
+    engines = [PillowRecolourEngine]
+    if recolour.np is not None:
+        engines.append(NumpyRecolourEngine)
+    return engines
+
+
+@pytest.mark.parametrize("engine_cls", _available_engines())
+class TestEngineMatchesLegacyLoop:
+    def test_output_is_bit_identical(self, engine_cls):
+        # GIVEN a noisy image covering the threshold and transparency edge cases
+        source = _noisy_image()
+        colour = (148, 0, 211, 255)
+
+        # WHEN recolouring with both the legacy loop and the engine
+        expected = _legacy_colour_sub(source.copy(), colour)
+        result = engine_cls().colour_sub(source.copy(), colour)
+
+        # THEN every pixel should match exactly
+        assert result.tobytes() == expected.tobytes()
+
+    def test_recolours_in_place(self, engine_cls):
+        # GIVEN an opaque dark image
+        img = Image.new("RGBA", (4, 4), (10, 10, 10, 255))
+
+        # WHEN recolouring
+        result = engine_cls().colour_sub(img, (255, 0, 0, 255))
+
+        # THEN the same image object is returned, as callers of _colour_sub expect
+        assert result is img
+        assert img.getpixel((0, 0)) == (255, 0, 0, 255)
+
+    def test_rejects_non_rgba(self, engine_cls):
+        # GIVEN an RGB image (no alpha band to test against)
+        img = Image.new("RGB", (2, 2))
+
+        # WHEN recolouring
+        # THEN a ValueError should explain the mode requirement
+        with pytest.raises(ValueError, match="RGBA"):
+            engine_cls().colour_sub(img, (255, 0, 0, 255))
+
+
+class TestCreateRecolourEngine:
+    def test_auto_prefers_numpy_when_installed(self, monkeypatch):
+        # GIVEN NumPy is importable
+        pytest.importorskip("numpy")
+
+        # WHEN creating the auto engine
+        # THEN the NumPy engine should be chosen
+        assert isinstance(create_recolour_engine("auto"), NumpyRecolourEngine)
+
+    def test_auto_falls_back_to_pillow(self, monkeypatch):
+        # GIVEN NumPy is not installed
+        monkeypatch.setattr(recolour, "np", None)
+
+        # WHEN creating the auto engine
+        # THEN the Pillow engine should be chosen
+        assert isinstance(create_recolour_engine("auto"), PillowRecolourEngine)
+
+    def test_explicit_numpy_without_numpy_raises(self, monkeypatch):
+        # GIVEN NumPy is not installed
+        monkeypatch.setattr(recolour, "np", None)
+
+        # WHEN explicitly requesting the NumPy engine
+        # THEN a ConfigurationError should be raised rather than silently falling back
+        with pytest.raises(ConfigurationError, match="NumPy"):
+            create_recolour_engine("numpy")
+
+    def test_unknown_engine_raises(self):
+        with pytest.raises(ConfigurationError, match="Unknown recolour engine"):
+            create_recolour_engine("gpu")
+
+
+@pytest.mark.parametrize("engine_cls", _available_engines())
+class TestFanOut:
+    def test_each_variant_matches_a_fresh_recolour(self, engine_cls):
+        # GIVEN a noisy source image and the full set of standard colours
+        source = _noisy_image()
+
+        # WHEN fanning out into every colour from a single mask
+        variants = {code: img.tobytes() for code, img in engine_cls().fan_out(source.copy(), COLOURS)}
+
+        # THEN each variant should equal recolouring an untouched copy with that colour
+        assert list(variants) == list(COLOURS)
+        for code, colour in COLOURS.items():
+            assert variants[code] == _legacy_colour_sub(source.copy(), colour).tobytes()
+
+    def test_ink_mask_is_computed_once(self, engine_cls, monkeypatch):
+        # GIVEN an engine whose mask builder is being counted
+        engine = engine_cls()
+        calls = []
+        original = engine.ink_mask
+        monkeypatch.setattr(engine, "ink_mask", lambda image: calls.append(1) or original(image))
+
+        # WHEN fanning out into three colours
+        list(engine.fan_out(_noisy_image(), {"R": (255, 0, 0, 255), "G": (0, 255, 0, 255), "B": (0, 0, 255, 255)}))
+
+        # THEN the pixels should only have been scanned once
+        assert len(calls) == 1
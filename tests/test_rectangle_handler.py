@@ -7,11 +7,17 @@ Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
 """
 
 import logging
+import os
+import time
 from unittest.mock import MagicMock, mock_open, patch
 
+import pytest
 from PIL import Image
 
-from settings.static_dicts import COLOURS, RECT_PATHS
+from handling.util.job_ledger import JobLedger
+from handling.util.result_cache import ResultCache
+from settings.init_dirs import init_base_dirs, init_rect_dirs
+from settings.static_dicts import COLOURS, PROCESSED_DIR_RECT, RECT_PATHS
 
 
 class TestCustomStampDetection:
@@ -82,7 +88,7 @@ class TestHandlerFunction:
     def test_rename_failure_aborts_processing(self, rectangle_handler, monkeypatch):
         # GIVEN a file that already exists as a .png (rename will fail)
         monkeypatch.setattr(
-            "handling.imagehandler.rectangle_handler.os.rename",
+            "handling.base_image_handler.os.rename",
             MagicMock(side_effect=FileExistsError),
         )
         save_mock = MagicMock()
@@ -97,7 +103,7 @@ class TestHandlerFunction:
     def test_rename_failure_is_logged(self, rectangle_handler, monkeypatch, caplog):
         # GIVEN a file that already exists as a .png
         monkeypatch.setattr(
-            "handling.imagehandler.rectangle_handler.os.rename",
+            "handling.base_image_handler.os.rename",
             MagicMock(side_effect=FileExistsError),
         )
 
@@ -111,7 +117,7 @@ class TestHandlerFunction:
     def test_custom_stamp_saves_to_custom_path(self, rectangle_handler, monkeypatch, tmp_path):
         # GIVEN a custom stamp file (single "&") and writable output dirs
         img = Image.new("RGBA", (50, 50), (50, 50, 50, 255))
-        monkeypatch.setattr("handling.imagehandler.rectangle_handler.os.rename", lambda old, new: None)
+        monkeypatch.setattr("handling.base_image_handler.os.rename", lambda old, new: None)
         monkeypatch.setattr("PIL.Image.open", lambda path: img)
         monkeypatch.setattr(rectangle_handler, "_open_save_destination", lambda d: None)
         monkeypatch.setattr(rectangle_handler, "_archive_image", lambda f: None)
@@ -134,7 +140,7 @@ class TestHandlerFunction:
     def test_generic_stamp_creates_all_colours(self, rectangle_handler, monkeypatch):
         # GIVEN a generic stamp file (no "&") and writable output dirs
         img = Image.new("RGBA", (50, 50), (50, 50, 50, 255))
-        monkeypatch.setattr("handling.imagehandler.rectangle_handler.os.rename", lambda old, new: None)
+        monkeypatch.setattr("handling.base_image_handler.os.rename", lambda old, new: None)
         monkeypatch.setattr("PIL.Image.open", lambda path: img)
         monkeypatch.setattr(rectangle_handler, "_open_save_destination", lambda d: None)
         monkeypatch.setattr(rectangle_handler, "_archive_image", lambda f: None)
@@ -155,7 +161,7 @@ class TestHandlerFunction:
     def test_generic_stamp_uses_correct_colour_paths(self, rectangle_handler, monkeypatch):
         # GIVEN a generic stamp file
         img = Image.new("RGBA", (50, 50), (50, 50, 50, 255))
-        monkeypatch.setattr("handling.imagehandler.rectangle_handler.os.rename", lambda old, new: None)
+        monkeypatch.setattr("handling.base_image_handler.os.rename", lambda old, new: None)
         monkeypatch.setattr("PIL.Image.open", lambda path: img)
         monkeypatch.setattr(rectangle_handler, "_open_save_destination", lambda d: None)
         monkeypatch.setattr(rectangle_handler, "_archive_image", lambda f: None)
@@ -177,7 +183,7 @@ class TestHandlerFunction:
 
     def test_unexpected_error_is_logged(self, rectangle_handler, monkeypatch, caplog):
         # GIVEN a file where Image.open raises an unexpected error
-        monkeypatch.setattr("handling.imagehandler.rectangle_handler.os.rename", lambda old, new: None)
+        monkeypatch.setattr("handling.base_image_handler.os.rename", lambda old, new: None)
         monkeypatch.setattr("PIL.Image.open", MagicMock(side_effect=OSError("corrupt file")))
 
         # WHEN processing the file
@@ -188,6 +194,195 @@ class TestHandlerFunction:
         assert "bad." in caplog.text
 
 
+class TestPipelineBackend:
+    @pytest.fixture
+    def workspace(self, tmp_path, monkeypatch):
+        """A real img/ tree in a temp dir holding one custom and one generic stamp."""
+        monkeypatch.chdir(tmp_path)
+        init_base_dirs()
+        init_rect_dirs()
+        for name in ("custom&G.jpg", "generic.png"):
+            img = Image.new("RGB", (40, 30), (255, 255, 255))
+            img.paste((20, 20, 20), (5, 5, 35, 25))
+            img.save(f"img/{name}")
+        return tmp_path
+
+    def _run(self, rectangle_handler, backend, monkeypatch):
+        monkeypatch.setattr(rectangle_handler, "_open_save_destination", lambda d: None)
+        # os.listdir is patched out for every test by conftest, so list the directory with scandir
+        rectangle_handler.img_dir = [entry.name for entry in os.scandir("img")]
+        rectangle_handler.executor_backend = backend
+        rectangle_handler.max_workers = 2
+        rectangle_handler.execute()
+        outputs = {}
+        for root, _, files in os.walk(PROCESSED_DIR_RECT):
+            for file in files:
+                with Image.open(os.path.join(root, file)) as img:
+                    outputs[os.path.join(root, file)] = img.tobytes()
+        return outputs
+
+    def test_pipeline_matches_serial_output(self, rectangle_handler, workspace, monkeypatch):
+        # GIVEN the same inputs processed once serially
+        serial = self._run(rectangle_handler, "serial", monkeypatch)
+        for root, _, files in os.walk("img/zArchive"):
+            for file in files:
+                os.replace(os.path.join(root, file), f"img/{file}")
+        for path in serial:
+            os.remove(path)
+
+        # WHEN processing them again through the staged pipeline
+        piped = self._run(rectangle_handler, "pipeline", monkeypatch)
+
+        # THEN the pipeline should write the same files with the same pixels, and archive the inputs
+        assert len(serial) == 1 + len(COLOURS)
+        assert piped == serial
+        assert sorted(entry.name for entry in os.scandir("img/zArchive")) == ["custom&G.png", "generic.png"]
+        assert set(rectangle_handler.pipeline.stats()) == {"decode", "transform", "encode", "write"}
+
+    def test_lazy_transform_is_timed_in_the_transform_stage(self, rectangle_handler, workspace, monkeypatch):
+        # GIVEN a transform whose outputs are slow to draw, like a fan-out painting each colour on demand
+        transform = rectangle_handler._transform
+
+        def slow_fan_out(job):
+            for code, image in transform(job):
+                time.sleep(0.02)
+                yield code, image
+
+        monkeypatch.setattr(rectangle_handler, "_transform", slow_fan_out)
+
+        # WHEN processing through the staged pipeline
+        self._run(rectangle_handler, "pipeline", monkeypatch)
+
+        # THEN the pixel work should be counted against the transform stage, not the encode stage
+        stats = rectangle_handler.pipeline.stats()
+        assert stats["transform"]["busy_seconds"] >= 0.02 * (1 + len(COLOURS))
+        assert stats["encode"]["busy_seconds"] < stats["transform"]["busy_seconds"]
+
+
+class TestResultCache:
+    @pytest.mark.parametrize("backend", ["serial", "pipeline"])
+    def test_repeat_input_is_served_from_cache(self, rectangle_handler, tmp_path, monkeypatch, backend):
+        # GIVEN a real img/ tree, a result cache, and a generic stamp processed once
+        monkeypatch.chdir(tmp_path)
+        init_base_dirs()
+        init_rect_dirs()
+        rectangle_handler.result_cache = ResultCache(str(tmp_path / "cache"), max_bytes=10_000_000)
+        rectangle_handler.executor_backend = backend
+        monkeypatch.setattr(rectangle_handler, "_open_save_destination", lambda d: None)
+        img = Image.new("RGB", (40, 30), (255, 255, 255))
+        img.paste((20, 20, 20), (5, 5, 35, 25))
+        img.save("img/first.png")
+        rectangle_handler.img_dir = ["first.png"]
+        rectangle_handler.execute()
+
+        # WHEN the same artwork is dropped in again under another name
+        img.save("img/second.png")
+        rectangle_handler.img_dir = ["second.png"]
+        monkeypatch.setattr(rectangle_handler, "_transform", MagicMock(side_effect=AssertionError("recomputed")))
+        rectangle_handler.execute()
+
+        # THEN its outputs should be copied from the cache under the new name, and it should be archived
+        assert rectangle_handler.batch_stats["result_cache_hits"] == 1
+        for code, path in RECT_PATHS.items():
+            if code == "Custom":
+                continue
+            with Image.open(f"{PROCESSED_DIR_RECT}/{path}/first&{code}.png") as first:
+                with Image.open(f"{PROCESSED_DIR_RECT}/{path}/second&{code}.png") as second:
+                    assert first.tobytes() == second.tobytes()
+        assert os.path.exists("img/zArchive/second.png")
+
+
+class TestJobLedger:
+    def test_interrupted_run_is_resumed_without_reprocessing(self, rectangle_handler, tmp_path, monkeypatch):
+        # GIVEN two files, where a run crashed after saving the first one's outputs but before archiving it
+        monkeypatch.chdir(tmp_path)
+        init_base_dirs()
+        init_rect_dirs()
+        rectangle_handler.ledger = JobLedger(str(tmp_path / "ledger.sqlite3"))
+        rectangle_handler.executor_backend = "serial"
+        monkeypatch.setattr(rectangle_handler, "_open_save_destination", lambda d: None)
+        for name in ("done&G.jpg", "todo&G.jpg"):
+            Image.new("RGB", (40, 30), (20, 20, 20)).save(f"img/{name}")
+        rectangle_handler.img_dir = ["done&G.jpg"]
+        with monkeypatch.context() as m:
+            m.setattr(rectangle_handler, "_archive_image", MagicMock(side_effect=KeyboardInterrupt))
+            with pytest.raises(KeyboardInterrupt):
+                rectangle_handler.execute()
+        assert rectangle_handler.ledger.state("RectangleHandler", os.path.realpath("img"), "done&G.png") == "saved"
+
+        # WHEN the batch is run again over what is left in img/
+        rectangle_handler.img_dir = sorted(entry.name for entry in os.scandir("img") if entry.is_file())
+        transform = MagicMock(wraps=rectangle_handler._transform)
+        monkeypatch.setattr(rectangle_handler, "_transform", transform)
+        rectangle_handler.execute()
+
+        # THEN only the unfinished file should be processed, and both should end up archived
+        assert [call.args[0].name for call in transform.call_args_list] == ["todo&G.png"]
+        assert sorted(entry.name for entry in os.scandir("img/zArchive")) == ["done&G.png", "todo&G.png"]
+        assert rectangle_handler.ledger.pending() == []
+        rectangle_handler.ledger.close()
+
+
+class TestLeases:
+    def test_nodes_sharing_a_folder_split_the_files(self, tmp_path, monkeypatch):
+        # GIVEN two handlers using leases on the same input folder, one already working on a file
+        from handling.imagehandler.rectangle_handler import RectangleHandler
+
+        monkeypatch.chdir(tmp_path)
+        init_base_dirs()
+        init_rect_dirs()
+        for name in ("busy&G.jpg", "free&G.jpg"):
+            Image.new("RGB", (40, 30), (20, 20, 20)).save(f"img/{name}")
+        other_node, this_node = RectangleHandler(), RectangleHandler()
+        for handler in (other_node, this_node):
+            handler.enable_leases()
+            handler.executor_backend = "serial"
+            monkeypatch.setattr(handler, "_open_save_destination", lambda d: None)
+        assert other_node.leases.acquire("busy&G.png")
+
+        # WHEN this node processes everything it listed
+        this_node.img_dir = ["busy&G.jpg", "free&G.jpg"]
+        this_node.execute()
+
+        # THEN it should leave the claimed file alone and release its own lease when done
+        assert os.path.exists("img/busy&G.jpg")
+        assert os.path.exists("img/zArchive/free&G.png")
+        assert this_node.leases.held() == set()
+        assert [entry.name for entry in os.scandir("img/.leases")] == ["busy&G.png.lease"]
+
+    def test_file_whose_lease_is_taken_over_is_left_to_the_new_holder(self, tmp_path, monkeypatch):
+        # GIVEN a node that stalls mid-transform while another node breaks its lease and takes the file over
+        from handling.imagehandler.rectangle_handler import RectangleHandler
+        from handling.util.leases import LeaseManager
+
+        monkeypatch.chdir(tmp_path)
+        init_base_dirs()
+        init_rect_dirs()
+        Image.new("RGB", (40, 30), (20, 20, 20)).save("img/slow&G.jpg")
+        handler = RectangleHandler()
+        handler.enable_leases()
+        handler.executor_backend = "serial"
+        monkeypatch.setattr(handler, "_open_save_destination", lambda d: None)
+        other_node = LeaseManager("img/.leases")
+        transform = handler._transform
+
+        def stalled_transform(job):
+            os.remove("img/.leases/slow&G.png.lease")
+            assert other_node.acquire(job.name)
+            return transform(job)
+
+        monkeypatch.setattr(handler, "_transform", stalled_transform)
+
+        # WHEN this node carries on with the file
+        handler.img_dir = ["slow&G.jpg"]
+        handler.execute()
+
+        # THEN it should neither save outputs nor archive the input, and the new holder's lease should stand
+        assert not [name for _, _, names in os.walk(PROCESSED_DIR_RECT) for name in names]
+        assert os.path.exists("img/slow&G.png")
+        assert other_node.still_held("slow&G.png")
+
+
 class TestRectPaths:
     def test_all_colour_codes_have_paths(self, rectangle_handler):
         # GIVEN the COLOURS and RECT_PATHS dictionaries
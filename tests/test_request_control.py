@@ -0,0 +1,141 @@
+"""Tests for retry backoff and the adaptive concurrency limiter.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import asyncio
+import email.utils
+import time
+
+import pytest
+
+from handling.util.request_control import (AdaptiveLimiter, RetryPolicy,
+                                           is_retryable, retry_after)
+
+
+class TestRetryAfter:
+    @pytest.mark.parametrize(
+        "headers, expected",
+        [({"retry-after": "3"}, 3.0), ({"retry-after-ms": "250", "retry-after": "9"}, 0.25), ({}, None)],
+    )
+    def test_seconds_and_milliseconds(self, api_error, headers, expected):
+        # GIVEN a 429 carrying Retry-After headers
+        # WHEN reading the requested delay
+        # THEN the millisecond header should win over the seconds one
+        assert retry_after(api_error(429, headers)) == expected
+
+    def test_http_date(self, api_error):
+        # GIVEN a Retry-After given as a date ten seconds from now
+        when = email.utils.formatdate(time.time() + 10, usegmt=True)
+
+        # WHEN reading the requested delay
+        # THEN it should be roughly the time until then
+        assert 8 <= retry_after(api_error(429, {"retry-after": when})) <= 10
+
+
+class TestRetryPolicy:
+    def test_only_transient_errors_are_retried(self, api_error):
+        # GIVEN a policy allowing three attempts
+        policy = RetryPolicy(attempts=3)
+
+        # WHEN deciding whether to retry
+        # THEN rate limits and server errors should be, until the attempts run out; bad requests never
+        assert is_retryable(api_error(429)) and is_retryable(api_error(503))
+        assert not is_retryable(api_error(400)) and not is_retryable(ValueError())
+        assert policy.should_retry(api_error(429), 2) is True
+        assert policy.should_retry(api_error(429), 3) is False
+
+    def test_backoff_is_jittered_under_an_exponential_ceiling(self, api_error):
+        # GIVEN a policy with a one second base and an eight second cap
+        policy = RetryPolicy(base_delay=1.0, max_delay=8.0)
+
+        # WHEN drawing delays after successive failures
+        delays = {attempt: [policy.delay(api_error(500), attempt) for _ in range(200)] for attempt in (1, 3, 10)}
+
+        # THEN they should spread between zero and 1, 4 and then the cap
+        assert all(0 <= d <= 1 for d in delays[1]) and all(0 <= d <= 4 for d in delays[3])
+        assert all(0 <= d <= 8 for d in delays[10]) and max(delays[10]) > 4
+        assert len(set(delays[3])) > 100
+
+    def test_retry_after_is_a_minimum(self, api_error):
+        # GIVEN a 429 asking for a five second wait
+        error = api_error(429, {"retry-after": "5"})
+
+        # WHEN drawing the delay
+        # THEN it should be at least that, plus jitter of up to the base delay
+        assert all(5 <= RetryPolicy(base_delay=1.0).delay(error, 1) <= 6 for _ in range(50))
+
+
+class TestAdaptiveLimiter:
+    def test_successes_grow_the_limit_up_to_the_maximum(self):
+        # GIVEN a limiter starting at two with a ceiling of four
+        limiter = AdaptiveLimiter(2, maximum=4)
+
+        async def succeed(times):
+            for _ in range(times):
+                await limiter.release(await limiter.acquire(), succeeded=True)
+
+        # WHEN requests keep succeeding
+        asyncio.run(succeed(3))
+        grown = limiter.limit
+        asyncio.run(succeed(50))
+
+        # THEN the limit should rise by about one per window of successes, stopping at the ceiling
+        assert grown == 3
+        assert (limiter.limit, limiter.peak) == (4, 4)
+
+    def test_burst_of_rate_limits_halves_once(self):
+        # GIVEN eight requests in flight under a limit of eight
+        limiter = AdaptiveLimiter(8)
+
+        async def burst():
+            tickets = [await limiter.acquire() for _ in range(8)]
+            for ticket in tickets:
+                await limiter.release(ticket, rate_limited=True)
+            # A request sent after the cut is rate limited too
+            await limiter.release(await limiter.acquire(), rate_limited=True)
+
+        # WHEN they are all rate limited
+        asyncio.run(burst())
+
+        # THEN the limit should halve for the burst, and again for the later request, but no further
+        assert limiter.limit == 2
+
+    def test_never_drops_below_the_minimum(self):
+        # GIVEN a limiter already at its minimum
+        limiter = AdaptiveLimiter(1)
+
+        # WHEN it is rate limited
+        async def limited():
+            await limiter.release(await limiter.acquire(), rate_limited=True)
+
+        asyncio.run(limited())
+
+        # THEN it should still allow one request
+        assert limiter.limit == 1
+
+    def test_waits_for_a_free_slot(self):
+        # GIVEN a limit of one with the slot taken
+        limiter = AdaptiveLimiter(1)
+        order = []
+
+        async def hold_then_release():
+            ticket = await limiter.acquire()
+            waiter = asyncio.create_task(second())
+            await asyncio.sleep(0.01)
+            order.append("release")
+            await limiter.release(ticket, succeeded=True)
+            await waiter
+
+        async def second():
+            await limiter.acquire()
+            order.append("acquired")
+
+        # WHEN another request asks for a slot
+        asyncio.run(hold_then_release())
+
+        # THEN it should only get one after the first is released
+        assert order == ["release", "acquired"]
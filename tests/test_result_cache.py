@@ -0,0 +1,142 @@
+"""Tests for ResultCache.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import os
+import time
+
+import pytest
+
+from handling.util.result_cache import ResultCache, main
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "cache"), max_bytes=1_000_000)
+
+
+@pytest.fixture
+def outputs(tmp_path):
+    """Two written output files with their colour codes."""
+    pairs = []
+    for code, content in (("R", b"red"), ("B", b"blue")):
+        path = tmp_path / f"out{code}.png"
+        path.write_bytes(content)
+        pairs.append((code, str(path)))
+    return pairs
+
+
+class TestMakeKey:
+    def test_same_input_and_params_give_same_key(self):
+        # GIVEN identical bytes and parameters
+        # WHEN building two keys
+        # THEN they should match
+        assert ResultCache.make_key(b"img", "CircleHandler", "&R", 1) == ResultCache.make_key(
+            b"img", "CircleHandler", "&R", 1
+        )
+
+    def test_any_parameter_changes_the_key(self):
+        # GIVEN a baseline key
+        key = ResultCache.make_key(b"img", "CircleHandler", "&R", None, 1)
+
+        # WHEN changing the bytes, handler, colour code, size or version
+        variants = [
+            ResultCache.make_key(b"img2", "CircleHandler", "&R", None, 1),
+            ResultCache.make_key(b"img", "RectangleHandler", "&R", None, 1),
+            ResultCache.make_key(b"img", "CircleHandler", "&B", None, 1),
+            ResultCache.make_key(b"img", "CircleHandler", "&R", (200, 200), 1),
+            ResultCache.make_key(b"img", "CircleHandler", "&R", None, 2),
+        ]
+
+        # THEN every key should differ
+        assert len({key, *variants}) == 6
+
+
+class TestStoreAndRestore:
+    def test_miss_then_hit(self, cache, outputs):
+        # GIVEN an empty cache
+        key = cache.make_key(b"img")
+        assert cache.lookup(key) is None
+
+        # WHEN storing outputs under the key
+        cache.store(key, outputs)
+
+        # THEN a lookup should return their codes in order
+        assert cache.lookup(key) == ["R", "B"]
+        assert cache.stats() == {"result_cache_hits": 1, "result_cache_misses": 1}
+
+    def test_restore_writes_outputs_to_new_destinations(self, cache, outputs, tmp_path):
+        # GIVEN a stored entry
+        key = cache.make_key(b"img")
+        cache.store(key, outputs)
+
+        # WHEN restoring it under different names
+        destinations = [str(tmp_path / "new_R.png"), str(tmp_path / "new_B.png")]
+        cache.restore(key, destinations)
+
+        # THEN each destination should hold the matching output
+        assert [open(path, "rb").read() for path in destinations] == [b"red", b"blue"]
+
+    def test_storing_existing_key_is_a_no_op(self, cache, outputs):
+        # GIVEN a stored entry
+        key = cache.make_key(b"img")
+        cache.store(key, outputs)
+
+        # WHEN another worker stores the same key
+        cache.store(key, outputs[:1])
+
+        # THEN the original entry should be kept and no staging directories left behind
+        assert cache.lookup(key) == ["R", "B"]
+        assert not [name for name in os.listdir(cache.root) if name.startswith(".staging-")]
+
+
+class TestEviction:
+    def test_least_recently_used_entry_is_evicted(self, cache, outputs):
+        # GIVEN two entries, where the older one was looked up most recently
+        old, new = cache.make_key(b"old"), cache.make_key(b"new")
+        cache.store(old, outputs)
+        cache.store(new, outputs)
+        os.utime(os.path.join(cache._entry_dir(new), "manifest.json"), (1, 1))
+        cache.lookup(old)
+
+        # WHEN trimming the cache to roughly one entry
+        entry_size = sum(entry.stat().st_size for entry in os.scandir(cache._entry_dir(old)))
+        cache.max_bytes = entry_size
+
+        # THEN only the stale entry should be removed
+        assert cache.evict() == 1
+        assert cache.lookup(new) is None
+        assert cache.lookup(old) == ["R", "B"]
+
+    def test_expired_entries_miss_and_are_evicted(self, cache, outputs, monkeypatch):
+        # GIVEN a cache with a one hour TTL holding an entry stored two hours ago
+        cache.ttl = 3600
+        key = cache.make_key(b"img")
+        cache.store(key, outputs)
+        now = time.time()
+        monkeypatch.setattr("handling.util.result_cache.time.time", lambda: now + 7200)
+
+        # WHEN looking it up, and evicting
+        # THEN it should be a miss and removed, even though the cache is under its size cap
+        assert cache.lookup(key) is None
+        assert not os.path.exists(cache._entry_dir(key))
+
+        cache.store(key, outputs)
+        monkeypatch.setattr("handling.util.result_cache.time.time", lambda: now + 14400)
+        assert cache.evict() == 1
+
+    def test_clear_command_removes_everything(self, cache, outputs, monkeypatch):
+        # GIVEN a stored entry in the configured cache directory
+        monkeypatch.setattr("handling.util.result_cache.RESULT_CACHE_DIR", cache.root)
+        key = cache.make_key(b"img")
+        cache.store(key, outputs)
+
+        # WHEN running the clear command
+        main(["clear"])
+
+        # THEN the entry should be gone
+        assert cache.lookup(key) is None
@@ -0,0 +1,72 @@
+"""Tests for writing base64 API results to disk.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import base64
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from handling.util.result_writer import InvalidResultError, decode_base64_png, write_base64_png
+
+
+def _png_base64(size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 10, 60)).save(buffer, "PNG")
+    return buffer.getvalue(), base64.b64encode(buffer.getvalue()).decode()
+
+
+class TestWriteBase64Png:
+    @pytest.mark.parametrize("chunk_size", [4, 30, 1 << 16])
+    def test_decoded_file_matches_the_payload(self, tmp_path, chunk_size):
+        # GIVEN a base64 PNG payload
+        png, payload = _png_base64()
+
+        # WHEN writing it in chunks of any size, rounded to whole base64 quanta
+        write_base64_png(payload, str(tmp_path / "avatar.png"), chunk_size)
+
+        # THEN the file should hold exactly the PNG, with no temporary file left behind
+        assert (tmp_path / "avatar.png").read_bytes() == png
+        assert [entry.name for entry in os.scandir(tmp_path)] == ["avatar.png"]
+
+    def test_non_png_payload_is_rejected_and_existing_file_kept(self, tmp_path):
+        # GIVEN an earlier avatar, and a payload holding a JPEG
+        (tmp_path / "avatar.png").write_bytes(b"earlier")
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8)).save(buffer, "JPEG")
+
+        # WHEN writing it over the earlier avatar
+        with pytest.raises(InvalidResultError, match="isn't a PNG"):
+            write_base64_png(base64.b64encode(buffer.getvalue()), str(tmp_path / "avatar.png"))
+
+        # THEN the earlier avatar should be untouched, and the temporary file removed
+        assert (tmp_path / "avatar.png").read_bytes() == b"earlier"
+        assert [entry.name for entry in os.scandir(tmp_path)] == ["avatar.png"]
+
+    def test_corrupt_base64_is_an_os_error(self, tmp_path):
+        # GIVEN a payload cut off mid-quantum
+        _, payload = _png_base64()
+
+        # WHEN writing it
+        # THEN it should fail like other save errors do, leaving nothing behind
+        with pytest.raises(OSError, match="valid base64"):
+            write_base64_png(payload[:-1], str(tmp_path / "avatar.png"), chunk_size=16)
+        assert not list(os.scandir(tmp_path))
+
+
+class TestDecodeBase64Png:
+    def test_decodes_the_payload_and_rejects_anything_else(self):
+        # GIVEN a base64 PNG payload
+        png, payload = _png_base64()
+
+        # WHEN decoding it in memory, and decoding a payload that isn't a PNG
+        # THEN the PNG should come back whole, and the other fail like a write would
+        assert decode_base64_png(payload, "avatar.png") == png
+        with pytest.raises(InvalidResultError, match="isn't a PNG"):
+            decode_base64_png(base64.b64encode(b"not a png at all, just some text"), "avatar.png")
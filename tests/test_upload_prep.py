@@ -0,0 +1,86 @@
+"""Tests for pre-upload downscaling of avatar inputs.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import io
+import os
+
+from PIL import Image
+
+from handling.util.upload_prep import prepare_upload
+
+
+def _encoded(image, image_format, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+def _noise(size, mode="RGB"):
+    # Random pixels don't compress, so they make files that are big for their resolution
+    return Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+
+
+class TestPrepareUpload:
+    def test_small_input_is_sent_untouched(self):
+        # GIVEN a PNG already within the working size and budget
+        data = _encoded(Image.new("RGB", (512, 512), (10, 200, 10)), "PNG")
+
+        # WHEN preparing it
+        # THEN the original bytes should be uploaded, with no lossy round trip
+        assert prepare_upload("stamp.png", data) == ("stamp.png", data, "image/png")
+
+    def test_large_opaque_input_becomes_a_1024_jpeg(self):
+        # GIVEN a 3000x2000 opaque PNG render
+        data = _encoded(Image.new("RGB", (3000, 2000), (10, 200, 10)), "PNG")
+
+        # WHEN preparing it
+        name, upload, mime = prepare_upload("render.png", data, max_side=1024)
+
+        # THEN it should be scaled to fit 1024, keeping its aspect ratio, and re-encoded as JPEG
+        with Image.open(io.BytesIO(upload)) as image:
+            assert (image.format, image.size) == ("JPEG", (1024, 683))
+        assert (name, mime) == ("render.jpg", "image/jpeg")
+
+    def test_transparency_is_kept(self):
+        # GIVEN a large render on a transparent background
+        image = Image.new("RGBA", (2048, 2048), (0, 0, 0, 0))
+        image.paste((200, 10, 10, 255), (512, 512, 1536, 1536))
+        data = _encoded(image, "PNG")
+
+        # WHEN preparing it
+        name, upload, mime = prepare_upload("logo.png", data, max_side=1024)
+
+        # THEN it should be downscaled in a format that keeps the alpha channel
+        with Image.open(io.BytesIO(upload)) as prepared:
+            assert prepared.size == (1024, 1024)
+            assert prepared.convert("RGBA").getpixel((0, 0))[3] == 0
+        assert mime in ("image/webp", "image/png")
+
+    def test_quality_is_lowered_to_meet_the_budget(self):
+        # GIVEN a noisy input that is large even at the working size
+        data = _encoded(_noise((1024, 1024)), "PNG")
+        at_full_quality = len(_encoded(_noise((1024, 1024)), "JPEG", quality=90))
+
+        # WHEN preparing it with a budget below what quality 90 produces
+        _, upload, _ = prepare_upload("noise.png", data, max_bytes=at_full_quality * 3 // 4, quality=90)
+
+        # THEN the re-encoded upload should fit the budget
+        assert len(upload) <= at_full_quality * 3 // 4
+
+    def test_exif_rotation_is_applied(self):
+        # GIVEN a landscape JPEG tagged to be displayed rotated by 90 degrees
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 CW
+        data = _encoded(Image.new("RGB", (2000, 1000)), "JPEG", exif=exif.tobytes())
+
+        # WHEN preparing it
+        _, upload, _ = prepare_upload("photo.jpg", data, max_side=1024)
+
+        # THEN the upload should be upright, since re-encoding drops the tag
+        with Image.open(io.BytesIO(upload)) as image:
+            assert image.size == (512, 1024)
@@ -0,0 +1,146 @@
+"""Tests for WatchDaemon.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import os
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from PIL import Image
+
+from handling.watch_daemon import WatchDaemon
+
+
+def _circle_handler(route, folder):
+    from handling.imagehandler.circle_handler import CircleHandler
+
+    # Routed folders sit under img/, so outputs go next to it
+    handler = CircleHandler(folder, os.path.join(os.path.dirname(os.path.dirname(folder)), "out"))
+    handler.executor_backend = "serial"
+    return handler
+
+
+def _tick_until(daemon, condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        daemon.tick()
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    daemon = WatchDaemon(str(tmp_path / "img"), _circle_handler, routes={"circles": "circles"}, polling=True)
+    daemon.settle_seconds = 0
+    daemon.poll_interval = 0
+    os.makedirs(daemon.root)
+    yield daemon
+    daemon.close()
+
+
+class TestRoute:
+    def test_subfolders_then_filename_rules_then_default(self):
+        # GIVEN a daemon with a subfolder route, a filename rule and a default route
+        daemon = WatchDaemon(
+            "img",
+            MagicMock(),
+            routes={"circles": "circles"},
+            filename_rules=[(r"^rect_", "rectangles")],
+            default_route="circles",
+        )
+
+        # WHEN routing files in each place
+        # THEN the subfolder should win, then the rule, then the default; unknown subfolders are ignored
+        assert daemon.route(os.path.join("circles", "rect_a.jpg")) == "circles"
+        assert daemon.route("rect_a.jpg") == "rectangles"
+        assert daemon.route("a.jpg") == "circles"
+        assert daemon.route(os.path.join("other", "a.jpg")) is None
+
+
+class TestSettling:
+    def test_file_is_only_ready_once_it_stops_changing(self, daemon):
+        # GIVEN a file that is still being copied in
+        daemon.settle_seconds = 1.0
+        path = os.path.join(daemon.root, "circles")
+        os.makedirs(path)
+        with open(os.path.join(path, "a.jpg"), "wb") as f:
+            f.write(b"part")
+        daemon._observe([os.path.join("circles", "a.jpg")])
+
+        # WHEN it grows between checks, then holds still for the settle time
+        first = daemon._settled(now=0.0)
+        with open(os.path.join(path, "a.jpg"), "ab") as f:
+            f.write(b"more")
+        grown = daemon._settled(now=0.5)
+        too_soon = daemon._settled(now=1.0)
+        settled = daemon._settled(now=1.6)
+
+        # THEN it should only be reported once it has been unchanged for the whole settle time
+        assert first == grown == too_soon == []
+        assert [path for path, _ in settled] == [os.path.join("circles", "a.jpg")]
+
+
+class TestProcessing:
+    def test_dropped_stamp_is_processed_and_archived(self, daemon):
+        # GIVEN a running daemon
+        daemon.start()
+
+        # WHEN a stamp is dropped into the circles subfolder
+        Image.new("RGB", (60, 40), (20, 20, 20)).save(os.path.join(daemon.root, "circles", "stamp&R.jpg"))
+        _tick_until(daemon, lambda: daemon.processed == 1)
+
+        # THEN it should be processed by the circle handler and archived
+        out = os.path.join(os.path.dirname(daemon.root), "out")
+        assert [entry.name for entry in os.scandir(out)] == ["resized_stamp&R.png"]
+        assert os.path.exists(os.path.join(daemon.root, "circles", "zArchive", "stamp&R.png"))
+
+    def test_failed_file_is_not_resubmitted(self, daemon):
+        # GIVEN a running daemon and a file that can't be decoded
+        daemon.start()
+        with open(os.path.join(daemon.root, "circles", "broken.jpg"), "wb") as f:
+            f.write(b"not an image")
+
+        # WHEN the daemon keeps watching after it fails
+        _tick_until(daemon, lambda: daemon.failed == 1)
+        for _ in range(3):
+            daemon.tick()
+
+        # THEN it should be left in place and tried only once
+        assert (daemon.processed, daemon.failed) == (0, 1)
+        assert os.path.exists(os.path.join(daemon.root, "circles", "broken.png"))
+
+
+class TestHousekeeping:
+    def test_result_cache_is_trimmed_during_the_session(self, daemon):
+        # GIVEN a running daemon whose cache is due for trimming
+        daemon.start()
+        handler = daemon._pool("circles", "circles")[0]
+        handler.result_cache = MagicMock(root="cache")
+        daemon.evict_interval = 0
+
+        # WHEN it ticks with nothing to process
+        daemon.tick()
+
+        # THEN the cache should be trimmed back to its cap without waiting for a batch to end
+        handler.result_cache.evict.assert_called_once_with()
+
+    def test_session_records_files_in_one_ledger_run(self, daemon, tmp_path):
+        # GIVEN a running daemon keeping a job ledger
+        from handling.util.job_ledger import JobLedger
+
+        daemon.start()
+        handler = daemon._pool("circles", "circles")[0]
+        handler.ledger = JobLedger(str(tmp_path / "ledger.sqlite3"))
+
+        # WHEN stamps settle on separate ticks
+        for count, name in enumerate(["a&R.jpg", "b&R.jpg"], start=1):
+            Image.new("RGB", (60, 40), (20, 20, 20)).save(os.path.join(daemon.root, "circles", name))
+            _tick_until(daemon, lambda: daemon.processed == count)
+
+        # THEN both should be recorded in the same run
+        runs = handler.ledger._connection().execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+        assert runs == 1
+        assert [name for _, _, name, _ in handler.ledger.changed_since(0)] == ["a&R.png", "b&R.png"]
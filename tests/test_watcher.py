@@ -0,0 +1,62 @@
+"""Tests for the folder watchers.
+
+Uses GIVEN/WHEN/THEN structure (Behaviour-Driven Development):
+- GIVEN: the preconditions / setup state
+- WHEN: the action under test is performed
+- THEN: the expected outcome is asserted
+"""
+
+import os
+import sys
+
+import pytest
+
+from handling.util.watcher import (InotifyWatcher, PollingWatcher,
+                                   create_watcher)
+
+
+@pytest.fixture
+def watched(tmp_path):
+    (tmp_path / "circles").mkdir()
+    return tmp_path
+
+
+class TestPollingWatcher:
+    def test_scan_lists_files_in_root_and_subfolders(self, watched):
+        # GIVEN files in the root and a watched subfolder, plus a directory
+        (watched / "a.jpg").write_bytes(b"a")
+        (watched / "circles" / "b.jpg").write_bytes(b"b")
+        (watched / "zArchive").mkdir()
+
+        # WHEN scanning
+        found = PollingWatcher(str(watched), ["circles"]).scan()
+
+        # THEN only the files should be reported, relative to the root
+        assert sorted(found) == ["a.jpg", os.path.join("circles", "b.jpg")]
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+class TestInotifyWatcher:
+    def test_reports_written_and_moved_in_files(self, watched, tmp_path_factory):
+        # GIVEN an inotify watcher on the root and a subfolder
+        watcher = create_watcher(str(watched), ["circles"])
+        assert isinstance(watcher, InotifyWatcher)
+        outside = tmp_path_factory.mktemp("outside") / "moved.png"
+        outside.write_bytes(b"m")
+
+        # WHEN one file is written into the subfolder and another is moved into the root
+        (watched / "circles" / "written.jpg").write_bytes(b"w")
+        os.replace(outside, watched / "moved.png")
+        found = []
+        for _ in range(5):
+            found += watcher.changes(0.2)
+        watcher.close()
+
+        # THEN both should be reported
+        assert sorted(set(found)) == [os.path.join("circles", "written.jpg"), "moved.png"]
+
+    def test_polling_can_be_forced(self, watched):
+        # GIVEN a request to poll, e.g. for a network share
+        # WHEN creating the watcher
+        # THEN it should poll even though inotify is available
+        assert type(create_watcher(str(watched), polling=True)) is PollingWatcher